@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Load generator for api_server.py. Each client thread sends conversion
+requests over its own (keep-alive) connection; throughput and latency
+percentiles are reported at the end.
+
+    python api_loadgen.py --concurrency 8 --requests 200
+    python api_loadgen.py --file fa.pdf --no-keepalive
+    python api_loadgen.py --pages 20 --output loadgen.json
+    python api_loadgen.py --use-cache     # cache hits instead of full conversions
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urlsplit
+
+import synthetic_invoices
+
+def multipart_body(file_bytes, file_name, fields):
+    """Encode a multipart/form-data body; returns (content_type, body)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n'.encode() + file_bytes + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return f'multipart/form-data; boundary={boundary}', b''.join(parts)
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))], 4)
+
+def client(url, content_type, body, count, keepalive, results, lock):
+    """Send count requests, reusing one connection unless keepalive is off"""
+    conn = None
+    connections = 0
+    for _ in range(count):
+        if conn is None:
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=300)
+            connections += 1
+        headers = {'Content-Type': content_type}
+        if not keepalive:
+            headers['Connection'] = 'close'
+        start = time.perf_counter()
+        try:
+            conn.request('POST', '/convert', body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+            if not keepalive or response.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException) as e:
+            status = type(e).__name__
+            conn.close()
+            conn = None
+        elapsed = time.perf_counter() - start
+        with lock:
+            results.append((status, elapsed))
+    if conn is not None:
+        conn.close()
+    with lock:
+        results.append(('connections', connections))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8502')
+    parser.add_argument('--file', help="invoice to send (default: a synthetic text PDF)")
+    parser.add_argument('--pages', type=int, default=5, help="pages of the synthetic invoice")
+    parser.add_argument('--concurrency', type=int, default=4, help="parallel client connections")
+    parser.add_argument('--requests', type=int, default=40, help="total requests")
+    parser.add_argument('--no-keepalive', action='store_true', help="open a new connection per request")
+    parser.add_argument('--mapping', help="mapping JSON to send (default: the server's default mapping)")
+    parser.add_argument('--use-cache', action='store_true',
+                        help="let the server answer repeated uploads from its caches (default: cache=bypass, "
+                             "so every request is a full conversion)")
+    parser.add_argument('--output', help="write the summary as JSON")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'rb') as f:
+            file_bytes = f.read()
+        file_name = os.path.basename(args.file)
+    else:
+        file_bytes, _ = synthetic_invoices.make_text_pdf(args.pages)
+        file_name = f"synthetic-{args.pages}p.pdf"
+    fields = {'mapping': args.mapping} if args.mapping else {}
+    if not args.use_cache:
+        # The same file is sent every time: without this, every request
+        # after the first would be an output cache hit
+        fields['cache'] = 'bypass'
+    content_type, body = multipart_body(file_bytes, file_name, fields)
+
+    url = urlsplit(args.url)
+    results = []
+    lock = threading.Lock()
+    per_client = [args.requests // args.concurrency + (i < args.requests % args.concurrency)
+                  for i in range(args.concurrency)]
+    threads = [threading.Thread(target=client, args=(url, content_type, body, n, not args.no_keepalive,
+                                                     results, lock))
+               for n in per_client if n]
+
+    print(f"Sending {args.requests} x {file_name} ({len(file_bytes) / 1024:.0f} KB) "
+          f"with {len(threads)} client(s), keep-alive {'off' if args.no_keepalive else 'on'}, "
+          f"server caches {'used' if args.use_cache else 'bypassed'}...")
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    connections = sum(n for status, n in results if status == 'connections')
+    requests = [(status, latency) for status, latency in results if status != 'connections']
+    ok = [latency for status, latency in requests if status == 200]
+    summary = {
+        'requests': len(requests),
+        'ok': len(ok),
+        'statuses': dict(Counter(str(status) for status, _ in requests)),
+        'connections': connections,
+        'cache': 'use' if args.use_cache else 'bypass',
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(ok) / elapsed, 2) if elapsed else None,
+        'latency_s': {
+            'mean': round(statistics.mean(ok), 4) if ok else None,
+            'p50': percentile(ok, 50),
+            'p90': percentile(ok, 90),
+            'p99': percentile(ok, 99),
+            'max': round(max(ok), 4) if ok else None,
+        },
+    }
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
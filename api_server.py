@@ -0,0 +1,600 @@
+#!/usr/bin/env python3
+"""
+Headless HTTP API running the same extract-and-fill pipeline as app.py,
+for systems that push invoices programmatically (e.g. the ERP).
+
+    GET  /health     liveness, pool status, template load errors (503 if any)
+                     and warnings (e.g. no HS nomenclature)
+    GET  /template   template columns: [{"index": 3, "name": "Description ..."}, ...]
+    POST /headers    upload -> detected input headers and the default mapping
+    POST /convert    upload -> filled workbook (.xlsx)
+
+Uploads are multipart/form-data with a "file" part and optional "mapping"
+(JSON: {"<template column index or name>": ["<input header>", ...]}),
+"string_mode", "compression", "format", "bundle" and "cache" fields
+(format=parquet or csv returns the mapped, cleaned rows instead of the
+workbook; bundle=separate returns a zip with one workbook per invoice of a
+PDF bundle; cache=bypass extracts and fills again an upload seen before,
+as benchmarks need); the raw file can
+also be sent as the body with ?filename=invoice.pdf and the same options as
+query parameters.
+Without a mapping the app's default column choices are used. The input
+header "Code SH (nomenclature)" maps the HS code looked up for each line
+(see hs_utils); without a usable nomenclature it is left empty and the
+reason is returned in info['warnings'] and the X-Warnings header (JSON).
+
+    python api_server.py --port 8502 --workers 4
+    python api_loadgen.py --url http://127.0.0.1:8502 --concurrency 8
+
+Conversions run in a pool of worker processes (pdfplumber is CPU-bound and
+holds the GIL), each with the template's headers, styles and sheet layout
+preloaded. Inside a worker, pages are read and rows rendered in-process
+(workers=1, large_fill=False): pools of their own in every worker would
+multiply the processes past --workers. Requests beyond the concurrency
+limit wait briefly for a slot and are then refused with 503.
+"""
+import argparse
+import email.parser
+import email.policy
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, quote, urlsplit
+
+import app
+import arrow_utils
+import excel_utils
+import extraction_store
+import hs_utils
+import memory_budget
+import ocr_utils
+import perf_utils
+import template_registry
+
+TEMPLATE_PATH = os.environ.get(
+    'API_TEMPLATE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'IDI VIDE.xlsx')
+)
+HOST = os.environ.get('API_HOST', '127.0.0.1')
+PORT = int(os.environ.get('API_PORT', '8502'))
+WORKERS = int(os.environ.get('API_WORKERS', str(os.cpu_count() or 1)))
+# Requests admitted at once (running or waiting for a worker)
+MAX_CONCURRENT = int(os.environ.get('API_MAX_CONCURRENT', str(2 * WORKERS)))
+# Seconds a request may wait for an admission slot before a 503
+QUEUE_TIMEOUT = float(os.environ.get('API_QUEUE_TIMEOUT', '10'))
+MAX_UPLOAD_MB = float(os.environ.get('API_MAX_UPLOAD_MB', '50'))
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+class ApiError(Exception):
+    """Error reported to the client with an HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(status, message)
+        self.status = status
+        self.message = message
+
+# --- Worker side -------------------------------------------------------------
+
+def warm_template(template_path):
+    """Preload everything populate_excel needs from the template"""
+    template_registry.get(template_path)
+
+def _file_type(file_name):
+    file_type = (file_name or '').rsplit('.', 1)[-1].lower()
+    if file_type not in ('pdf', 'xlsx'):
+        raise ApiError(415, "Upload a .pdf or .xlsx file (send its name as the filename)")
+    return file_type
+
+def _read_input_headers(file_type, file_bytes):
+    """Searchable source document, its headers and whether OCR was needed"""
+    source = BytesIO(file_bytes)
+    used_ocr = False
+    if file_type == 'pdf':
+        used_ocr = ocr_utils.needs_ocr(source)
+        if used_ocr:
+            with perf_utils.span('ocr'):
+                source = ocr_utils.convert_to_searchable_pdf(source)
+        with perf_utils.span('get_pdf_headers'):
+            headers = app.get_pdf_headers(source)
+    else:
+        with perf_utils.span('get_input_excel_headers'):
+            headers = app.get_input_excel_headers(source)
+    if not headers:
+        raise ApiError(422, f"Could not detect headers in the {file_type.upper()}")
+    return source, headers, used_ocr
+
+def _lookup_stored(digest):
+    """Stored extraction of an upload (see extraction_store.lookup), timed"""
+    with perf_utils.span('extraction_store') as span:
+        stored = extraction_store.lookup(digest)
+        span['hit'] = stored is not None
+    return stored
+
+def resolve_mapping(raw_mapping, input_headers, excel_headers):
+    """
+    Turn a client mapping into {excel_col_idx: [input headers]}.
+    Keys may be template column indices or names; a name matches a column
+    whose header contains it (case-insensitive) if exactly one does.
+    Values are a header or a list of headers (input headers, or
+    app.HS_CODE_HEADER). None means the default mapping.
+    """
+    if raw_mapping is None:
+        return app.default_mapping(input_headers, excel_headers)
+    if not isinstance(raw_mapping, dict):
+        raise ApiError(400, "mapping must be a JSON object")
+
+    indices = {idx for idx, _ in excel_headers}
+    mapping = {}
+    for key, value in raw_mapping.items():
+        key = str(key).strip()
+        if key.isdigit():
+            col_idx = int(key)
+        else:
+            matches = [idx for idx, name in excel_headers if key.lower() in name.lower()]
+            if len(matches) > 1:
+                raise ApiError(400, f"Template column name '{key}' is ambiguous")
+            col_idx = matches[0] if matches else None
+        if col_idx not in indices:
+            raise ApiError(400, f"Unknown template column: {key}")
+        values = [value] if isinstance(value, str) else list(value or [])
+        unknown = [v for v in values if v not in input_headers and v != app.HS_CODE_HEADER]
+        if unknown:
+            raise ApiError(400, f"Unknown input header(s) {unknown}; available: {input_headers}")
+        mapping[col_idx] = values
+    return mapping
+
+def inspect_upload(file_bytes, file_name, template_path):
+    """Detected input headers and the default mapping for an upload"""
+    file_type = _file_type(file_name)
+    with perf_utils.job('api.headers', file_name=file_name, file_size=len(file_bytes)):
+        stored = extraction_store.lookup(hashlib.sha256(file_bytes).hexdigest())
+        if stored is not None:
+            input_headers = stored['headers']
+        else:
+            _, input_headers, _ = _read_input_headers(file_type, file_bytes)
+        excel_headers = app.get_excel_headers(template_path)
+        mapping = app.default_mapping(input_headers, excel_headers)
+    return {
+        'headers': input_headers,
+        'default_mapping': {str(idx): cols for idx, cols in mapping.items() if cols},
+    }
+
+def convert(file_bytes, file_name, raw_mapping, template_path, string_mode='inline',
+            compression='balanced', memory_limit=None, bundle='combined', use_cache=True):
+    """
+    Run the whole pipeline on one upload; returns (workbook bytes, info dict).
+    With bundle='separate', a PDF holding several invoices gives a zip of
+    one workbook per invoice (info['archive'] is then true).
+    use_cache=False extracts and fills again even if the upload was seen
+    before (for benchmarks); the result is still stored.
+    """
+    file_type = _file_type(file_name)
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    # Counted before any cache so resubmitted invoices are always flagged
+    previous = extraction_store.mark_seen(digest, file_name, file_type)
+    duplicate = previous['seen_count'] if previous else 0
+    with perf_utils.job('api.convert', file_name=file_name, file_type=file_type,
+                        file_size=len(file_bytes)) as perf_job:
+        excel_headers = app.get_excel_headers(template_path)
+        stored = mapping = None
+        if use_cache and raw_mapping is None:
+            # The default mapping changes with the learned mappings (see
+            # mapping_utils): outputs are keyed on it once resolved from the
+            # stored headers, on the mapping as sent otherwise
+            stored = _lookup_stored(digest)
+            if stored is not None:
+                mapping = resolve_mapping(None, stored['headers'], excel_headers)
+        mapping_key = raw_mapping if raw_mapping is not None else mapping
+        if use_cache and mapping_key is not None:
+            cache_key = app.output_cache_key(digest, mapping_key, template_path, string_mode, compression, bundle)
+            with perf_utils.span('output_cache') as span:
+                cached = app.get_cached_output(cache_key)
+                span['hit'] = cached is not None
+            if cached is not None:
+                workbook, meta = cached
+                return workbook, dict(meta, job_id=perf_job.job_id, cached=True, duplicate=duplicate)
+
+        budget = memory_budget.start(memory_limit, len(file_bytes))
+        try:
+            if use_cache and raw_mapping is not None:
+                stored = _lookup_stored(digest)
+            if stored is not None:
+                input_headers = stored['headers']
+            else:
+                source, input_headers, used_ocr = _read_input_headers(file_type, file_bytes)
+            if mapping is None:
+                mapping = resolve_mapping(raw_mapping, input_headers, excel_headers)
+            cache_key = app.output_cache_key(digest, raw_mapping if raw_mapping is not None else mapping,
+                                             template_path, string_mode, compression, bundle)
+            selected = sorted({h for cols in mapping.values() for h in cols})
+            if not selected:
+                raise ApiError(400, "The mapping selects no input columns")
+            warnings = [w for w in [app.hs_lookup_warning(mapping)] if w]
+
+            separate = bundle == 'separate' and file_type == 'pdf'
+            all_rows = stored['rows'] if stored is not None else None
+            if all_rows is None and separate:
+                # Invoice boundaries are needed before the first workbook
+                with perf_utils.span('extract_pdf_data'):
+                    all_rows = app.extract_pdf_data(source, input_headers, workers=1)
+                extraction_store.save(digest, file_name, file_type, input_headers, all_rows, used_ocr)
+
+            invoices, archive = 1, False
+            if all_rows is not None:
+                # Extracted before: no pdfplumber or Tesseract
+                memory_budget.charge('rows', all_rows.nbytes / memory_budget.MB)
+                data = all_rows if file_type == 'pdf' else app.select_rows(all_rows, selected)
+                rows = [data.num_rows]
+                parts = app.split_invoices(data) if file_type == 'pdf' else [data]
+                invoices = len(parts)
+                archive = separate and invoices > 1
+                with perf_utils.span('populate_excel', rows=data.num_rows, invoices=invoices,
+                                     cached_rows=stored is not None):
+                    if archive:
+                        output = app.populate_invoices(parts, template_path, mapping, excel_headers,
+                                                       string_mode, compression, large_fill=False)
+                    else:
+                        output = app.populate_excel(data, template_path, mapping, excel_headers,
+                                                    string_mode, compression, large_fill=False)
+            else:
+                if file_type == 'xlsx':
+                    source.seek(0)
+                # Every input column is extracted so the stored rows serve any mapping
+                boundaries = []
+                chunks = (app.iter_pdf_data(source, input_headers, boundaries=boundaries, workers=1) if file_type == 'pdf'
+                          else app.iter_input_excel_data(source, input_headers))
+                # Rows are written while later pages are still being extracted
+                rows = [0]
+                all_chunks = []
+
+                def count_rows():
+                    for chunk in chunks:
+                        all_chunks.append(chunk)
+                        if file_type == 'xlsx':
+                            chunk = app.select_rows(chunk, selected)
+                        rows[0] += chunk.num_rows
+                        yield chunk
+
+                with perf_utils.span('extract_and_populate') as span:
+                    output = app.populate_excel(count_rows(), template_path, mapping, excel_headers,
+                                                string_mode, compression, large_fill=False)
+                    span['rows'] = rows[0]
+                all_rows = arrow_utils.concat(all_chunks)
+                if file_type == 'pdf':
+                    all_rows = app.with_invoice_starts(all_rows, boundaries)
+                    invoices = len(app.split_invoices(all_rows))
+                extraction_store.save(digest, file_name, file_type, input_headers, all_rows, used_ocr)
+            if output is None:
+                raise ApiError(500, "sheetData not found in template")
+            if not rows[0]:
+                output.close()
+                raise ApiError(422, f"No data found in the {file_type.upper()} matching the selected columns")
+            workbook = output.read()
+            output.close()
+        except memory_budget.MemoryBudgetExceeded as e:
+            raise ApiError(413, str(e))
+        finally:
+            memory_budget.finish(budget)
+    meta = {'items': rows[0], 'invoices': invoices, 'archive': archive, 'warnings': warnings}
+    app.put_cached_output(cache_key, workbook, meta)
+    return workbook, dict(meta, job_id=perf_job.job_id, cached=False, duplicate=duplicate)
+
+def export(file_bytes, file_name, raw_mapping, template_path, fmt, memory_limit=None, use_cache=True):
+    """
+    Normalised extracted rows of one upload (see app.build_export_table) as
+    Parquet or CSV, for reporting jobs; returns (bytes, info dict)
+    """
+    file_type = _file_type(file_name)
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    previous = extraction_store.mark_seen(digest, file_name, file_type)
+    with perf_utils.job('api.export', file_name=file_name, file_type=file_type, file_size=len(file_bytes),
+                        format=fmt) as perf_job:
+        budget = memory_budget.start(memory_limit, len(file_bytes))
+        try:
+            stored = _lookup_stored(digest) if use_cache else None
+            if stored is not None:
+                input_headers, all_rows = stored['headers'], stored['rows']
+                memory_budget.charge('rows', all_rows.nbytes / memory_budget.MB)
+            else:
+                source, input_headers, used_ocr = _read_input_headers(file_type, file_bytes)
+                if file_type == 'xlsx':
+                    source.seek(0)
+                with perf_utils.span('extract'):
+                    all_rows = (app.extract_pdf_data(source, input_headers, workers=1) if file_type == 'pdf'
+                                else arrow_utils.concat(app.iter_input_excel_data(source, input_headers)))
+                extraction_store.save(digest, file_name, file_type, input_headers, all_rows, used_ocr)
+            excel_headers = app.get_excel_headers(template_path)
+            mapping = resolve_mapping(raw_mapping, input_headers, excel_headers)
+            selected = sorted({h for cols in mapping.values() for h in cols})
+            if not selected:
+                raise ApiError(400, "The mapping selects no input columns")
+            warnings = [w for w in [app.hs_lookup_warning(mapping)] if w]
+            data = all_rows if file_type == 'pdf' else app.select_rows(all_rows, selected)
+            if not data.num_rows:
+                raise ApiError(422, f"No data found in the {file_type.upper()} matching the selected columns")
+            with perf_utils.span('export_rows', rows=data.num_rows):
+                payload = arrow_utils.export_bytes(app.build_export_table(data, mapping, excel_headers), fmt)
+        except memory_budget.MemoryBudgetExceeded as e:
+            raise ApiError(413, str(e))
+        finally:
+            memory_budget.finish(budget)
+    return payload, {'items': data.num_rows, 'job_id': perf_job.job_id, 'cached': stored is not None,
+                     'duplicate': previous['seen_count'] if previous else 0, 'warnings': warnings}
+
+# --- Server side -------------------------------------------------------------
+
+class ConversionPool:
+    """Worker processes with the template preloaded; rebuilt if a worker dies"""
+
+    def __init__(self, workers, template_path):
+        self.workers = workers
+        self.template_path = template_path
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _get(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=warm_template, initargs=(self.template_path,)
+                )
+            return self._pool
+
+    def run(self, fn, *args):
+        pool = self._get()
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False)
+            raise ApiError(500, "A conversion worker crashed (out of memory?); please retry")
+
+    def warm_up(self):
+        """Start every worker now instead of on the first requests"""
+        pool = self._get()
+        for future in [pool.submit(warm_template, self.template_path) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+def parse_upload(content_type, body, query):
+    """Return (file_bytes, file_name, fields) from a multipart or raw upload"""
+    fields = {k: v[0] for k, v in query.items()}
+    if content_type.startswith('multipart/form-data'):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body
+        )
+        if not message.is_multipart():
+            raise ApiError(400, "Malformed multipart body")
+        file_bytes, file_name = None, None
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True) or b''
+            if name == 'file':
+                file_bytes, file_name = payload, part.get_filename()
+            elif name:
+                fields[name] = payload.decode('utf-8')
+        if file_bytes is None:
+            raise ApiError(400, "Missing 'file' part")
+        file_name = fields.get('filename', file_name)
+    else:
+        if not body:
+            raise ApiError(400, "Empty request body")
+        file_bytes, file_name = body, fields.get('filename')
+    # The file type is told by the name's extension
+    if not file_name:
+        raise ApiError(400, "Missing file name: send a filename with the 'file' part or ?filename=")
+    return file_bytes, file_name, fields
+
+def content_disposition(file_name):
+    """
+    Content-Disposition of a download: an ASCII filename (accents dropped,
+    quotes and control characters replaced) and the exact name as RFC 5987
+    filename*
+    """
+    ascii_name = unicodedata.normalize('NFKD', file_name).encode('ascii', 'ignore').decode('ascii')
+    ascii_name = re.sub(r'[^A-Za-z0-9._ ()-]', '_', ascii_name).strip() or 'download'
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(file_name, safe='')}"
+
+def parse_options(fields):
+    """Validated conversion options from form fields / query parameters"""
+    raw_mapping = None
+    if fields.get('mapping'):
+        try:
+            raw_mapping = json.loads(fields['mapping'])
+        except ValueError:
+            raise ApiError(400, "mapping is not valid JSON")
+    string_mode = fields.get('string_mode', 'inline')
+    if string_mode not in ('inline', 'shared'):
+        raise ApiError(400, "string_mode must be 'inline' or 'shared'")
+    compression = fields.get('compression', 'balanced')
+    if compression not in excel_utils.COMPRESSION_POLICIES:
+        raise ApiError(400, f"compression must be one of {list(excel_utils.COMPRESSION_POLICIES)}")
+    fmt = fields.get('format', 'xlsx')
+    if fmt != 'xlsx' and fmt not in arrow_utils.EXPORT_FORMATS:
+        raise ApiError(400, f"format must be one of {['xlsx', *arrow_utils.EXPORT_FORMATS]}")
+    bundle = fields.get('bundle', 'combined')
+    if bundle not in ('combined', 'separate'):
+        raise ApiError(400, "bundle must be 'combined' or 'separate'")
+    cache = fields.get('cache', 'use')
+    if cache not in ('use', 'bypass'):
+        raise ApiError(400, "cache must be 'use' or 'bypass'")
+    return raw_mapping, string_mode, compression, fmt, bundle, cache == 'use'
+
+class ApiHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests (every response has a Content-Length)
+    protocol_version = 'HTTP/1.1'
+    server_version = 'DataEntryEasierAPI/1.0'
+    # Idle keep-alive connections are closed after this many seconds
+    timeout = 60
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/health':
+            try:
+                # Reloads the template if its file changed, recording a failure
+                template_registry.get(self.server.pool.template_path)
+            except Exception:
+                pass
+            errors = dict(template_registry.load_errors)
+            warnings = [hs_utils.load_error] if hs_utils.get_index() is None else []
+            self.send_json(503 if errors else 200, {
+                'status': 'error' if errors else 'ok', 'template_errors': errors, 'warnings': warnings,
+                'workers': self.server.pool.workers, 'max_concurrent': self.server.max_concurrent,
+            })
+        elif path == '/template':
+            headers = app.get_excel_headers(self.server.pool.template_path)
+            self.send_json(200, [{'index': idx, 'name': name} for idx, name in headers])
+        else:
+            self.send_json(404, {'error': f"No route for GET {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path not in ('/convert', '/headers'):
+            self.discard_body()
+            self.send_json(404, {'error': f"No route for POST {url.path}"})
+            return
+
+        if not self.server.slots.acquire(timeout=QUEUE_TIMEOUT):
+            self.discard_body()
+            self.send_json(503, {'error': "Server busy, retry later"}, {'Retry-After': '5'})
+            return
+        try:
+            body = self.read_body()
+            file_bytes, file_name, fields = parse_upload(
+                self.headers.get('Content-Type', ''), body, parse_qs(url.query)
+            )
+            pool = self.server.pool
+            if url.path == '/headers':
+                self.send_json(200, pool.run(inspect_upload, file_bytes, file_name, pool.template_path))
+                return
+
+            raw_mapping, string_mode, compression, fmt, bundle, use_cache = parse_options(fields)
+            base_name = os.path.splitext(os.path.basename(file_name))[0]
+            if fmt == 'xlsx':
+                payload, info = pool.run(convert, file_bytes, file_name, raw_mapping, pool.template_path,
+                                         string_mode, compression, self.server.memory_limit, bundle, use_cache)
+                if info.get('archive'):
+                    out_name, mime = base_name + "_IDI_FILLED.zip", 'application/zip'
+                else:
+                    out_name, mime = base_name + "_IDI_FILLED.xlsx", XLSX_MIME
+            else:
+                payload, info = pool.run(export, file_bytes, file_name, raw_mapping, pool.template_path,
+                                         fmt, self.server.memory_limit, use_cache)
+                mime, extension = arrow_utils.EXPORT_FORMATS[fmt]
+                out_name = base_name + "_IDI_ROWS" + extension
+            headers = {
+                'Content-Disposition': content_disposition(out_name),
+                'X-Items': str(info['items']),
+                'X-Invoices': str(info.get('invoices', 1)),
+                'X-Job-Id': info['job_id'],
+                'X-Cache': 'hit' if info['cached'] else 'miss',
+                'X-Duplicate': str(info['duplicate']),
+            }
+            if info.get('warnings'):
+                # JSON escapes non-ASCII and line breaks, which headers cannot hold
+                headers['X-Warnings'] = json.dumps(info['warnings'])
+            self.send_bytes(200, payload, mime, headers)
+        except ApiError as e:
+            self.send_json(e.status, {'error': e.message})
+        except Exception as e:
+            self.log_error("Conversion failed: %r", e)
+            self.send_json(500, {'error': f"An error occurred: {e}"})
+        finally:
+            self.server.slots.release()
+
+    def read_body(self):
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.close_connection = True
+            raise ApiError(411, "Content-Length required")
+        length = int(length)
+        if length > MAX_UPLOAD_MB * 1024 * 1024:
+            # The unread body would corrupt the next request on this connection
+            self.close_connection = True
+            raise ApiError(413, f"Upload larger than {MAX_UPLOAD_MB:g} MB")
+        return self.rfile.read(length)
+
+    def discard_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_UPLOAD_MB * 1024 * 1024:
+            self.close_connection = True
+        elif length:
+            self.rfile.read(length)
+
+    def send_bytes(self, status, payload, content_type, extra_headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_json(self, status, obj, extra_headers=None):
+        self.send_bytes(status, json.dumps(obj, ensure_ascii=False).encode('utf-8'),
+                        'application/json; charset=utf-8', extra_headers)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pool, max_concurrent, memory_limit=None, quiet=False):
+        super().__init__(address, ApiHandler)
+        self.pool = pool
+        self.max_concurrent = max_concurrent
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.memory_limit = memory_limit
+        self.quiet = quiet
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WORKERS, help="conversion worker processes")
+    parser.add_argument('--max-concurrent', type=int, default=MAX_CONCURRENT,
+                        help="requests admitted at once; others wait, then get 503")
+    parser.add_argument('--template', default=TEMPLATE_PATH)
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        help="per-request memory budget in MB (default JOB_MEMORY_BUDGET_MB)")
+    parser.add_argument('--quiet', action='store_true', help="do not log every request")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.template):
+        parser.error(f"Template file '{args.template}' not found")
+
+    pool = ConversionPool(args.workers, args.template)
+    print(f"Starting {args.workers} worker(s) with {args.template} preloaded...")
+    warm_template(args.template)
+    pool.warm_up()
+
+    server = ApiServer((args.host, args.port), pool, args.max_concurrent, args.memory_budget, args.quiet)
+    print(f"Listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,56 @@
 import streamlit as st
 import pdfplumber
-import openpyxl
+import pdf_utils
 import re
+import hashlib
+import json
 import zipfile
-import shutil
-import os
-import xml.etree.ElementTree as ET
 from io import BytesIO
 import tempfile
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 import ocr_utils
+import excel_utils
+import hs_utils
+import mapping_utils
+import cache_utils
+import perf_utils
+import memory_budget
+import job_queue
+import extraction_store
+import arrow_utils
+import template_registry
+import verify_utils
+
+# Output workbooks up to this size are assembled in memory; larger ones spill to disk
+OUTPUT_SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
+# Uploads whose extracted rows (and per-column cell values) are kept in memory
+EXTRACTION_CACHE_ENTRIES = 8
+
+# Rows sent to the browser per page of the preview table
+PREVIEW_PAGE_ROWS = 100
+
+# Worker processes extracting the documents of a merge concurrently; 1
+# extracts them one after another
+MERGE_WORKERS = int(os.environ.get('MERGE_WORKERS', str(os.cpu_count() or 1)))
+
+# Input column of merged fills holding each row's source document name
+SOURCE_HEADER = "Source invoice"
 
-# Namespaces
-NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
-ET.register_namespace('', NS['x'])
+# Input column holding the HS code found for each line's description in the
+# nomenclature (see hs_utils), offered for mapping when the file is present
+HS_CODE_HEADER = "Code SH (nomenclature)"
 
 def get_excel_headers(template_path):
-    """Extract headers from the Excel template (Row 5)"""
-    wb = openpyxl.load_workbook(template_path)
-    if len(wb.sheetnames) > 1:
-        ws = wb[wb.sheetnames[1]]
-    else:
-        ws = wb.active
-        
-    headers = []
-    header_row = 5
-    for col in range(1, ws.max_column + 1):
-        val = ws.cell(header_row, col).value
-        if val:
-            # Clean header: remove newlines, extra spaces
-            clean_val = str(val).replace('\n', ' ').strip()
-            headers.append((col, clean_val))
-    return headers
+    """Headers of the template's header row (Row 5 of the IDI form), from the template registry"""
+    return list(template_registry.get(template_path).headers)
 
 def get_pdf_headers(pdf_file):
     """Extract headers from the first table in the PDF"""
@@ -56,128 +75,193 @@ def get_input_excel_headers(excel_file):
         return []
 
 def extract_input_excel_data(excel_file, selected_headers):
-    """Extract data from Excel file"""
+    """Extract data from Excel file, as a pyarrow Table"""
     try:
-        df = pd.read_excel(excel_file)
-        
-        # Filter columns
-        # We need to map selected headers to actual columns
-        # But selected_headers ARE the actual columns (or close to it)
-        
-        data = []
-        for _, row in df.iterrows():
-            row_data = {}
-            for h in selected_headers:
-                if h in df.columns:
-                    val = row[h]
-                    if pd.notna(val):
-                        row_data[h] = val
-            
-            if row_data:
-                data.append(row_data)
-                
-        return data
+        return arrow_utils.concat(iter_input_excel_data(excel_file, selected_headers))
     except Exception as e:
         st.error(f"Error extracting data from Excel: {e}")
-        return []
+        return arrow_utils.concat([])
 
-def extract_pdf_data(pdf_file, selected_pdf_headers):
-    """Extract data from PDF file object"""
-    data = []
+def iter_input_excel_data(excel_file, selected_headers, chunk_rows=500, progress=None):
+    """
+    Yield the rows of an Excel file as pyarrow Tables of up to chunk_rows
+    rows, so they can be written while the rest is converted
+    progress: optional callback(rows_done, total_rows, message)
+    """
+    df = pd.read_excel(excel_file)
     
+    # Filter columns
+    # We need to map selected headers to actual columns
+    # But selected_headers ARE the actual columns (or close to it)
+    present = [h for h in selected_headers if h in df.columns]
+    
+    # Cells are read column by column from df.values, which holds them with
+    # the same types iterrows() gives (one common dtype for the whole frame)
+    values = df.values
+    columns = {}
+    keep = np.zeros(len(df), dtype=bool)
+    for h in present:
+        col = values[:, df.columns.get_loc(h)]
+        notna = pd.notna(col)
+        keep |= notna
+        columns[h] = [arrow_utils.cell_text(v) if ok else None for v, ok in zip(col, notna)]
+    
+    # Rows with none of the selected cells are dropped
+    table = arrow_utils.table_from_columns(columns).filter(keep) if columns else pa.table({})
+    memory_budget.charge('rows', table.nbytes / memory_budget.MB)
+    kept_rows = np.flatnonzero(keep)
+    for start in range(0, table.num_rows, chunk_rows):
+        chunk = table.slice(start, chunk_rows)
+        if progress:
+            progress(int(kept_rows[start + chunk.num_rows - 1]) + 1, len(df), "Reading rows")
+        yield chunk
+    if progress:
+        progress(len(df), len(df), "Reading rows")
+
+def extract_pdf_data(pdf_file, selected_pdf_headers, progress=None, workers=None):
+    """Extract data from PDF file object, as a pyarrow Table (invoice starts in its metadata)
+    progress: optional callback(pages_done, total_pages, message)
+    """
+    boundaries = []
+    data = arrow_utils.concat(iter_pdf_data(pdf_file, selected_pdf_headers, progress, boundaries, workers))
+    return with_invoice_starts(data, boundaries)
+
+def iter_pdf_data(pdf_file, selected_pdf_headers, progress=None, boundaries=None, workers=None):
+    """
+    Yield the rows of each page (a pyarrow Table) as soon as the page is
+    extracted, so the writer can start before the last page has been read
+    progress: optional callback(pages_done, total_pages, message)
+    boundaries: optional list, receives the row offset where each invoice
+    starts in a bundle of several invoices (see pdf_utils.InvoiceSplitter)
+    workers: page reader processes, see pdf_utils.iter_pages
+    """
     # We need to find a table that contains the selected headers
     # If no headers selected, we can't find the table easily.
     if not selected_pdf_headers:
-        return []
+        return
+    
+    rows_found = 0
+    rows_bytes = 0
 
     # Store the column mapping once found to use for subsequent pages
     global_col_indices = None
     
-    with pdfplumber.open(pdf_file) as pdf:
-        for i, page in enumerate(pdf.pages):
-            tables = page.extract_tables()
+    # Invoice boundaries of a bundle, decided page by page
+    splitter = pdf_utils.InvoiceSplitter()
+    
+    # Long documents are read by worker processes (see pdf_utils)
+    pages = pdf_utils.iter_pages(pdf_file, workers)
+    for i, (page_count, tables, text) in enumerate(pages):
+        memory_budget.checkpoint('PDF extraction')
+        data = []
+        page_headers = None
+        
+        for table in tables:
+            header_row_idx = -1
+            headers = []
             
-            for table in tables:
-                header_row_idx = -1
-                headers = []
+            # Try to find header row in this table
+            for idx, row in enumerate(table):
+                row_values = [str(cell).strip() for cell in row if cell]
+                matches = sum(1 for h in selected_pdf_headers if h in row_values)
+                if matches > 0:
+                    header_row_idx = idx
+                    headers = [str(cell).strip() if cell else f"Col_{c_i}" for c_i, cell in enumerate(row)]
+                    break
+            
+            # If headers found, update global mapping
+            if header_row_idx != -1:
+                if page_headers is None:
+                    page_headers = headers
+                # Map column names to indices
+                global_col_indices = {h: i for i, h in enumerate(headers)}
                 
-                # Try to find header row in this table
-                for idx, row in enumerate(table):
-                    row_values = [str(cell).strip() for cell in row if cell]
-                    matches = sum(1 for h in selected_pdf_headers if h in row_values)
-                    if matches > 0:
-                        header_row_idx = idx
-                        headers = [str(cell).strip() if cell else f"Col_{c_i}" for c_i, cell in enumerate(row)]
+                # Identify number column for filtering
+                no_col_idx = -1
+                for h, idx in global_col_indices.items():
+                    if h.lower() in mapping_utils.LINE_NUMBER_HEADERS:
+                        no_col_idx = idx
                         break
                 
-                # If headers found, update global mapping
-                if header_row_idx != -1:
-                    # Map column names to indices
-                    global_col_indices = {h: i for i, h in enumerate(headers)}
+                # Process rows after header
+                for row in table[header_row_idx+1:]:
+                    if not row or all(cell is None or cell == "" for cell in row):
+                        continue
                     
-                    # Identify number column for filtering
-                    no_col_idx = -1
-                    for h, idx in global_col_indices.items():
-                        if h.lower() in ['no', 'no.', 'item', '#', 'n°', 'pos']:
-                            no_col_idx = idx
-                            break
-                    
-                    # Process rows after header
-                    for row in table[header_row_idx+1:]:
-                        if not row or all(cell is None or cell == "" for cell in row):
+                    # Filter by number column if it exists
+                    if no_col_idx != -1 and no_col_idx < len(row):
+                        val = row[no_col_idx]
+                        # Check if value is numeric (allow digits, maybe ending with dot)
+                        if not val:
+                            continue
+                        val_str = str(val).strip()
+                        if not val_str or not val_str.replace('.', '').isdigit():
                             continue
                         
-                        # Filter by number column if it exists
-                        if no_col_idx != -1 and no_col_idx < len(row):
-                            val = row[no_col_idx]
-                            # Check if value is numeric (allow digits, maybe ending with dot)
-                            if not val:
-                                continue
-                            val_str = str(val).strip()
-                            if not val_str or not val_str.replace('.', '').isdigit():
-                                continue
-                            
-                        row_data = {}
-                        for h, idx in global_col_indices.items():
-                            if idx < len(row):
-                                row_data[h] = row[idx]
-                        
-                        if any(row_data.values()):
-                            data.append(row_data)
-                            
-                # If no headers found, but we have a global mapping, assume continuation
-                elif global_col_indices is not None:
-                    # We assume the table structure is similar (continuation)
-                    
-                    # Re-identify number column from global mapping (indices are same)
-                    no_col_idx = -1
+                    row_data = {}
                     for h, idx in global_col_indices.items():
-                        if h.lower() in ['no', 'no.', 'item', '#', 'n°', 'pos']:
-                            no_col_idx = idx
-                            break
+                        if idx < len(row):
+                            row_data[h] = row[idx]
+                    
+                    if any(row_data.values()):
+                        data.append(row_data)
+                        
+            # If no headers found, but we have a global mapping, assume continuation
+            elif global_col_indices is not None:
+                # We assume the table structure is similar (continuation)
+                
+                # Re-identify number column from global mapping (indices are same)
+                no_col_idx = -1
+                for h, idx in global_col_indices.items():
+                    if h.lower() in mapping_utils.LINE_NUMBER_HEADERS:
+                        no_col_idx = idx
+                        break
 
-                    for row in table:
-                        if not row or all(cell is None or cell == "" for cell in row):
+                for row in table:
+                    if not row or all(cell is None or cell == "" for cell in row):
+                        continue
+                        
+                    # Filter by number column if it exists
+                    if no_col_idx != -1 and no_col_idx < len(row):
+                        val = row[no_col_idx]
+                        if not val:
+                            continue
+                        val_str = str(val).strip()
+                        if not val_str or not val_str.replace('.', '').isdigit():
                             continue
-                            
-                        # Filter by number column if it exists
-                        if no_col_idx != -1 and no_col_idx < len(row):
-                            val = row[no_col_idx]
-                            if not val:
-                                continue
-                            val_str = str(val).strip()
-                            if not val_str or not val_str.replace('.', '').isdigit():
-                                continue
-                            
-                        row_data = {}
-                        for h, idx in global_col_indices.items():
-                            if idx < len(row):
-                                row_data[h] = row[idx]
                         
-                        if any(row_data.values()):
-                            data.append(row_data)
-    
-    return data
+                    row_data = {}
+                    for h, idx in global_col_indices.items():
+                        if idx < len(row):
+                            row_data[h] = row[idx]
+                    
+                    if any(row_data.values()):
+                        data.append(row_data)
+        
+        if boundaries is not None and splitter.starts_invoice(page_headers, text):
+            boundaries.append(rows_found)
+        
+        rows_found += len(data)
+        if progress:
+            progress(i + 1, page_count, f"Extracting tables, {rows_found} rows found")
+        page_rows = arrow_utils.table_from_rows(data)
+        # Callers keep the pages' rows (for the preview and the extraction store)
+        rows_bytes += page_rows.nbytes
+        memory_budget.charge('rows', rows_bytes / memory_budget.MB)
+        yield page_rows
+
+def default_mapping(input_headers, excel_headers):
+    """
+    Default column choices: {excel_col_idx: [input headers]} for every
+    template column, from the trigram matches of mapping_utils.suggest
+    """
+    mapping = mapping_utils.suggest(input_headers, excel_headers)
+    if HS_CODE_HEADER in input_headers:
+        # The looked up codes go to the HS code column unless a code column was found
+        for col_idx, col_name in excel_headers:
+            if "code sh" in col_name.lower() and not mapping[col_idx]:
+                mapping[col_idx] = [HS_CODE_HEADER]
+    return mapping
 
 def clean_number(value):
     """Clean numeric values"""
@@ -195,388 +279,1122 @@ def clean_number(value):
     except ValueError:
         return 0
 
-def get_col_letter(col_idx):
-    """Convert 1-based column index to letter"""
-    string = ""
-    while col_idx > 0:
-        col_idx, remainder = divmod(col_idx - 1, 26)
-        string = chr(65 + remainder) + string
-    return string
-
-def update_cell(row, row_idx, col_idx, value, val_type):
-    """Update or create a cell in the row"""
-    col_letter = get_col_letter(col_idx)
-    cell_ref = f"{col_letter}{row_idx}"
-    
-    # Find existing cell
-    cell = None
-    for c in row.findall('x:c', NS):
-        if c.get('r') == cell_ref:
-            cell = c
-            break
-            
-    if cell is None:
-        cell = ET.Element(f"{{{NS['x']}}}c", {'r': cell_ref})
-        row.append(cell)
+def column_values(items, input_cols, is_description, is_code=False):
+    """
+    Typed values ('num' or 'str', value) of one template column, one per row of the items table
+    is_code: the column holds codes (HS codes...), always written as text to keep leading zeros
+    """
+    values = []
+    # Concatenate values
+    for final_val in arrow_utils.joined_values(items, input_cols):
+        if is_description:
+            final_val = final_val.upper()
+        if is_code:
+            values.append(('str', final_val))
+            continue
     
-    # Clear children
-    for child in list(cell):
-        cell.remove(child)
-        
-    # Set value
-    if val_type == 'str':
-        cell.set('t', 'inlineStr')
-        is_elem = ET.SubElement(cell, f"{{{NS['x']}}}is")
-        t_elem = ET.SubElement(is_elem, f"{{{NS['x']}}}t")
-        t_elem.text = str(value)
-    else:
-        # Numeric
-        if 't' in cell.attrib:
-            del cell.attrib['t']
-        v_elem = ET.SubElement(cell, f"{{{NS['x']}}}v")
-        v_elem.text = str(value)
-
-# Register namespaces to prevent ElementTree from mangling them (e.g. ns0:id instead of r:id)
-ET.register_namespace('', "http://schemas.openxmlformats.org/spreadsheetml/2006/main")
-ET.register_namespace('r', "http://schemas.openxmlformats.org/officeDocument/2006/relationships")
-ET.register_namespace('xdr', "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing")
-ET.register_namespace('mc', "http://schemas.openxmlformats.org/markup-compatibility/2006")
-ET.register_namespace('x14ac', "http://schemas.microsoft.com/office/spreadsheetml/2009/9/ac")
-
-def add_thin_border_styles(zip_ref, temp_zip_path, base_style_idx=221):
-    """
-    Reads styles.xml, creates two new styles based on base_style_idx:
-    1. Left-aligned, thin border (ID 5)
-    2. Center-aligned, thin border (ID 5)
-    Returns (left_idx, center_idx, success)
-    """
-    left_idx = base_style_idx
-    center_idx = base_style_idx
-    
-    with zipfile.ZipFile(zip_ref, 'r') as zin:
-        xml_content = zin.read('xl/styles.xml')
-    
-    root = ET.fromstring(xml_content)
-    cellXfs = root.find(f"{{{NS['x']}}}cellXfs")
-    
-    if cellXfs is not None:
-        xfs = list(cellXfs.findall(f"{{{NS['x']}}}xf"))
-        if 0 <= base_style_idx < len(xfs):
-            base_xf = xfs[base_style_idx]
-            
-            # 1. Create Left-aligned style
-            left_xf = ET.fromstring(ET.tostring(base_xf, encoding='unicode'))
-            align_l = left_xf.find(f"{{{NS['x']}}}alignment")
-            if align_l is None:
-                align_l = ET.SubElement(left_xf, f"{{{NS['x']}}}alignment")
-            align_l.set('horizontal', 'left')
-            left_xf.set('borderId', '5')
-            left_xf.set('applyBorder', '1')
-            
-            # 2. Create Center-aligned style
-            center_xf = ET.fromstring(ET.tostring(base_xf, encoding='unicode'))
-            align_c = center_xf.find(f"{{{NS['x']}}}alignment")
-            if align_c is None:
-                align_c = ET.SubElement(center_xf, f"{{{NS['x']}}}alignment")
-            align_c.set('horizontal', 'center')
-            center_xf.set('borderId', '5')
-            center_xf.set('applyBorder', '1')
-            
-            # Append both
-            cellXfs.append(left_xf)
-            cellXfs.append(center_xf)
-            
-            # Update count
-            count = int(cellXfs.get('count', 0))
-            cellXfs.set('count', str(count + 2))
-            
-            left_idx = count
-            center_idx = count + 1
-            
-            # Write back to temp zip
-            with zipfile.ZipFile(zip_ref, 'r') as zin:
-                with zipfile.ZipFile(temp_zip_path, 'w') as zout:
-                    for item in zin.infolist():
-                        if item.filename == 'xl/styles.xml':
-                            zout.writestr(item, ET.tostring(root, encoding='UTF-8', xml_declaration=True))
-                        else:
-                            zout.writestr(item, zin.read(item.filename))
-                            
-            return left_idx, center_idx, True
+        # Determine type
+        # Heuristic: if column name implies number, try to clean
+        # For now, let's try to convert to float. If it works, use number.
+        # Unless it's a code that looks like a number but should be string?
+        # Excel handles numbers best as numbers.
+        if final_val and re.match(r'^-?\d+(\.\d+)?$', final_val.replace(',', '.')):
+            values.append(('num', clean_number(final_val)))
+        else:
+            values.append(('str', final_val))
+    return values
+
+def prepare_cells(items, columns, shared_strings=None, column_cache=None):
+    """
+    Convert a table of extracted rows into cell rows for excel_utils: one
+    list of (col_idx, val_type, value, style) per row
+    columns: (excel_col_idx, input_cols, is_description, is_code, style) per mapped column
+    column_cache: dict memoising column_values for these items, so a
+    mapping change only recomputes the columns it touches
+    """
+    per_column = []
+    for excel_col_idx, input_cols, is_description, is_code, style in columns:
+        key = (tuple(input_cols), is_description, is_code)
+        values = column_cache.get(key) if column_cache is not None else None
+        if values is None:
+            values = column_values(items, input_cols, is_description, is_code)
+            if column_cache is not None:
+                column_cache[key] = values
+        per_column.append((excel_col_idx, style, values))
+    
+    # Assemble row by row so shared strings are numbered in reading order
+    cell_rows = []
+    for row_num in range(items.num_rows):
+        if row_num % 1000 == 0:
+            memory_budget.charge('cells', row_num * len(per_column) * memory_budget.CELL_BYTES / memory_budget.MB)
+            memory_budget.checkpoint('cell preparation')
+        cells = []
+        for excel_col_idx, style, values in per_column:
+            val_type, value = values[row_num]
+            if val_type == 'str' and shared_strings is not None:
+                value = shared_strings.add(value)
+                val_type = 's'
+            cells.append((excel_col_idx, val_type, value, style))
+        cell_rows.append(cells)
+    return cell_rows
+
+def enrich_rows(data, mapping, excel_headers):
+    """
+    Add HS_CODE_HEADER to extracted rows when a template column maps it: the
+    code found in the nomenclature index (hs_utils) for each line's
+    description, i.e. the input columns mapped to the description column.
+    data: pyarrow Table or iterator of Tables, returned alike.
+    Returns (data, lookup key): the key identifies the description columns
+    and nomenclature used, None if the rows were left unchanged (not mapped,
+    or no nomenclature file).
+    """
+    if not any(HS_CODE_HEADER in cols for cols in mapping.values()):
+        return data, None
+    index = hs_utils.get_index()
+    if index is None:
+        return data, None
+    col_names = dict(excel_headers)
+    description_cols = [c for col_idx, cols in mapping.items()
+                        if "description" in col_names.get(col_idx, "").lower()
+                        for c in cols if c != HS_CODE_HEADER]
+    
+    def enrich(table):
+        if HS_CODE_HEADER in table.column_names:
+            table = table.drop_columns([HS_CODE_HEADER])
+        descriptions = [d.upper() for d in arrow_utils.joined_values(table, description_cols)]
+        with perf_utils.span('enrich_hs_codes', rows=table.num_rows) as span:
+            codes = index.lookup_many(descriptions)
+            span['matched'] = sum(code is not None for code in codes)
+        return table.append_column(HS_CODE_HEADER, pa.array(codes, type=pa.string()))
+    
+    key = (tuple(description_cols), index.digest)
+    if isinstance(data, pa.Table):
+        return enrich(data), key
+    return (enrich(table) for table in data), key
 
-    return left_idx, center_idx, False
+def hs_lookup_warning(mapping):
+    """Why HS_CODE_HEADER, if mapped, will be left empty (see hs_utils.load_error), or None"""
+    if not any(HS_CODE_HEADER in cols for cols in mapping.values()) or hs_utils.get_index() is not None:
+        return None
+    return f"'{HS_CODE_HEADER}' is left empty: {hs_utils.load_error}"
 
-def populate_excel(data, template_path, mapping, excel_headers):
+def populate_excel(data, template_path, mapping, excel_headers, string_mode='inline', compression='balanced',
+                   large_fill=None, rows_key=None):
     """Populate Excel file using direct XML patching
+    data: pyarrow Table of extracted rows, or an iterator of Tables (e.g.
+    iter_pdf_data) consumed while the sheet is written
     mapping: dict {excel_col_idx: [pdf_col_names]}
     excel_headers: list of (col_idx, col_name) tuples
+    string_mode: 'inline' writes text as inlineStr cells, 'shared' interns
+    it into xl/sharedStrings.xml so repeated values are stored once
+    compression: output compression policy, see excel_utils.COMPRESSION_POLICIES
+    large_fill: render row ranges in worker processes (None = automatic for
+    fills of at least excel_utils.LARGE_FILL_MIN_ROWS rows)
+    rows_key: hashable identity of a data table (e.g. upload digest); per-column
+    cell values are then memoised, so re-exports with another mapping only
+    recompute the changed columns
     """
     
-    # Create a temp file for the output
-    output_path = tempfile.mktemp(suffix=".xlsx")
-    
-    # First, patch styles.xml to add our thin-bordered styles
-    # We use a temp zip for this intermediate step
-    temp_style_zip = tempfile.mktemp(suffix=".xlsx")
-    left_style_idx, center_style_idx, style_patched = add_thin_border_styles(template_path, temp_style_zip)
+    # Settings and parsed parts of the template, loaded once per version
+    template = template_registry.get(template_path)
     
-    # Use the patched zip as the source for the next step
-    source_zip = temp_style_zip if style_patched else template_path
+    # HS codes looked up for the descriptions, if mapped
+    data, lookup_key = enrich_rows(data, mapping, excel_headers)
+    if lookup_key is not None and rows_key is not None:
+        rows_key = (rows_key, lookup_key)
     
-    with zipfile.ZipFile(source_zip, 'r') as zin:
-        sheet_xml = zin.read('xl/worksheets/sheet2.xml')
+    # Thin-bordered styles, patched into styles.xml once per template version
+    styles_xml, left_style_idx, center_style_idx, style_patched = template.styles
     
-    root = ET.fromstring(sheet_xml)
-    sheetData = root.find('x:sheetData', NS)
+    shared_strings = None
+    if string_mode == 'shared' and template.shared_strings is not None:
+        shared_strings = excel_utils.SharedStringTable(template.shared_strings)
     
-    if sheetData is None:
+    layout = template.layout
+    if layout is None:
         st.error("Error: sheetData not found in template")
         return None
         
-    start_row = 6
-    rows = {int(r.get('r')): r for r in sheetData.findall('x:row', NS)}
+    start_row = template.start_row
+    
+    # Resolve per-column settings once instead of per cell
+    col_names = dict(excel_headers)
+    columns = []
+    for excel_col_idx, pdf_cols in mapping.items():
+        if not pdf_cols:
+            continue
+        # Description column is uppercased and left-aligned
+        is_description = "description" in col_names.get(excel_col_idx, "").lower()
+        is_code = "code sh" in col_names.get(excel_col_idx, "").lower()
+        style = None
+        if style_patched:
+            style = left_style_idx if is_description else center_style_idx
+        columns.append((excel_col_idx, pdf_cols, is_description, is_code, style))
+    
+    # Cells the rows should give, checked against the output once it is assembled
+    expected = verify_utils.CellTally()
+    tally_columns = [(excel_col_idx, pdf_cols, is_code) for excel_col_idx, pdf_cols, _, is_code, _ in columns]
     
-    for i, item in enumerate(data):
-        row_idx = start_row + i
+    if isinstance(data, pa.Table):
+        column_cache = None
+        if rows_key is not None:
+            column_cache = cache_utils.lru_get('column_values', rows_key)
+            if column_cache is None:
+                column_cache = cache_utils.lru_put('column_values', rows_key, {}, EXTRACTION_CACHE_ENTRIES)
+        with perf_utils.span('populate.prepare_cells', rows=data.num_rows):
+            cell_rows = prepare_cells(data, columns, shared_strings, column_cache)
+        expected.add_table(data, tally_columns)
+        
+        # Rows are rendered as XML fragments and spliced into sheetData; very
+        # large fills are split into ranges rendered in worker processes.
+        # Close to the memory budget, the sheet is instead streamed into the
+        # archive in batches (no worker processes, no full sheet string).
+        low_memory = memory_budget.should_downgrade()
+        with perf_utils.span('populate.render_sheet', rows=len(cell_rows)):
+            if low_memory:
+                memory_budget.current().note_downgrade('populate_excel', 'streamed sheet')
+                batches = (cell_rows[i:i + 1000] for i in range(0, len(cell_rows), 1000))
+                sheet_xml = memory_budget.checked(excel_utils.iter_sheet(layout, start_row, batches),
+                                                  'sheet rendering')
+            else:
+                # The deflated template rows around the data are reused by
+                # later exports with the same row count
+                sheet_xml = excel_utils.fill_sheet(layout, start_row, cell_rows, large_fill,
+                                                   cache_key=template.digest)
+                memory_budget.checkpoint('sheet rendering')
+        stage = 'populate.write_zip'
+    else:
+        # Row chunks from a generator (iter_pdf_data...): each chunk is
+        # converted and rendered as it arrives, so extraction and writing
+        # are interleaved inside the archive assembly below
+        streamed = {'rows': 0}
+        
+        def cell_chunks():
+            for items in data:
+                streamed['rows'] += items.num_rows
+                cells = prepare_cells(items, columns, shared_strings)
+                expected.add_table(items, tally_columns)
+                yield cells
         
-        if row_idx in rows:
-            row = rows[row_idx]
+        if memory_budget.should_downgrade():
+            memory_budget.current().note_downgrade('populate_excel', 'no worker processes')
+            large_fill = False
+        sheet_xml = memory_budget.checked(excel_utils.iter_sheet(layout, start_row, cell_chunks(), large_fill),
+                                          'sheet rendering')
+        stage = 'populate.stream'
+        
+    replacements = {template.sheet_path: sheet_xml}
+    if style_patched:
+        replacements['xl/styles.xml'] = styles_xml
+    if shared_strings is not None:
+        # Serialised once the sheet has been written, so streamed rows are included
+        replacements[excel_utils.SHARED_STRINGS_PATH] = shared_strings.to_xml
+    
+    # Assemble the archive straight into a spooled buffer; it only touches
+    # the disk if the workbook grows past OUTPUT_SPOOL_MAX_SIZE
+    output = tempfile.SpooledTemporaryFile(max_size=OUTPUT_SPOOL_MAX_SIZE)
+    with perf_utils.span(stage, compression=compression) as span:
+        excel_utils.write_workbook(template_path, output, replacements, compression)
+        if stage == 'populate.stream':
+            span['rows'] = streamed['rows']
+    # Spooled in memory up to OUTPUT_SPOOL_MAX_SIZE
+    memory_budget.release('cells')
+    memory_budget.charge('output', min(output.tell(), OUTPUT_SPOOL_MAX_SIZE) / memory_budget.MB)
+    memory_budget.checkpoint('workbook assembly')
+    
+    if verify_utils.VERIFY_OUTPUT:
+        with perf_utils.span('populate.verify', rows=expected.rows):
+            output.seek(0)
+            problems = verify_utils.verify_workbook(output, template, expected, replaced=replacements)
+        if problems:
+            output.close()
+            raise verify_utils.VerificationError(problems)
+    output.seek(0)
+    return output
+
+def build_preview(data, mapping, excel_headers):
+    """
+    Mapped values as they will be written, for the preview table:
+    {template column name: [value per row]}, ready for pd.DataFrame
+    """
+    # Create a map of col_idx -> col_name for easy lookup
+    col_name_map = {idx: name for idx, name in excel_headers}
+    data, _ = enrich_rows(data, mapping, excel_headers)
+
+    preview = {}
+    for col_idx, input_cols in mapping.items():
+        if not input_cols:
+            continue
+        # Replicate the concatenation logic
+        col_name = col_name_map.get(col_idx, f"Col {col_idx}")
+        preview[col_name] = arrow_utils.joined_values(data, input_cols)
+    return preview
+
+def build_summary(data, mapping, excel_headers):
+    """
+    Row count, totals of the quantity and value columns as written
+    (clean_number applied) and the number of their cells that are not
+    numbers, computed column-wise with pyarrow.compute
+    """
+    col_names = dict(excel_headers)
+    summary = {'rows': data.num_rows, 'totals': {}, 'unparsed': 0}
+    for col_idx, input_cols in mapping.items():
+        col_name = col_names.get(col_idx, f"Col {col_idx}")
+        if not input_cols or not any(k in col_name.lower() for k in ("quantité", "valeur")):
+            continue
+        # Same test and cleaning as column_values / clean_number
+        text = pc.replace_substring(pa.array(arrow_utils.joined_values(data, input_cols), pa.string()), ',', '.')
+        is_number = pc.match_substring_regex(text, r'^-?\d+(\.\d+)?$')
+        numbers = pc.cast(pc.replace_substring_regex(pc.filter(text, is_number), r'[^\d.]', ''), pa.float64())
+        summary['totals'][col_name] = pc.sum(numbers).as_py() or 0
+        unparsed = pc.and_(pc.invert(is_number), pc.not_equal(text, ''))
+        summary['unparsed'] += pc.sum(pc.cast(unparsed, pa.int64())).as_py() or 0
+    return summary
+
+def render_preview(meta, rows, mapping, excel_headers, page_key):
+    """
+    Summary metrics and one page of the preview table. rows: the mapped
+    rows (pyarrow Table) to page through, or None to show the first page
+    kept in the job meta
+    """
+    summary = meta.get('summary')
+    if summary:
+        metrics = st.columns(2 + len(summary['totals']))
+        metrics[0].metric("Rows", f"{summary['rows']:,}")
+        for column, (col_name, total) in zip(metrics[1:], summary['totals'].items()):
+            column.metric(col_name.rstrip(' *'), f"{total:,.2f}")
+        metrics[-1].metric("Unparsed numbers", summary['unparsed'])
+    
+    if not meta['preview']:
+        st.info("No data mapped yet.")
+        return
+    
+    offset = 0
+    if rows is not None and rows.num_rows > PREVIEW_PAGE_ROWS:
+        pages = -(-rows.num_rows // PREVIEW_PAGE_ROWS)
+        page = st.number_input(f"Preview page (of {pages})", min_value=1, max_value=pages, value=1, key=page_key)
+        offset = (page - 1) * PREVIEW_PAGE_ROWS
+    if rows is not None:
+        preview = build_preview(rows.slice(offset, PREVIEW_PAGE_ROWS), mapping, excel_headers)
+    else:
+        preview = meta['preview']
+    df = pd.DataFrame(preview)
+    # Number rows as in the whole extraction
+    df.index += offset + 1
+    st.dataframe(df)
+
+def run_ocr_job(context, pdf_bytes, memory_limit, trace_memory=False):
+    """Background job: OCR a scanned PDF; the result is the searchable PDF"""
+    with perf_utils.job("ocr", trace_memory, file_size=len(pdf_bytes)):
+        budget = memory_budget.start(memory_limit, len(pdf_bytes))
+        try:
+            with perf_utils.span('ocr'):
+                output = ocr_utils.convert_to_searchable_pdf(BytesIO(pdf_bytes), progress=context.progress)
+        finally:
+            memory_budget.finish(budget)
+    return output.getvalue(), {}
+
+def output_cache_key(input_digest, mapping, template_path, string_mode, compression, bundle='combined'):
+    """Content address of a built workbook: same input, mapping, template and writer give the same bytes"""
+    options = {'bundle': bundle} if bundle != 'combined' else {}
+    if any(HS_CODE_HEADER in cols for cols in mapping.values()):
+        # Looked-up HS codes change with the nomenclature file
+        index = hs_utils.get_index()
+        options['nomenclature'] = index.digest if index is not None else None
+    key = json.dumps({
+        **options,
+        'input': input_digest,
+        'mapping': {str(col): cols for col, cols in mapping.items() if cols},
+        'template': template_registry.get(template_path).digest,
+        'string_mode': string_mode,
+        'compression': compression,
+        'writer': excel_utils.WRITER_VERSION,
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def get_cached_output(key):
+    """(workbook bytes, meta) of a previous identical export, or None"""
+    content = cache_utils.disk_lru_get('outputs', key)
+    if content is None:
+        return None
+    meta, _, workbook = content.partition(b'\n')
+    return workbook, json.loads(meta)
+
+def put_cached_output(key, workbook, meta):
+    """Keep a built workbook (and its meta) in the disk LRU output cache"""
+    cache_utils.disk_lru_put('outputs', key, json.dumps(meta).encode('utf-8') + b'\n' + workbook)
+
+def build_export_table(data, mapping, excel_headers):
+    """
+    Normalised rows as they are written to the template, for analytics
+    exports: one column per mapped template column, descriptions uppercased
+    and numbers cleaned. Columns holding only numbers (or blanks) are float64,
+    the others text.
+    """
+    col_names = dict(excel_headers)
+    data, _ = enrich_rows(data, mapping, excel_headers)
+    columns = {}
+    for col_idx, input_cols in sorted(mapping.items()):
+        if not input_cols:
+            continue
+        col_name = col_names.get(col_idx, f"Col {col_idx}")
+        values = column_values(data, input_cols, "description" in col_name.lower(), "code sh" in col_name.lower())
+        if all(val_type == 'num' or value == '' for val_type, value in values):
+            columns[col_name] = pa.array([value if val_type == 'num' else None for val_type, value in values],
+                                         type=pa.float64())
         else:
-            row = ET.Element(f"{{{NS['x']}}}row", {'r': str(row_idx)})
-            sheetData.append(row)
-            rows[row_idx] = row
-
-        # Apply mapping
-        for excel_col_idx, pdf_cols in mapping.items():
-            if not pdf_cols:
-                continue
-                
-            # Concatenate values
-            parts = []
-            for pdf_col in pdf_cols:
-                val = item.get(pdf_col)
-                if val:
-                    parts.append(str(val).strip())
-            
-            final_val = " ".join(parts)
-            
-            # Check if this is the description column and uppercase it
-            col_name = next((name for idx, name in excel_headers if idx == excel_col_idx), "")
-            is_description = "description" in col_name.lower()
-            if is_description:
-                final_val = final_val.upper()
-            
-            # Determine type
-            # Heuristic: if column name implies number, try to clean
-            # For now, let's try to convert to float. If it works, use number.
-            # Unless it's a code that looks like a number but should be string?
-            # Excel handles numbers best as numbers.
-            
-            val_type = 'str'
-            num_val = clean_number(final_val)
+            columns[col_name] = pa.array([str(value) for _, value in values], type=pa.string())
+    return pa.table(columns)
+
+def get_extracted_rows(digest):
+    """Every extracted row of a document (pyarrow Table) from memory or the extraction store, or None"""
+    rows = cache_utils.lru_get('extracted_rows', digest)
+    if rows is None:
+        with perf_utils.span('extraction_store') as span:
+            stored = extraction_store.lookup(digest)
+            span['hit'] = stored is not None
+        if stored is not None:
+            rows = cache_utils.lru_put('extracted_rows', digest, stored['rows'], EXTRACTION_CACHE_ENTRIES)
+    return rows
+
+def get_stored_extraction(digest):
+    """
+    extraction_store.lookup memoised in the Streamlit session, so reruns do
+    not read and decode the stored rows again. Misses are not memoised: a
+    job of this session may store the rows later.
+    """
+    stored_key = f"stored_{digest}"
+    if st.session_state.get(stored_key) is None:
+        st.session_state[stored_key] = extraction_store.lookup(digest)
+    return st.session_state[stored_key]
+
+def export_rows(digest, is_pdf, selected_input_headers, mapping, excel_headers, fmt):
+    """Normalised rows of an extracted document in an arrow_utils.EXPORT_FORMATS format, or None"""
+    all_rows = get_extracted_rows(digest)
+    if all_rows is None:
+        return None
+    data = all_rows if is_pdf else select_rows(all_rows, selected_input_headers)
+    return arrow_utils.export_bytes(build_export_table(data, mapping, excel_headers), fmt)
+
+def with_invoice_starts(rows, starts):
+    """Record in a PDF's rows table the row offsets where its invoices start (see iter_pdf_data)"""
+    return rows.replace_schema_metadata({'invoice_starts': json.dumps(sorted(set(starts)))})
+
+def split_invoices(rows):
+    """A PDF's rows table split into one table per invoice, empty ones dropped"""
+    metadata = rows.schema.metadata or {}
+    starts = json.loads(metadata.get(b'invoice_starts', b'[0]'))
+    edges = sorted(set(starts) | {0}) + [rows.num_rows]
+    return [rows.slice(start, end - start) for start, end in zip(edges, edges[1:]) if end > start]
+
+def populate_invoices(invoices, template_path, mapping, excel_headers, string_mode='inline',
+                      compression='balanced', large_fill=None):
+    """One filled workbook per invoice of a bundle, in a zip archive (file-like)"""
+    output = tempfile.SpooledTemporaryFile(max_size=OUTPUT_SPOOL_MAX_SIZE)
+    # Workbooks are already deflated
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive:
+        for number, rows in enumerate(invoices, 1):
+            workbook = populate_excel(rows, template_path, mapping, excel_headers, string_mode, compression,
+                                      large_fill)
+            if workbook is None:
+                return None
+            archive.writestr(f"IDI_FILLED_{number:02d}.xlsx", workbook.read())
+            workbook.close()
+    output.seek(0)
+    return output
+
+def select_rows(rows, selected_headers):
+    """Restrict a rows table to the selected columns, dropping rows left empty (as extract_input_excel_data does)"""
+    return arrow_utils.select(rows, selected_headers)
+
+def run_process_job(context, file_bytes, digest, is_pdf, input_headers, selected_input_headers, template_path,
+                    mapping, excel_headers, string_mode, compression, large_fill, memory_limit, trace_memory=False,
+                    file_name=None, used_ocr=False, bundle='combined'):
+    """
+    Background job: extract the rows and fill the template.
+    digest: SHA-256 of the uploaded document (file_bytes may be its OCR'd version)
+    Rows are extracted once per document with every input column, kept in
+    memory and in extraction_store, so processing again with another
+    mapping skips extraction and only recomputes the changed columns.
+    Identical exports (same upload, mapping, template and options) come
+    from the disk output cache.
+    bundle: 'separate' fills one workbook per invoice of a PDF bundle
+    The result is the filled workbook (a zip of workbooks for separate
+    invoices); meta holds the item and invoice counts, the summary, the
+    first preview page and the stage timings.
+    """
+    with perf_utils.job("process", trace_memory, file_name=file_name, file_size=len(file_bytes)) as perf_job:
+        budget = memory_budget.start(memory_limit, len(file_bytes))
+        try:
+            cache_key = output_cache_key(digest, mapping, template_path, string_mode, compression, bundle)
+            with perf_utils.span('output_cache') as span:
+                cached = get_cached_output(cache_key)
+                if cached is not None and 'summary' not in cached[1]:
+                    # Stored by the HTTP API (or an older version), without preview and summary
+                    cached = None
+                span['hit'] = cached is not None
+            all_rows = get_extracted_rows(digest) if cached is None else None
+            separate = bundle == 'separate' and is_pdf
+            archive = False
+            if cached is None and all_rows is None and separate:
+                # Invoice boundaries are needed before the first workbook
+                context.progress(0, message="Extracting data")
+                with perf_utils.span('extract_pdf_data'):
+                    all_rows = extract_pdf_data(BytesIO(file_bytes), input_headers, progress=context.progress)
+                cache_utils.lru_put('extracted_rows', digest, all_rows, EXTRACTION_CACHE_ENTRIES)
+                extraction_store.save(digest, file_name, 'pdf', input_headers, all_rows, used_ocr)
             
-            if final_val and re.match(r'^-?\d+(\.\d+)?$', final_val.replace(',', '.')):
-                 final_val = num_val
-                 val_type = 'num'
+            if cached is not None:
+                workbook, meta = cached
+            elif all_rows is not None:
+                # Same upload as a previous run: only the mapping changed
+                context.progress(0, 0, "Writing workbook")
+                memory_budget.charge('rows', all_rows.nbytes / memory_budget.MB)
+                data = all_rows if is_pdf else select_rows(all_rows, selected_input_headers)
+                rows_key = (digest,) if is_pdf else (digest, tuple(sorted(selected_input_headers)))
+                invoices = split_invoices(data) if separate else [data]
+                archive = len(invoices) > 1
+                with perf_utils.span('populate_excel', rows=data.num_rows, cached_rows=True) as span:
+                    if archive:
+                        span['invoices'] = len(invoices)
+                        processed_excel = populate_invoices(invoices, template_path, mapping, excel_headers,
+                                                            string_mode, compression, large_fill)
+                    else:
+                        processed_excel = populate_excel(data, template_path, mapping, excel_headers, string_mode,
+                                                         compression, large_fill, rows_key=rows_key)
+            else:
+                context.progress(0, message="Extracting data")
+                source = BytesIO(file_bytes)
+                boundaries = []
+                if is_pdf:
+                    chunks = iter_pdf_data(source, input_headers, progress=context.progress, boundaries=boundaries)
+                else:
+                    chunks = iter_input_excel_data(source, input_headers, progress=context.progress)
+                
+                # Rows are written as they are extracted; keep them for the
+                # preview and for later runs on the same upload
+                all_chunks = []
+                data_chunks = []
+                
+                def collect():
+                    for chunk in chunks:
+                        all_chunks.append(chunk)
+                        if not is_pdf:
+                            chunk = select_rows(chunk, selected_input_headers)
+                        data_chunks.append(chunk)
+                        yield chunk
+                
+                with perf_utils.span('extract_and_populate') as span:
+                    processed_excel = populate_excel(
+                        collect(), template_path, mapping, excel_headers, string_mode, compression, large_fill
+                    )
+                    all_rows = arrow_utils.concat(all_chunks)
+                    data = arrow_utils.concat(data_chunks)
+                    if is_pdf:
+                        all_rows = data = with_invoice_starts(all_rows, boundaries)
+                    span['rows'] = data.num_rows
+                cache_utils.lru_put('extracted_rows', digest, all_rows, EXTRACTION_CACHE_ENTRIES)
+                extraction_store.save(digest, file_name, 'pdf' if is_pdf else 'xlsx', input_headers, all_rows,
+                                      used_ocr)
             
-            update_cell(row, row_idx, excel_col_idx, final_val, val_type)
+            if cached is None:
+                if processed_excel is None:
+                    raise ValueError("sheetData not found in template")
+                workbook = processed_excel.read() if data.num_rows else None
+                processed_excel.close()
+
+                preview, summary = {}, None
+                if data.num_rows:
+                    with perf_utils.span('preview', rows=data.num_rows):
+                        preview = build_preview(data.slice(0, PREVIEW_PAGE_ROWS), mapping, excel_headers)
+                        summary = build_summary(data, mapping, excel_headers)
+                meta = {'items': data.num_rows, 'preview': preview, 'summary': summary,
+                        'invoices': len(split_invoices(data)) if is_pdf else 1,
+                        'archive': archive}
+                if workbook is not None:
+                    put_cached_output(cache_key, workbook, meta)
+        finally:
+            memory_budget.finish(budget)
+
+    return workbook, dict(meta, cached=cached is not None, perf=perf_job.rows(), perf_job_id=perf_job.job_id)
+
+def extract_document(file_bytes, is_pdf, pdf_workers=None):
+    """
+    (input headers, every extracted row, used OCR) of one upload, OCR and
+    header detection included; runs inside merge worker processes
+    """
+    source = BytesIO(file_bytes)
+    used_ocr = False
+    if is_pdf:
+        if ocr_utils.needs_ocr(source):
+            source = ocr_utils.convert_to_searchable_pdf(source)
+            used_ocr = True
+        headers = get_pdf_headers(source)
+        rows = extract_pdf_data(source, headers, workers=pdf_workers)
+    else:
+        headers = get_input_excel_headers(source)
+        source.seek(0)
+        rows = arrow_utils.concat(iter_input_excel_data(source, headers))
+    return headers, rows, used_ocr
+
+_merge_pool = None
+
+def _get_merge_pool():
+    """Lazily started pool, reused across merges (spawn is safe in threaded servers)"""
+    global _merge_pool
+    if _merge_pool is None:
+        _merge_pool = ProcessPoolExecutor(max_workers=MERGE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _merge_pool
+
+def extract_documents(documents):
+    """
+    Yield extract_document() of each (file_name, file_bytes, digest, is_pdf)
+    document, in order. Several documents are extracted at once by
+    MERGE_WORKERS processes, each reading its pages in-process.
+    """
+    if MERGE_WORKERS <= 1 or len(documents) < 2:
+        for _, file_bytes, _, is_pdf in documents:
+            yield extract_document(file_bytes, is_pdf)
+        return
+    pool = _get_merge_pool()
+    futures = [pool.submit(extract_document, file_bytes, is_pdf, 1) for _, file_bytes, _, is_pdf in documents]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+def merge_digest(documents):
+    """Content address of a merge of (file_name, digest, is_pdf) documents (names are part of the rows)"""
+    key = json.dumps([[file_name, digest] for file_name, digest, _ in documents])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def merge_rows(documents, selected_input_headers, counts=None):
+    """
+    Rows of several extracted documents as one table, in upload order, with
+    each row's document name in SOURCE_HEADER; None if one of them is no
+    longer stored
+    documents: [(file_name, digest, is_pdf)]
+    counts: optional list, receives the row count of each document
+    """
+    tables = []
+    for file_name, digest, is_pdf in documents:
+        rows = get_extracted_rows(digest)
+        if rows is None:
+            return None
+        data = rows if is_pdf else select_rows(rows, selected_input_headers)
+        # Invoice starts are offsets within each document
+        data = data.replace_schema_metadata(None)
+        tables.append(data.append_column(SOURCE_HEADER, pa.array([file_name] * data.num_rows, type=pa.string())))
+        if counts is not None:
+            counts.append(data.num_rows)
+    return arrow_utils.concat(tables)
+
+def run_merge_job(context, documents, selected_input_headers, template_path, mapping, excel_headers, string_mode,
+                  compression, large_fill, memory_limit, trace_memory=False):
+    """
+    Background job: fill the template once with the rows of several uploads.
+    documents: [(file_name, file_bytes, digest, is_pdf)]
+    Documents missing from the extraction store are extracted concurrently
+    (see extract_documents), then all rows are appended in upload order and
+    written in a single pass. Mapping SOURCE_HEADER to a template column
+    tags each line with its document.
+    The result is the filled workbook; meta holds the item count per
+    document, the summary and the first preview page.
+    """
+    file_size = sum(len(file_bytes) for _, file_bytes, _, _ in documents)
+    with perf_utils.job("merge", trace_memory, documents=len(documents), file_size=file_size) as perf_job:
+        budget = memory_budget.start(memory_limit, file_size)
+        try:
+            names = [(file_name, digest, is_pdf) for file_name, _, digest, is_pdf in documents]
+            cache_key = output_cache_key(merge_digest(names), mapping, template_path, string_mode, compression)
+            with perf_utils.span('output_cache') as span:
+                cached = get_cached_output(cache_key)
+                span['hit'] = cached is not None
             
-            # Apply thin border style
-            if style_patched:
-                # Find the cell we just updated/created
-                col_letter = get_col_letter(excel_col_idx)
-                cell_ref = f"{col_letter}{row_idx}"
-                cell = next((c for c in row.findall(f"{{{NS['x']}}}c") if c.get('r') == cell_ref), None)
-                if cell is not None:
-                    if is_description:
-                        cell.set('s', str(left_style_idx))
-                    else:
-                        cell.set('s', str(center_style_idx))
+            if cached is not None:
+                workbook, meta = cached
+            else:
+                missing = [doc for doc in documents if get_extracted_rows(doc[2]) is None]
+                if missing:
+                    context.progress(0, len(missing), "Extracting documents")
+                    with perf_utils.span('extract_documents', documents=len(missing)):
+                        extracted = extract_documents(missing)
+                        for done, (doc, (headers, rows, used_ocr)) in enumerate(zip(missing, extracted), 1):
+                            file_name, _, digest, is_pdf = doc
+                            cache_utils.lru_put('extracted_rows', digest, rows, EXTRACTION_CACHE_ENTRIES)
+                            extraction_store.save(digest, file_name, 'pdf' if is_pdf else 'xlsx', headers, rows,
+                                                  used_ocr)
+                            context.progress(done, len(missing), "Extracting documents")
+                
+                context.progress(0, 0, "Writing workbook")
+                counts = []
+                data = merge_rows(names, selected_input_headers, counts)
+                memory_budget.charge('rows', data.nbytes / memory_budget.MB)
+                with perf_utils.span('populate_excel', rows=data.num_rows, documents=len(documents)):
+                    processed_excel = populate_excel(data, template_path, mapping, excel_headers, string_mode,
+                                                     compression, large_fill)
+                if processed_excel is None:
+                    raise ValueError("sheetData not found in template")
+                workbook = processed_excel.read() if data.num_rows else None
+                processed_excel.close()
+                
+                preview, summary = {}, None
+                if data.num_rows:
+                    with perf_utils.span('preview', rows=data.num_rows):
+                        preview = build_preview(data.slice(0, PREVIEW_PAGE_ROWS), mapping, excel_headers)
+                        summary = build_summary(data, mapping, excel_headers)
+                meta = {'items': data.num_rows, 'preview': preview, 'summary': summary,
+                        'documents': [[file_name, count] for (file_name, _, _), count in zip(names, counts)]}
+                if workbook is not None:
+                    put_cached_output(cache_key, workbook, meta)
+        finally:
+            memory_budget.finish(budget)
+    
+    return workbook, dict(meta, cached=cached is not None, perf=perf_job.rows(), perf_job_id=perf_job.job_id)
+
+def render_perf_panel(spans, perf_job_id):
+    """Collapsible table of the stage timings recorded for a job"""
+    if not spans:
+        return
+    with st.expander("⏱️ Performance details"):
+        st.dataframe(pd.DataFrame([{
+            "Stage": span['stage'],
+            "Within": span['parent'] or "",
+            "Wall (s)": span['wall_s'],
+            "CPU (s)": span['cpu_s'],
+            "Peak memory (MB)": span['peak_mb'],
+            "RSS (MB)": span['rss_mb'],
+            "Pages": span['pages'],
+            "Rows": span['rows'],
+        } for span in spans]), hide_index=True)
+        st.caption(f"Job {perf_job_id} · logged to {perf_utils.LOG_PATH}")
+
+@st.fragment(run_every=1.0)
+def job_status(job_id, label):
+    """Live progress of a background job; reruns the page once it has finished"""
+    job = job_queue.get(job_id)
+    if job is None or job['status'] in job_queue.FINISHED:
+        st.rerun()
+
+    if job['status'] == job_queue.QUEUED:
+        ahead = job_queue.queue_position(job_id)
+        st.info(f"{label} queued" + (f" behind {ahead} other job(s)." if ahead else "."))
+    else:
+        fraction = min(job['done'] / job['total'], 1.0) if job['total'] else 0.0
+        text = job['message'] or label
+        if job['total']:
+            text += f" ({job['done']}/{job['total']})"
+        st.progress(fraction, text=text)
+
+    if st.button("Cancel", key=f"cancel_{job_id}"):
+        job_queue.cancel(job_id)
+
+def mapping_widgets(input_headers, excel_headers):
+    """Column mapping multiselects, one per template column: (mapping, selected input headers)"""
+    mapping = {}
+    selected_input_headers = set()
+    
+    if hs_utils.get_index() is not None:
+        st.caption(f"'{HS_CODE_HEADER}' fills a field with the HS code found for each line's description "
+                   f"in {hs_utils.NOMENCLATURE_PATH}.")
+        input_headers = input_headers + [HS_CODE_HEADER]
+    else:
+        st.warning(f"HS code lookup is off: {hs_utils.load_error}")
+    
+    # Create 3 columns for layout
+    cols = st.columns(3)
+    defaults = default_mapping(input_headers, excel_headers)
+    
+    for i, (col_idx, col_name) in enumerate(excel_headers):
+        with cols[i % 3]:
+            selection = st.multiselect(
+                f"{col_name}",
+                options=input_headers,
+                default=defaults[col_idx],
+                key=f"map_{col_idx}"
+            )
+            mapping[col_idx] = selection
+            selected_input_headers.update(selection)
+    return mapping, selected_input_headers
+
+def render_output(meta, processed_excel, rows, mapping, excel_headers, page_key, export_format=None, export=None):
+    """
+    Preview pages and downloads of a finished process or merge job
+    rows: every row written (for later preview pages), or None
+    export: callable returning the rows in export_format, or None
+    """
+    st.subheader("Preview of Data to be Written")
+    render_preview(meta, rows, mapping, excel_headers, page_key)
+    
+    if meta.get('archive'):
+        st.download_button(
+            label=f"📥 Download {meta['invoices']} Filled Workbooks (ZIP)",
+            data=processed_excel,
+            file_name="IDI_FILLED.zip",
+            mime="application/zip"
+        )
+    else:
+        st.download_button(
+            label="📥 Download Filled Excel",
+            data=processed_excel,
+            file_name="IDI_FILLED.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+    
+    if export_format and export is not None:
+        mime, extension = arrow_utils.EXPORT_FORMATS[export_format]
+        st.download_button(
+            label=f"📥 Download Extracted Rows ({extension[1:].upper()})",
+            # Built on click, from the stored extraction
+            data=lambda: export() or b'',
+            file_name=f"IDI_ROWS{extension}",
+            mime=mime
+        )
+    
+    render_perf_panel(meta['perf'], meta['perf_job_id'])
+
+def merge_uploads(uploaded_files, template_path, string_mode, compression, large_fill, memory_limit, trace_memory,
+                  export_format):
+    """Merge mode: several uploads filled into one workbook"""
+    file_size = sum(f.size for f in uploaded_files)
+    with perf_utils.job("app", trace_memory, documents=len(uploaded_files), file_size=file_size), \
+            memory_budget.budget(memory_limit, file_size):
+        documents = []
+        input_headers = []
+        pending_ocr = []
+        for uploaded_file in uploaded_files:
+            file_type = uploaded_file.name.split('.')[-1].lower()
+            file_bytes = uploaded_file.getvalue()
+            digest = hashlib.sha256(file_bytes).hexdigest()
+            documents.append((uploaded_file.name, file_bytes, digest, file_type == 'pdf'))
         
-    temp_zip = output_path + ".tmp"
-    with zipfile.ZipFile(source_zip, 'r') as zin:
-        with zipfile.ZipFile(temp_zip, 'w') as zout:
-            for item in zin.infolist():
-                if item.filename == 'xl/worksheets/sheet2.xml':
-                    zout.writestr(item, ET.tostring(root, encoding='UTF-8', xml_declaration=True))
-                else:
-                    zout.writestr(item, zin.read(item.filename))
+            file_key = getattr(uploaded_file, 'file_id', uploaded_file.name)
+            seen_key = f"seen_{file_key}"
+            if seen_key not in st.session_state:
+                st.session_state[seen_key] = extraction_store.mark_seen(digest, uploaded_file.name, file_type)
+            previous = st.session_state[seen_key]
+            if previous:
+                first_seen = datetime.fromtimestamp(previous['first_seen']).strftime('%Y-%m-%d %H:%M')
+                st.warning(f"Duplicate invoice: '{uploaded_file.name}' was already uploaded {previous['seen_count']} "
+                           f"time(s), first on {first_seen} as '{previous['file_name']}'.")
+        
+            # Headers of each document, detected once per upload
+            headers_key = f"headers_{digest}"
+            if headers_key not in st.session_state:
+                stored = get_stored_extraction(digest)
+                try:
+                    with perf_utils.span('get_document_headers'):
+                        if stored is not None:
+                            headers = stored['headers']
+                        elif file_type == 'pdf':
+                            # Scanned documents are OCR'd by the merge job
+                            headers = None if ocr_utils.needs_ocr(uploaded_file) else get_pdf_headers(uploaded_file)
+                        else:
+                            headers = get_input_excel_headers(uploaded_file)
+                except Exception as e:
+                    st.error(f"Error reading '{uploaded_file.name}': {e}")
+                    headers = []
+                st.session_state[headers_key] = headers
+            headers = st.session_state[headers_key]
+            if headers is None:
+                pending_ocr.append(uploaded_file.name)
+            elif not headers:
+                st.warning(f"Could not detect headers in '{uploaded_file.name}'.")
+            input_headers.extend(h for h in headers or [] if h not in input_headers)
     
-    shutil.move(temp_zip, output_path)
+        if pending_ocr:
+            st.info(f"Scanned document(s) {', '.join(pending_ocr)} will be OCR'd while merging; "
+                    "process them on their own first to map their columns.")
     
-    # Cleanup intermediate file
-    if style_patched and os.path.exists(temp_style_zip):
-        os.remove(temp_style_zip)
+        with perf_utils.span('get_excel_headers'):
+            excel_headers = get_excel_headers(template_path)
     
-    with open(output_path, 'rb') as f:
-        output = BytesIO(f.read())
+        if input_headers and excel_headers:
+            st.subheader("Column Mapping")
+            st.info(f"Map the columns of the {len(documents)} documents to the Excel fields. "
+                    f"Map '{SOURCE_HEADER}' to a field to tag each line with the document it comes from.")
+            mapping, selected_input_headers = mapping_widgets(input_headers + [SOURCE_HEADER], excel_headers)
         
-    os.unlink(output_path)
-    return output
+            names = [(file_name, digest, is_pdf) for file_name, _, digest, is_pdf in documents]
+            merge_key = merge_digest(names)
+            job_key = f"merge_job_{merge_key}"
+            if st.button("Merge Files", type="primary"):
+                mapping_utils.remember(mapping, excel_headers, input_headers)
+                st.session_state[f"merge_args_{merge_key}"] = (list(selected_input_headers), mapping)
+                st.session_state[job_key] = job_queue.submit(
+                    'merge', run_merge_job, documents, list(selected_input_headers), template_path, mapping,
+                    excel_headers, string_mode, compression, large_fill, memory_limit, trace_memory
+                )
+        
+            merge_job = job_queue.get(st.session_state[job_key]) if job_key in st.session_state else None
+            if merge_job is not None:
+                if merge_job['status'] == job_queue.DONE:
+                    meta = merge_job['meta']
+                    st.success(f"Merged {meta['items']} items from {len(meta['documents'])} documents.")
+                    st.caption(" · ".join(f"{file_name}: {count} items" for file_name, count in meta['documents']))
+                    if meta.get('cached'):
+                        st.caption("Identical export found in the output cache.")
+                
+                    processed_excel = job_queue.result(merge_job['id'])
+                    if not meta['items']:
+                        st.warning("No data found in the documents matching the selected columns.")
+                    elif processed_excel is None:
+                        st.warning("This result has expired, please merge the files again.")
+                    else:
+                        merge_args = st.session_state.get(f"merge_args_{merge_key}")
+                        rows = merge_rows(names, merge_args[0]) if merge_args else None
+                        export = None
+                        if export_format and rows is not None:
+                            export = lambda: arrow_utils.export_bytes(
+                                build_export_table(rows, merge_args[1], excel_headers), export_format
+                            )
+                        render_output(meta, processed_excel, rows, merge_args[1] if merge_args else mapping,
+                                      excel_headers, f"preview_page_{merge_key}", export_format, export)
+                elif merge_job['status'] == job_queue.FAILED:
+                    st.error(f"An error occurred: {merge_job['error']}")
+                elif merge_job['status'] == job_queue.CANCELLED:
+                    st.warning("Merging was cancelled.")
+                else:
+                    job_status(merge_job['id'], "Merging")
+        elif not pending_ocr:
+            if not excel_headers:
+                st.error("Could not read headers from Excel template.")
 
 def main():
     st.set_page_config(page_title="PDF to Excel Converter", layout="wide")
     
     st.title("📄 PDF to Excel Converter")
     st.markdown("""
-    Upload your PDF invoice to automatically fill the data into the IDI template.
+    Upload your PDF invoice to automatically fill the data into the IDI template,
+    or several invoices to merge their lines into one workbook.
     """)
     
-    template_path = "IDI VIDE.xlsx"
+    template_path = template_registry.DEFAULT_TEMPLATE
+    
+    st.sidebar.header("Output Options")
+    string_mode = st.sidebar.selectbox(
+        "Text cells",
+        options=["inline", "shared"],
+        format_func=lambda m: "Inline strings" if m == "inline" else "Shared strings (deduplicated)",
+        help="Shared strings store each distinct text once in the workbook, "
+             "which keeps files with repeated descriptions smaller and faster to open."
+    )
+    compression = st.sidebar.selectbox(
+        "Compression",
+        options=list(excel_utils.COMPRESSION_POLICIES),
+        index=1,
+        format_func=str.capitalize,
+        help="Fastest gives the quickest download, smallest the smallest file."
+    )
+    bundle = st.sidebar.selectbox(
+        "Invoice bundles",
+        options=["combined", "separate"],
+        format_func=lambda b: "One combined sheet" if b == "combined" else "One workbook per invoice",
+        help="For PDFs holding several invoices, each with its own header row: "
+             "fill them all into one sheet, or download a zip with one workbook per invoice."
+    )
+    parallel_fill = st.sidebar.checkbox(
+        "Parallel rendering for large fills",
+        value=True,
+        help=f"Fills of {excel_utils.LARGE_FILL_MIN_ROWS:,} rows or more render their rows in worker processes."
+    )
+    trace_memory = st.sidebar.checkbox(
+        "Trace peak memory per stage",
+        value=perf_utils.TRACE_MEMORY,
+        help="Adds peak memory to the performance details; makes PDF processing noticeably slower."
+    )
+    export_format = st.sidebar.selectbox(
+        "Extracted rows export",
+        options=[None, *arrow_utils.EXPORT_FORMATS],
+        format_func=lambda f: {None: "None", 'parquet': "Parquet", 'csv': "CSV"}[f],
+        help="Also offer the mapped, cleaned rows as a Parquet or CSV file, "
+             "much faster for reporting tools to read than the filled workbook."
+    )
+    memory_limit = st.sidebar.number_input(
+        "Memory budget per job (MB)",
+        min_value=0,
+        value=int(memory_budget.JOB_MEMORY_BUDGET_MB),
+        step=256,
+        help="Near this limit, OCR and the Excel writer switch to slower low-memory modes; "
+             "past it, processing stops with an error. 0 disables the budget."
+    )
+    
+    # Known templates are parsed on the first run, then again only when their file changes
+    template_registry.preload()
     try:
-        open(template_path, 'rb')
+        template_registry.get(template_path)
     except FileNotFoundError:
         st.error(f"Template file '{template_path}' not found in the directory!")
         return
+    except Exception as e:
+        st.error(f"Template file '{template_path}' could not be loaded: {e}")
+        return
     
-    uploaded_file = st.file_uploader("Upload Invoice (PDF or Excel)", type=["pdf", "xlsx"])
-        
-    if uploaded_file:
+    uploaded_files = st.file_uploader(
+        "Upload Invoice (PDF or Excel)",
+        type=["pdf", "xlsx"],
+        accept_multiple_files=True,
+        help="Upload several invoices to merge their lines into one workbook."
+    )
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
+    
+    if len(uploaded_files) > 1:
+        merge_uploads(uploaded_files, template_path, string_mode, compression, None if parallel_fill else False,
+                      memory_limit, trace_memory, export_format)
+    elif uploaded_file:
         file_type = uploaded_file.name.split('.')[-1].lower()
         
-        input_headers = []
-        processing_file_path = None
-        is_pdf = False
+        # Per-stage timings of this script run (header detection...), logged
+        with perf_utils.job("app", trace_memory, file_name=uploaded_file.name, file_type=file_type,
+                            file_size=uploaded_file.size), \
+                memory_budget.budget(memory_limit, uploaded_file.size):
+            input_headers = []
+            processing_file = None
+            is_pdf = False
+            ocr_pending = False
+            used_ocr = False
+            # Background jobs belong to this upload; a new upload starts afresh
+            file_key = getattr(uploaded_file, 'file_id', uploaded_file.name)
         
-        if file_type == 'pdf':
-            is_pdf = True
-            # Save uploaded file to temp file for processing
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_pdf:
-                tmp_pdf.write(uploaded_file.getvalue())
-                tmp_pdf_path = tmp_pdf.name
-                
-            try:
-                # Check if OCR is needed
-                if ocr_utils.needs_ocr(tmp_pdf_path):
-                    st.warning("Scanned document detected. Performing OCR (this may take a while)...")
-                    with st.spinner("Running OCR..."):
-                        # Convert to searchable PDF
-                        searchable_pdf_path = ocr_utils.convert_to_searchable_pdf(tmp_pdf_path)
-                        # Use the new PDF for processing
-                        processing_file_path = searchable_pdf_path
-                else:
-                    processing_file_path = tmp_pdf_path
+            # Documents extracted before (same content hash) skip OCR and table
+            # detection; re-uploads of the same invoice are flagged
+            digest = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+            stored = get_stored_extraction(digest)
+            seen_key = f"seen_{file_key}"
+            if seen_key not in st.session_state:
+                st.session_state[seen_key] = extraction_store.mark_seen(digest, uploaded_file.name, file_type)
+            previous = st.session_state[seen_key]
+            if previous:
+                first_seen = datetime.fromtimestamp(previous['first_seen']).strftime('%Y-%m-%d %H:%M')
+                st.warning(f"Duplicate invoice: this document was already uploaded {previous['seen_count']} time(s), "
+                           f"first on {first_seen} as '{previous['file_name']}'.")
+        
+            if stored is not None:
+                is_pdf = file_type == 'pdf'
+                input_headers = stored['headers']
+                used_ocr = stored['settings']['ocr']
+                st.info(f"Using the stored extraction of this document ({stored['row_count']} rows).")
+            elif file_type == 'pdf':
+                is_pdf = True
+                # pdfplumber reads the upload directly as a file-like object
+                try:
+                    # Check if OCR is needed
+                    if ocr_utils.needs_ocr(uploaded_file):
+                        # OCR runs in the background job queue, so the page stays
+                        # responsive and other sessions are not blocked
+                        ocr_key = f"ocr_job_{file_key}"
+                        if ocr_key not in st.session_state:
+                            st.session_state[ocr_key] = job_queue.submit(
+                                'ocr', run_ocr_job, uploaded_file.getvalue(), memory_limit, trace_memory
+                            )
+                        ocr_job = job_queue.get(st.session_state[ocr_key])
+                        ocr_result = job_queue.result(ocr_job['id']) if ocr_job else None
+                    
+                        if ocr_result is not None:
+                            # Searchable PDF produced by the OCR job
+                            processing_file = BytesIO(ocr_result)
+                            used_ocr = True
+                        elif ocr_job is not None and ocr_job['status'] in (job_queue.FAILED, job_queue.CANCELLED):
+                            ocr_pending = True
+                            if ocr_job['status'] == job_queue.FAILED:
+                                st.error(f"Error processing PDF: {ocr_job['error']}")
+                            else:
+                                st.warning("OCR was cancelled.")
+                            if st.button("Run OCR again"):
+                                del st.session_state[ocr_key]
+                                st.rerun()
+                        elif ocr_job is None or ocr_job['status'] == job_queue.DONE:
+                            # Result purged; queue the document again
+                            del st.session_state[ocr_key]
+                            st.rerun()
+                        else:
+                            ocr_pending = True
+                            st.warning("Scanned document detected. Performing OCR in the background (this may take a while)...")
+                            job_status(ocr_job['id'], "Running OCR")
+                    else:
+                        processing_file = uploaded_file
 
-                input_headers = get_pdf_headers(processing_file_path)
-            except Exception as e:
-                st.error(f"Error processing PDF: {e}")
+                    if processing_file is not None:
+                        with perf_utils.span('get_pdf_headers'):
+                            input_headers = get_pdf_headers(processing_file)
+                except memory_budget.MemoryBudgetExceeded as e:
+                    st.error(str(e))
+                except Exception as e:
+                    st.error(f"Error processing PDF: {e}")
                 
-        elif file_type == 'xlsx':
-            input_headers = get_input_excel_headers(uploaded_file)
-            # For Excel, we can just use the uploaded_file object directly with pandas, 
-            # but for consistency we might want to just pass it.
-            # However, extract_input_excel_data takes the file object.
-            pass
+            elif file_type == 'xlsx':
+                with perf_utils.span('get_input_excel_headers'):
+                    input_headers = get_input_excel_headers(uploaded_file)
+                # For Excel, we can just use the uploaded_file object directly with pandas, 
+                # but for consistency we might want to just pass it.
+                # However, extract_input_excel_data takes the file object.
+                processing_file = uploaded_file
             
-        excel_headers = get_excel_headers(template_path)
+            with perf_utils.span('get_excel_headers'):
+                excel_headers = get_excel_headers(template_path)
         
-        if input_headers and excel_headers:
-            st.subheader("Column Mapping")
-            st.info(f"Map the {file_type.upper()} columns to the Excel fields.")
-            
-            mapping = {}
-            selected_input_headers = set()
+            if input_headers and excel_headers:
+                st.subheader("Column Mapping")
+                st.info(f"Map the {file_type.upper()} columns to the Excel fields.")
             
-            # Create 3 columns for layout
-            cols = st.columns(3)
+                mapping, selected_input_headers = mapping_widgets(input_headers, excel_headers)
             
-            for i, (col_idx, col_name) in enumerate(excel_headers):
-                with cols[i % 3]:
-                    # Default selection logic
-                    default = []
-                    col_name_lower = col_name.lower()
-                    
-                    for ph in input_headers:
-                        ph_lower = ph.lower()
-                        # Heuristics for defaults
-                        if "description" in col_name_lower and ("model" in ph_lower or "material" in ph_lower):
-                            default.append(ph)
-                        elif "quantité" in col_name_lower and "qty" in ph_lower:
-                            default.append(ph)
-                        elif "valeur" in col_name_lower and "amount" in ph_lower:
-                            default.append(ph)
-                    
-                    selection = st.multiselect(
-                        f"{col_name}",
-                        options=input_headers,
-                        default=default,
-                        key=f"map_{col_idx}"
+                # Extraction and the workbook fill run as a background job; the
+                # results stay available across reruns of this page
+                process_key = f"process_job_{file_key}"
+                if st.button("Process File", type="primary"):
+                    mapping_utils.remember(mapping, excel_headers, input_headers)
+                    # The preview pages and the rows export follow the mapping
+                    # the workbook was built with
+                    st.session_state[f"process_args_{file_key}"] = (list(selected_input_headers), mapping)
+                    file_bytes = (processing_file or uploaded_file).getvalue()
+                    st.session_state[process_key] = job_queue.submit(
+                        'process', run_process_job, file_bytes, digest, is_pdf, input_headers,
+                        list(selected_input_headers), template_path, mapping, excel_headers, string_mode, compression,
+                        None if parallel_fill else False, memory_limit, trace_memory, uploaded_file.name, used_ocr,
+                        bundle
                     )
-                    mapping[col_idx] = selection
-                    selected_input_headers.update(selection)
             
-            if st.button("Process File", type="primary"):
-                with st.spinner("Processing..."):
-                    try:
-                        data = []
-                        if is_pdf:
-                            data = extract_pdf_data(processing_file_path, list(selected_input_headers))
-                        else:
-                            # Excel
-                            # Reset pointer to beginning of file if it was read before
-                            uploaded_file.seek(0)
-                            data = extract_input_excel_data(uploaded_file, list(selected_input_headers))
-                            
-                        st.success(f"Extracted {len(data)} items from {file_type.upper()}.")
-                        
-                        if data:
-                            processed_excel = populate_excel(data, template_path, mapping, excel_headers)
-                            
-                            st.subheader("Preview of Data to be Written")
-                            
-                            # Create preview dataframe with mapped values
-                            preview_rows = []
-                            # Create a map of col_idx -> col_name for easy lookup
-                            col_name_map = {idx: name for idx, name in excel_headers}
-                            
-                            for item in data:
-                                row_data = {}
-                                for col_idx, input_cols in mapping.items():
-                                    if not input_cols:
-                                        continue
-                                    
-                                    # Replicate the concatenation logic
-                                    parts = []
-                                    for input_col in input_cols:
-                                        val = item.get(input_col)
-                                        if val:
-                                            parts.append(str(val).strip())
-                                    
-                                    final_val = " ".join(parts)
-                                    col_name = col_name_map.get(col_idx, f"Col {col_idx}")
-                                    row_data[col_name] = final_val
-                                
-                                if row_data:
-                                    preview_rows.append(row_data)
-                            
-                            if preview_rows:
-                                st.dataframe(pd.DataFrame(preview_rows))
-                            else:
-                                st.info("No data mapped yet.")
-                            
-                            st.download_button(
-                                label="📥 Download Filled Excel",
-                                data=processed_excel,
-                                file_name="IDI_FILLED.xlsx",
-                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                            )
-                        else:
+                process_job = job_queue.get(st.session_state[process_key]) if process_key in st.session_state else None
+                if process_job is not None:
+                    if process_job['status'] == job_queue.DONE:
+                        meta = process_job['meta']
+                        st.success(f"Extracted {meta['items']} items from {file_type.upper()}.")
+                        if meta.get('invoices', 1) > 1:
+                            st.caption(f"The document holds {meta['invoices']} invoices.")
+                        if meta.get('cached'):
+                            st.caption("Identical export found in the output cache.")
+                    
+                        processed_excel = job_queue.result(process_job['id'])
+                        if not meta['items']:
                             st.warning(f"No data found in the {file_type.upper()} matching the selected columns.")
-                            
-                    except Exception as e:
-                        st.error(f"An error occurred: {str(e)}")
-        else:
-            if not input_headers:
-                st.warning(f"Could not detect headers in the {file_type.upper()}.")
-            if not excel_headers:
-                st.error("Could not read headers from Excel template.")
-        
-        # Cleanup
-        if is_pdf:
-            if 'tmp_pdf_path' in locals() and os.path.exists(tmp_pdf_path):
-                os.unlink(tmp_pdf_path)
-            if 'processing_file_path' in locals() and processing_file_path != tmp_pdf_path and os.path.exists(processing_file_path):
-                os.unlink(processing_file_path)
+                        elif processed_excel is None:
+                            st.warning("This result has expired, please process the file again.")
+                        else:
+                            # Later pages are rendered from the extracted rows,
+                            # one page at a time
+                            process_args = st.session_state.get(f"process_args_{file_key}")
+                            rows = get_extracted_rows(digest) if process_args else None
+                            if rows is not None and not is_pdf:
+                                rows = select_rows(rows, process_args[0])
+                            export = None
+                            if export_format and process_args:
+                                export = lambda: export_rows(digest, is_pdf, *process_args, excel_headers, export_format)
+                            render_output(meta, processed_excel, rows, process_args[1] if process_args else mapping,
+                                          excel_headers, f"preview_page_{file_key}", export_format, export)
+                    elif process_job['status'] == job_queue.FAILED:
+                        st.error(f"An error occurred: {process_job['error']}")
+                    elif process_job['status'] == job_queue.CANCELLED:
+                        st.warning("Processing was cancelled.")
+                    else:
+                        job_status(process_job['id'], "Processing")
+            elif not ocr_pending:
+                if not input_headers:
+                    st.warning(f"Could not detect headers in the {file_type.upper()}.")
+                if not excel_headers:
+                    st.error("Could not read headers from Excel template.")
                     
     elif not uploaded_file:
         st.info("Please upload a PDF or Excel file to start.")
@@ -0,0 +1,92 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+# Row export formats: (MIME type, file extension)
+EXPORT_FORMATS = {
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+    'csv': ('text/csv', '.csv'),
+}
+
+# Extracted rows are held as pyarrow Tables with one nullable string column
+# per input header: header names are stored once instead of in every row,
+# and consumers read whole columns instead of looking up row dicts.
+
+def cell_text(value):
+    """
+    Text of one extracted cell: None for a missing cell, '' for a present
+    but empty one (0, ''...), str(value) otherwise
+    """
+    if value is None:
+        return None
+    if not value:
+        return ''
+    return str(value)
+
+def table_from_columns(columns):
+    """Table from {header: [cell text or None, ...]}"""
+    return pa.table({header: pa.array(values, type=pa.string()) for header, values in columns.items()})
+
+def table_from_rows(rows):
+    """Table from row dicts (keys may differ between rows; missing cells are null)"""
+    columns = {}
+    for row_num, row in enumerate(rows):
+        for header, value in row.items():
+            if header not in columns:
+                columns[header] = [None] * row_num
+            columns[header].append(cell_text(value))
+        for values in columns.values():
+            if len(values) <= row_num:
+                values.append(None)
+    return table_from_columns(columns)
+
+def concat(tables):
+    """One table from chunks whose columns may differ (e.g. pages with other headers)"""
+    tables = [t for t in tables if t.num_rows]
+    if not tables:
+        return pa.table({})
+    if len(tables) == 1:
+        return tables[0]
+    return pa.concat_tables(tables, promote_options='default').combine_chunks()
+
+def select(table, headers):
+    """Restrict a table to the given columns, dropping rows where they are all missing"""
+    names = [h for h in table.column_names if h in set(headers)]
+    if not names:
+        return pa.table({})
+    selected = table.select(names)
+    present = pc.is_valid(selected.column(0))
+    for name in names[1:]:
+        present = pc.or_(present, pc.is_valid(selected.column(name)))
+    return selected.filter(present)
+
+def joined_values(table, input_cols):
+    """Per row, the non-empty cells of input_cols stripped and joined with spaces"""
+    columns = [table.column(c).to_pylist() for c in input_cols if c in table.column_names]
+    if not columns:
+        return [''] * table.num_rows
+    return [" ".join(v.strip() for v in cells if v) for cells in zip(*columns)]
+
+def to_ipc(table):
+    """Serialise a table (Arrow IPC stream, zstd-compressed)"""
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression='zstd')
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def from_ipc(data):
+    """Table written by to_ipc"""
+    return pa.ipc.open_stream(data).read_all()
+
+def export_bytes(table, fmt):
+    """Serialise a table for download in one of EXPORT_FORMATS"""
+    sink = pa.BufferOutputStream()
+    if fmt == 'parquet':
+        pq.write_table(table, sink, compression='zstd')
+    elif fmt == 'csv':
+        pa_csv.write_csv(table, sink)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the extraction and fill pipeline.
+
+Synthetic invoices (text-layer and rasterised PDFs, bordered and borderless
+tables, Excel inputs) are generated by synthetic_invoices.py and every
+pipeline stage is timed. The workbook fill is reported cold (populate_excel,
+template parts deflated on every run, as for a first export) and warm
+(populate_excel_warm, reusing them as later exports do). Results are written as JSON and can be compared
+against a stored baseline:
+
+    python benchmark.py                               # default matrix
+    python benchmark.py --pages 1 10 100 500 --repeat 3
+    python benchmark.py --save-baseline               # store bench_baseline.json
+    python benchmark.py --compare bench_baseline.json # exit 1 on regressions
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+import app
+import excel_utils
+import ocr_utils
+import synthetic_invoices
+import template_registry
+
+TEMPLATE_PATH = "IDI VIDE.xlsx"
+RESULTS_PATH = "bench_results.json"
+BASELINE_PATH = "bench_baseline.json"
+
+# Differences below this many seconds are noise, whatever the ratio
+MIN_SIGNIFICANT_DELTA = 0.005
+
+def time_stage(fn, repeat, setup=None):
+    """Run fn repeat times, calling setup (untimed) before each run; returns (timings, result of the last run)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+class Recorder:
+    """Collects one result entry per (case, stage)"""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, case, stage, fn, setup=None, **info):
+        timings, result = time_stage(fn, self.repeat, setup)
+        entry = {
+            'case': case,
+            'stage': stage,
+            'seconds': statistics.median(timings),
+            'min': min(timings),
+            'runs': len(timings),
+        }
+        entry.update(info)
+        self.results.append(entry)
+        print(f"  {stage:<24} {entry['seconds'] * 1000:10.1f} ms")
+        return result
+
+    def skip(self, case, stage, reason, **info):
+        entry = {'case': case, 'stage': stage, 'skipped': reason}
+        entry.update(info)
+        self.results.append(entry)
+        print(f"  {stage:<24} skipped ({reason})")
+
+def bench_pdf(rec, case, pdf_bytes, rows, pages, excel_headers, template_path):
+    """Time every stage of the PDF path on one synthetic document"""
+    info = {'pages': pages, 'rows': rows}
+    print(f"{case}: {pages} pages, {rows} lines")
+
+    needs = rec.run(case, 'needs_ocr', lambda: ocr_utils.needs_ocr(BytesIO(pdf_bytes)), **info)
+    source = pdf_bytes
+    if needs:
+        if shutil.which('tesseract') and shutil.which('pdftoppm'):
+            searchable = rec.run(case, 'ocr', lambda: ocr_utils.convert_to_searchable_pdf(BytesIO(pdf_bytes)), **info)
+            source = searchable.getvalue()
+        else:
+            # Keep timing table detection on the original document
+            rec.skip(case, 'ocr', 'tesseract/poppler not installed', **info)
+
+    headers = rec.run(case, 'get_pdf_headers', lambda: app.get_pdf_headers(BytesIO(source)), **info)
+    mapping = app.default_mapping(headers, excel_headers)
+    selected = sorted({h for cols in mapping.values() for h in cols})
+    if not selected:
+        rec.skip(case, 'extract_pdf_data', 'no table headers detected', **info)
+        return
+
+    data = rec.run(case, 'extract_pdf_data', lambda: app.extract_pdf_data(BytesIO(source), selected), **info)
+    bench_populate(rec, case, data, mapping, excel_headers, template_path, info)
+
+def bench_excel(rec, case, xlsx_bytes, rows, excel_headers, template_path):
+    """Time the Excel input path"""
+    info = {'rows': rows}
+    print(f"{case}: {rows} lines")
+    headers = rec.run(case, 'get_input_excel_headers',
+                      lambda: app.get_input_excel_headers(BytesIO(xlsx_bytes)), **info)
+    mapping = app.default_mapping(headers, excel_headers)
+    selected = sorted({h for cols in mapping.values() for h in cols})
+    data = rec.run(case, 'extract_input_excel_data',
+                   lambda: app.extract_input_excel_data(BytesIO(xlsx_bytes), selected), **info)
+    bench_populate(rec, case, data, mapping, excel_headers, template_path, info)
+
+def bench_populate(rec, case, data, mapping, excel_headers, template_path, info):
+    """Time the workbook fill for already extracted rows"""
+    if not data.num_rows:
+        rec.skip(case, 'populate_excel', 'no rows extracted', **info)
+        return
+
+    def populate():
+        output = app.populate_excel(data, template_path, mapping, excel_headers)
+        output.close()
+
+    # Cold: every run deflates the template parts around the data, as the
+    # first export of a row count does. Warm: later exports reuse them.
+    rec.run(case, 'populate_excel', populate, setup=excel_utils.clear_segment_cache,
+            extracted=data.num_rows, **info)
+    rec.run(case, 'populate_excel_warm', populate, extracted=data.num_rows, **info)
+
+def git_revision():
+    """Short commit hash of the benchmarked tree, if available"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, tolerance):
+    """Print per-stage ratios against baseline; returns the list of regressions"""
+    base = {(r['case'], r['stage']): r for r in baseline['results'] if 'seconds' in r}
+    regressions = []
+    print("\n" + "=" * 80)
+    print(f"COMPARISON AGAINST BASELINE ({baseline['meta'].get('revision')})")
+    print("=" * 80)
+    print(f"{'Case':<28} {'Stage':<24} {'Base ms':>10} {'New ms':>10} {'Ratio':>7}")
+    for r in results:
+        old = base.get((r['case'], r['stage']))
+        if old is None or 'seconds' not in r:
+            continue
+        ratio = r['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        flag = ""
+        if ratio > 1 + tolerance and r['seconds'] - old['seconds'] > MIN_SIGNIFICANT_DELTA:
+            flag = "  REGRESSION"
+            regressions.append(r)
+        print(f"{r['case']:<28} {r['stage']:<24} {old['seconds'] * 1000:10.1f} "
+              f"{r['seconds'] * 1000:10.1f} {ratio:7.2f}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100],
+                        help="page counts for text-layer PDFs (up to 500)")
+    parser.add_argument('--raster-pages', type=int, nargs='+', default=[1, 5],
+                        help="page counts for rasterised (OCR) PDFs")
+    parser.add_argument('--rows-per-page', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per stage; the median is reported")
+    parser.add_argument('--template', default=TEMPLATE_PATH)
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--compare', metavar='BASELINE', help="compare against a stored results file")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="allowed slowdown ratio before a stage is flagged (default 0.10)")
+    parser.add_argument('--save-baseline', action='store_true', help=f"also write {BASELINE_PATH}")
+    args = parser.parse_args()
+
+    rec = Recorder(args.repeat)
+    excel_headers = app.get_excel_headers(args.template)
+
+    rec.run('template', 'add_thin_border_styles', lambda: template_registry.add_thin_border_styles(args.template))
+    rec.run('template', 'read_excel_headers', lambda: template_registry.read_headers(args.template))
+
+    for pages in args.pages:
+        for bordered in (True, False):
+            pdf, rows = synthetic_invoices.make_text_pdf(pages, args.rows_per_page, bordered)
+            case = f"text-{'bordered' if bordered else 'borderless'}-{pages}p"
+            bench_pdf(rec, case, pdf, rows, pages, excel_headers, args.template)
+
+    for pages in args.raster_pages:
+        pdf, rows = synthetic_invoices.make_raster_pdf(pages, args.rows_per_page)
+        bench_pdf(rec, f"raster-{pages}p", pdf, rows, pages, excel_headers, args.template)
+
+    for pages in args.pages:
+        xlsx, rows = synthetic_invoices.make_excel_input(pages * args.rows_per_page)
+        bench_excel(rec, f"xlsx-{rows}r", xlsx, rows, excel_headers, args.template)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat,
+        },
+        'results': rec.results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {BASELINE_PATH}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(rec.results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# On-disk cache shared by the app, survives restarts
+CACHE_DIR = os.environ.get(
+    'DATA_ENTRY_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+)
+
+# Size limit of each disk LRU namespace (e.g. built workbooks)
+DISK_CACHE_MAX_MB = float(os.environ.get('DATA_ENTRY_DISK_CACHE_MAX_MB', '512'))
+
+# Streamlit re-executes app.py on every rerun, so in-process caches live here
+_memory_caches = {}
+
+# Sessions, job workers and API threads share the bounded caches
+_lru_lock = threading.Lock()
+
+def memory_cache(name):
+    """Return a process-wide dict that survives Streamlit script reruns"""
+    return _memory_caches.setdefault(name, {})
+
+def lru_get(name, key):
+    """Look up key in a bounded process-wide cache, marking it recently used"""
+    cache = memory_cache(name)
+    with _lru_lock:
+        if key not in cache:
+            return None
+        value = cache.pop(key)
+        cache[key] = value
+    return value
+
+def lru_put(name, key, value, max_entries):
+    """Store key in a bounded process-wide cache, evicting the least recently used"""
+    cache = memory_cache(name)
+    with _lru_lock:
+        cache.pop(key, None)
+        cache[key] = value
+        while len(cache) > max_entries:
+            del cache[next(iter(cache))]
+    return value
+
+def file_digest(path):
+    """SHA-256 of a file's content, memoised on (path, mtime, size)"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    digests = memory_cache('file_digest')
+    if key not in digests:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digests[key] = h.hexdigest()
+    return digests[key]
+
+def cache_path(*parts):
+    """Path inside CACHE_DIR, creating the parent directory"""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def write_atomic(path, content):
+    """Write bytes to path so concurrent readers never see a partial file"""
+    # A temporary file of its own per writer: threads of a process write concurrently
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def read_json(path):
+    """Load a JSON cache entry, or None if missing or unreadable"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json(path, obj):
+    """Store a JSON cache entry atomically"""
+    write_atomic(path, json.dumps(obj).encode('utf-8'))
+
+def disk_lru_get(namespace, name):
+    """Read an entry of a disk LRU namespace, or None; marks it recently used"""
+    path = os.path.join(CACHE_DIR, namespace, name)
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        # Recency is the file's mtime, so it survives restarts
+        os.utime(path)
+        return content
+    except OSError:
+        return None
+
+def disk_lru_put(namespace, name, content, max_bytes=None):
+    """Store an entry and evict the least recently used ones beyond max_bytes"""
+    write_atomic(cache_path(namespace, name), content)
+    evict(namespace, DISK_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes)
+
+def evict(namespace, max_bytes):
+    """Delete the oldest entries of a namespace until it fits in max_bytes"""
+    entries = []
+    try:
+        with os.scandir(os.path.join(CACHE_DIR, namespace)) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            # Already evicted by another process
+            pass
+        total -= size
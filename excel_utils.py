@@ -0,0 +1,585 @@
+import multiprocessing
+import os
+import re
+import struct
+import threading
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from openpyxl.formula.translate import Translator
+
+# Namespaces
+NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+SHARED_STRINGS_PATH = 'xl/sharedStrings.xml'
+
+# Part of the output cache key: bump whenever the same input and mapping
+# would produce different workbook bytes (writer or cell conversion changes)
+WRITER_VERSION = 5
+
+# zlib levels tried for each output compression policy. Higher levels are not
+# always smaller on the repetitive sheet XML, so 'smallest' keeps the shorter
+# of two candidates per member.
+COMPRESSION_POLICIES = {'fastest': (1,), 'balanced': (6,), 'smallest': (6, 9)}
+
+# Members above this size are split into chunks deflated in parallel threads
+PARALLEL_DEFLATE_CHUNK = 1024 * 1024
+
+# Fills with at least this many rows render their row XML in worker processes
+LARGE_FILL_MIN_ROWS = 20000
+
+# Rows per batch handed to a worker process when a streamed fill is parallel
+STREAM_BATCH_ROWS = 5000
+
+# Limits of the zip format without ZIP64 extensions, which _write_zip does not write
+ZIP_MAX_ENTRIES = 0xFFFF
+ZIP_MAX_SIZE = 0xFFFFFFFF
+
+# Rows and cells are matched by their r attribute; elements without one
+# (optional in the spec, never written by Excel) are refused, see _check_matched
+ROW_RE = re.compile(r'<row\b[^>]*?\br="(\d+)"[^>]*?(?:/>|>.*?</row>)', re.S)
+CELL_RE = re.compile(r'<c\b[^>]*?\br="([A-Z]+)\d+"[^>]*?(?:/>|>.*?</c>)', re.S)
+ATTR_RE = re.compile(r'([\w:]+)="([^"]*)"')
+
+class SharedStringTable:
+    """
+    Index of the template's xl/sharedStrings.xml.
+    Strings are interned once and referenced by index; new entries are
+    appended to the original part without re-serialising the existing ones.
+    """
+
+    def __init__(self, xml_content):
+        self._xml = xml_content
+        self._index = {}
+        self._new = []
+        self.unique_count = 0
+
+        # Only plain <si><t>..</t></si> entries can be reused. Rich text runs
+        # keep their slot (indices are positional) but are never matched.
+        for _, elem in ET.iterparse(BytesIO(xml_content), events=('end',)):
+            if elem.tag != f"{{{NS['x']}}}si":
+                continue
+            t_elem = elem.find('x:t', NS)
+            if t_elem is not None and elem.find('x:r', NS) is None:
+                self._index.setdefault(t_elem.text or "", self.unique_count)
+            self.unique_count += 1
+            elem.clear()
+
+        match = re.search(rb'<sst\b[^>]*\bcount="(\d+)"', xml_content)
+        self.count = int(match.group(1)) if match else self.unique_count
+
+    def add(self, text):
+        """Return the index of text, appending it if not yet in the table"""
+        text = str(text)
+        idx = self._index.get(text)
+        if idx is None:
+            idx = self.unique_count
+            self._index[text] = idx
+            self._new.append(text)
+            self.unique_count += 1
+        # count is the total number of references in the workbook
+        self.count += 1
+        return idx
+
+    def to_xml(self):
+        """Serialise the table, keeping the original entries byte for byte"""
+        head_end = self._xml.index(b'>', self._xml.index(b'<sst')) + 1
+        head = self._xml[:head_end]
+        head = re.sub(rb'\s(count|uniqueCount)="\d+"', b'', head)
+        head = head.replace(b'<sst', f'<sst count="{self.count}" uniqueCount="{self.unique_count}"'.encode(), 1)
+
+        parts = []
+        for text in self._new:
+            space = ' xml:space="preserve"' if text != text.strip() else ''
+            parts.append(f'<si><t{space}>{escape(text)}</t></si>')
+        appended = ''.join(parts).encode('utf-8')
+
+        body = self._xml[head_end:]
+        if head.endswith(b'/>'):
+            # Empty table written as <sst ... />
+            head = head[:-2] + b'>'
+            return head + appended + b'</sst>'
+        close_idx = body.rindex(b'</sst>')
+        return head + body[:close_idx] + appended + body[close_idx:]
+
+
+def _deflate_chunk(data, level, zdict, final):
+    """Raw-deflate one chunk; non-final chunks end on a byte boundary (sync flush)"""
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    out = compressor.compress(data)
+    return out + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+def _deflate(data, level, executor, final=True):
+    """
+    Deflate data, splitting large members into chunks compressed concurrently.
+    zlib releases the GIL, so the chunks really run in parallel. Each chunk is
+    primed with the last 32 KB of its predecessor to keep the ratio close to a
+    single-stream deflate; the concatenated chunks form one valid stream.
+    """
+    if len(data) <= PARALLEL_DEFLATE_CHUNK:
+        return _deflate_chunk(data, level, None, final)
+
+    view = memoryview(data)
+    futures = []
+    for start in range(0, len(data), PARALLEL_DEFLATE_CHUNK):
+        end = start + PARALLEL_DEFLATE_CHUNK
+        zdict = bytes(view[max(0, start - 32768):start])
+        futures.append(executor.submit(_deflate_chunk, view[start:end], level, zdict, final and end >= len(data)))
+    return b''.join(f.result() for f in futures)
+
+def _compress_member(data, levels, executor):
+    """Return (crc, size, compressed bytes) for one archive member"""
+    crc = zlib.crc32(data)
+    return crc, len(data), min((_deflate(data, level, executor) for level in levels), key=len)
+
+def _compress_stream(chunks, level):
+    """
+    Deflate an iterable of byte chunks as one member without joining them,
+    so only the compressed output is held in memory.
+    Returns (crc, size, compressed bytes).
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    crc = 0
+    size = 0
+    out = []
+    for chunk in chunks:
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        out.append(compressor.compress(chunk))
+    out.append(compressor.flush())
+    return crc, size, b''.join(out)
+
+class SheetSegments:
+    """
+    An archive member given as consecutive byte segments. Segments with a
+    cache key are deflated once and reused by later exports, e.g. the
+    template rows after the data, which only change with the row count.
+    segments: list of (bytes, cache key or None)
+    """
+
+    def __init__(self, segments):
+        self.segments = segments
+
+# Deflated segments by (cache key, level, final)
+_segment_cache = {}
+_segment_lock = threading.Lock()
+SEGMENT_CACHE_ENTRIES = 32
+
+def clear_segment_cache():
+    """Forget the deflated segments, e.g. to time a first export (see benchmark.py)"""
+    with _segment_lock:
+        _segment_cache.clear()
+
+def _compress_segments(member, levels, executor):
+    """Return (crc, size, compressed bytes), reusing cached segment payloads"""
+    crc = 0
+    size = 0
+    for data, _ in member.segments:
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+
+    candidates = []
+    for level in levels:
+        payloads = []
+        for i, (data, key) in enumerate(member.segments):
+            # Non-final segments end on a byte boundary, so they concatenate
+            final = i == len(member.segments) - 1
+            cache_key = (key, level, final) if key is not None else None
+            with _segment_lock:
+                payload = _segment_cache.get(cache_key) if cache_key is not None else None
+            if payload is None:
+                payload = _deflate(data, level, executor, final)
+                if cache_key is not None:
+                    with _segment_lock:
+                        while len(_segment_cache) >= SEGMENT_CACHE_ENTRIES:
+                            del _segment_cache[next(iter(_segment_cache))]
+                        _segment_cache[cache_key] = payload
+            payloads.append(payload)
+        candidates.append(b''.join(payloads))
+    return crc, size, min(candidates, key=len)
+
+def write_workbook(source_zip, target, replacements, policy='balanced'):
+    """
+    Write the members of source_zip to the binary file object target,
+    substituting the parts given in replacements ({member name: bytes}).
+    Every member is re-deflated at the level of the compression policy
+    ('fastest', 'balanced' or 'smallest'); members are compressed in
+    worker threads before the archive is assembled in the original order.
+    A replacement may also be SheetSegments, an iterator of byte chunks (see iter_sheet),
+    deflated as it is produced at the policy's first level, or a callable
+    returning bytes, called once every iterator has been consumed (for
+    parts such as shared strings that depend on the streamed sheet).
+    """
+    levels = COMPRESSION_POLICIES[policy]
+
+    with zipfile.ZipFile(source_zip, 'r') as zin:
+        infos = zin.infolist()
+        contents = [replacements[i.filename] if i.filename in replacements else zin.read(i.filename)
+                    for i in infos]
+
+    workers = min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Member tasks block on their chunk tasks, so chunks get their own
+        # pool; sharing one could deadlock with every worker waiting.
+        with ThreadPoolExecutor(max_workers=workers) as chunk_executor:
+            futures = {}
+            for i, data in enumerate(contents):
+                if isinstance(data, (bytes, bytearray)):
+                    futures[i] = executor.submit(_compress_member, data, levels, chunk_executor)
+                elif isinstance(data, SheetSegments):
+                    futures[i] = executor.submit(_compress_segments, data, levels, chunk_executor)
+            compressed = [None] * len(contents)
+            # Streamed members are consumed here, on the calling thread
+            for i, data in enumerate(contents):
+                if i not in futures and not callable(data):
+                    compressed[i] = _compress_stream(data, levels[0])
+            for i, data in enumerate(contents):
+                if callable(data):
+                    futures[i] = executor.submit(_compress_member, data(), levels, chunk_executor)
+            for i, future in futures.items():
+                compressed[i] = future.result()
+
+    _write_zip(target, infos, compressed)
+
+def _write_zip(target, infos, compressed):
+    """
+    Assemble a zip archive from already deflated members. Raises ValueError
+    past the limits of the format without ZIP64 (ZIP_MAX_ENTRIES members,
+    ZIP_MAX_SIZE bytes per member and for the archive).
+    """
+    if len(infos) > ZIP_MAX_ENTRIES:
+        raise ValueError(f"Workbook has {len(infos)} parts, more than a zip without ZIP64 holds")
+    total = sum(len(payload) + 30 + len(info.filename.encode('utf-8'))
+                for info, (_, _, payload) in zip(infos, compressed))
+    for info, (_, size, payload) in zip(infos, compressed):
+        if size > ZIP_MAX_SIZE or len(payload) > ZIP_MAX_SIZE:
+            raise ValueError(f"Workbook part {info.filename} is larger than 4 GiB, which needs ZIP64")
+    if total > ZIP_MAX_SIZE:
+        raise ValueError("Workbook is larger than 4 GiB, which needs ZIP64")
+    offset = 0
+    central = []
+    for info, (crc, size, payload) in zip(infos, compressed):
+        name = info.filename.encode('utf-8')
+        flags = 0x800 if not info.filename.isascii() else 0
+        t = info.date_time
+        dostime = t[3] << 11 | t[4] << 5 | (t[5] // 2)
+        dosdate = (t[0] - 1980) << 9 | t[1] << 5 | t[2]
+
+        header = struct.pack('<4s2B4HL2L2H', b'PK\x03\x04', 20, 0, flags, zipfile.ZIP_DEFLATED,
+                             dostime, dosdate, crc, len(payload), size, len(name), 0)
+        target.write(header)
+        target.write(name)
+        target.write(payload)
+
+        central.append(struct.pack('<4s4B4HL2L5H2L', b'PK\x01\x02', 20, info.create_system, 20, 0,
+                                   flags, zipfile.ZIP_DEFLATED, dostime, dosdate, crc, len(payload),
+                                   size, len(name), 0, 0, 0, info.internal_attr,
+                                   info.external_attr, offset) + name)
+        offset += len(header) + len(name) + len(payload)
+
+    central_dir = b''.join(central)
+    target.write(central_dir)
+    target.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(central), len(central),
+                             len(central_dir), offset, 0))
+
+def get_col_letter(col_idx):
+    """Convert 1-based column index to letter"""
+    string = ""
+    while col_idx > 0:
+        col_idx, remainder = divmod(col_idx - 1, 26)
+        string = chr(65 + remainder) + string
+    return string
+
+def get_col_index(col_letter):
+    """Convert column letter to 1-based index (e.g., A->1, AA->27)"""
+    idx = 0
+    for ch in col_letter:
+        idx = idx * 26 + ord(ch) - 64
+    return idx
+
+def _string_item_text(elem):
+    """Text of a shared string <si> or inline <is>: its runs joined, phonetic hints left out"""
+    texts = [elem.find('x:t', NS)] + [r.find('x:t', NS) for r in elem.findall('x:r', NS)]
+    return ''.join(t.text or '' for t in texts if t is not None)
+
+def _read_shared_strings(zin, indices):
+    """{index: text} of the given sharedStrings.xml entries; parsing stops after the last one"""
+    strings = {}
+    if not indices or SHARED_STRINGS_PATH not in zin.namelist():
+        return strings
+    last = max(indices)
+    si_tag = f"{{{NS['x']}}}si"
+    position = 0
+    with zin.open(SHARED_STRINGS_PATH) as f:
+        for _, elem in ET.iterparse(f, events=('end',)):
+            if elem.tag != si_tag:
+                continue
+            if position in indices:
+                strings[position] = _string_item_text(elem)
+            if position >= last:
+                break
+            position += 1
+            elem.clear()
+    return strings
+
+def read_row(source_zip, sheet_path, row_idx):
+    """
+    {col_idx: value} of one row of a worksheet, without loading the workbook:
+    the sheet is streamed only until the row has been passed, and shared
+    strings are resolved by reading sharedStrings.xml up to the last entry
+    the row references. Values are typed as openpyxl reads them (str, int,
+    float, bool; formulas as '=...' text).
+    """
+    row_tag, cell_tag = f"{{{NS['x']}}}row", f"{{{NS['x']}}}c"
+    values = {}
+    shared = {}
+    shared_formulas = {}
+    with zipfile.ZipFile(source_zip, 'r') as zin:
+        with zin.open(sheet_path) as f:
+            current_row = 0
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                if elem.tag != row_tag:
+                    continue
+                if event == 'start':
+                    current_row = int(elem.get('r', current_row + 1))
+                    if current_row > row_idx:
+                        break
+                    continue
+                for cell in elem.iter(cell_tag):
+                    f_elem = cell.find('x:f', NS)
+                    if current_row < row_idx and f_elem is not None and f_elem.get('t') == 'shared' and f_elem.text:
+                        # Shared formula master: later cells of its range only reference it
+                        shared_formulas[f_elem.get('si')] = ('=' + f_elem.text, cell.get('r'))
+                if current_row == row_idx:
+                    col_idx = 0
+                    for cell in elem.iter(cell_tag):
+                        ref = cell.get('r')
+                        col_idx = get_col_index(ref.rstrip('0123456789')) if ref else col_idx + 1
+                        cell_type = cell.get('t', 'n')
+                        if cell_type == 'inlineStr':
+                            is_elem = cell.find('x:is', NS)
+                            if is_elem is not None:
+                                values[col_idx] = _string_item_text(is_elem)
+                            continue
+                        f_elem = cell.find('x:f', NS)
+                        if f_elem is not None and f_elem.text:
+                            values[col_idx] = '=' + f_elem.text
+                            continue
+                        if f_elem is not None and f_elem.get('si') in shared_formulas:
+                            formula, origin = shared_formulas[f_elem.get('si')]
+                            values[col_idx] = Translator(formula, origin=origin).translate_formula(ref)
+                            continue
+                        v = cell.findtext('x:v', namespaces=NS)
+                        if v is None:
+                            continue
+                        if cell_type == 's':
+                            shared[col_idx] = int(v)
+                        elif cell_type == 'b':
+                            values[col_idx] = bool(int(v))
+                        elif cell_type == 'n':
+                            values[col_idx] = float(v) if any(c in v for c in '.eE') else int(v)
+                        else:
+                            values[col_idx] = v
+                    break
+                elem.clear()
+        strings = _read_shared_strings(zin, set(shared.values()))
+    for col_idx, index in shared.items():
+        values[col_idx] = strings.get(index)
+    return dict(sorted(values.items()))
+
+def split_sheet(sheet_xml):
+    """
+    Split worksheet XML (str) around the rows of sheetData.
+    Returns (head, rows, tail) where rows is a list of (row_idx, row_xml)
+    in document order; head + rows + tail reproduces the sheet.
+    """
+    data_start = sheet_xml.index('<sheetData')
+    open_end = sheet_xml.index('>', data_start) + 1
+    if sheet_xml[open_end - 2:open_end] == '/>':
+        # Empty <sheetData/>: open it up so rows can be inserted
+        return sheet_xml[:open_end - 2] + '>', [], '</sheetData>' + sheet_xml[open_end:]
+
+    close_start = sheet_xml.index('</sheetData>', open_end)
+    matches = list(ROW_RE.finditer(sheet_xml, open_end, close_start))
+    _check_matched(sheet_xml, open_end, close_start, matches, "sheetData has a <row> without an r attribute")
+    rows = [(int(m.group(1)), m.group(0)) for m in matches]
+    return sheet_xml[:open_end], rows, sheet_xml[close_start:]
+
+def _check_matched(text, start, end, matches, message):
+    """Raise ValueError if text[start:end] holds anything but whitespace outside the matches"""
+    pos = start
+    for m in matches:
+        if text[pos:m.start()].strip():
+            raise ValueError(message)
+        pos = m.end()
+    if text[pos:end].strip():
+        raise ValueError(message)
+
+def render_cell(cell_ref, template_cell, val_type, value, style):
+    """
+    Render one <c> element, keeping the template cell's other attributes.
+    val_type: 'str' (inline string), 's' (shared string index) or 'num'
+    style: cellXfs index to apply, or None to keep the template's
+    """
+    attrs = {'r': cell_ref}
+    if template_cell is not None:
+        open_tag = template_cell[:template_cell.index('>')]
+        attrs.update(ATTR_RE.findall(open_tag))
+        attrs['r'] = cell_ref
+    attrs.pop('t', None)
+    if style is not None:
+        attrs['s'] = str(style)
+
+    if val_type == 'str':
+        attrs['t'] = 'inlineStr'
+        body = f"<is><t>{escape(str(value))}</t></is>"
+    elif val_type == 's':
+        attrs['t'] = 's'
+        body = f"<v>{value}</v>"
+    else:
+        body = f"<v>{value}</v>"
+
+    attr_str = ' '.join(f'{k}="{v}"' for k, v in attrs.items())
+    return f"<c {attr_str}>{body}</c>"
+
+def render_row(row_idx, template_row, cells):
+    """
+    Merge cells into a template <row> and return the row XML.
+    template_row: the row's XML from the template, or None for a new row
+    cells: list of (col_idx, val_type, value, style)
+    """
+    existing = {}
+    if template_row is None:
+        open_tag = f'<row r="{row_idx}">'
+    elif template_row.endswith('/>') and template_row.index('>') == len(template_row) - 1:
+        open_tag = template_row[:-2] + '>'
+    else:
+        open_end = template_row.index('>') + 1
+        open_tag = template_row[:open_end]
+        body = template_row[open_end:-len('</row>')]
+        matches = list(CELL_RE.finditer(body))
+        if sum(m.end() - m.start() for m in matches) != len(body):
+            # Only whitespace may sit between the cells, or data would be dropped
+            _check_matched(body, 0, len(body), matches, f"row {row_idx} has a <c> without an r attribute")
+        for m in matches:
+            existing[get_col_index(m.group(1))] = m.group(0)
+
+    for col_idx, val_type, value, style in cells:
+        cell_ref = f"{get_col_letter(col_idx)}{row_idx}"
+        existing[col_idx] = render_cell(cell_ref, existing.get(col_idx), val_type, value, style)
+
+    # Cells must be in column order for Excel
+    return open_tag + ''.join(existing[c] for c in sorted(existing)) + '</row>'
+
+def render_row_range(first_row, template_rows, cell_rows):
+    """Render a contiguous range of rows; runs inside worker processes"""
+    return ''.join(render_row(first_row + i, template_row, cells)
+                   for i, (template_row, cells) in enumerate(zip(template_rows, cell_rows)))
+
+_process_pool = None
+
+def _get_process_pool():
+    """Lazily started pool, reused across exports (spawn is safe in threaded servers)"""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _process_pool
+
+def fill_sheet(layout, start_row, cell_rows, large_fill=None, cache_key=None):
+    """
+    Write prepared cells into the sheet starting at start_row.
+    layout: (head, rows, tail) from split_sheet
+    cell_rows: one list of (col_idx, val_type, value, style) per data row
+    large_fill: render contiguous row ranges in worker processes; None
+    enables it automatically from LARGE_FILL_MIN_ROWS rows on multi-core hosts
+    cache_key: identifies the layout (e.g. template digest); if given, returns
+    SheetSegments whose template parts are deflated once per row count
+    Returns the worksheet XML as UTF-8 bytes, or SheetSegments.
+    """
+    head, rows, tail = layout
+    end_row = start_row + len(cell_rows)
+    template_rows = dict(rows)
+    data_template_rows = [template_rows.get(r) for r in range(start_row, end_row)]
+
+    workers = os.cpu_count() or 1
+    if large_fill is None:
+        large_fill = len(cell_rows) >= LARGE_FILL_MIN_ROWS and workers > 1
+
+    if large_fill and workers > 1:
+        # One contiguous range per worker; fragments are joined in order
+        size = -(-len(cell_rows) // workers)
+        pool = _get_process_pool()
+        futures = [pool.submit(render_row_range, start_row + i,
+                               data_template_rows[i:i + size], cell_rows[i:i + size])
+                   for i in range(0, len(cell_rows), size)]
+        fragments = [f.result() for f in futures]
+    else:
+        fragments = [render_row_range(start_row, data_template_rows, cell_rows)]
+
+    before = head + ''.join(xml for r, xml in rows if r < start_row)
+    after = ''.join(xml for r, xml in rows if r >= end_row) + tail
+    if cache_key is not None:
+        # The template parts around the data only depend on the row count
+        return SheetSegments([
+            (before.encode('utf-8'), (cache_key, 'before', start_row)),
+            (''.join(fragments).encode('utf-8'), None),
+            (after.encode('utf-8'), (cache_key, 'after', end_row)),
+        ])
+    return (before + ''.join(fragments) + after).encode('utf-8')
+
+def iter_sheet(layout, start_row, cell_row_chunks, large_fill=False):
+    """
+    Streaming variant of fill_sheet: yields the worksheet XML as UTF-8
+    chunks, one per batch of cell rows, so the full sheet is never held as
+    one string and rows can be written while later ones are still being
+    extracted. Pass the iterator to write_workbook.
+    cell_row_chunks: iterable of lists of cell rows (see fill_sheet)
+    large_fill: render batches of STREAM_BATCH_ROWS in worker processes while
+    the next rows are produced; None switches to it once the stream has
+    passed LARGE_FILL_MIN_ROWS rows (multi-core hosts only)
+    """
+    head, rows, tail = layout
+    template_rows = dict(rows)
+    workers = os.cpu_count() or 1
+    pending = []  # in-order futures of batches rendered in worker processes
+    batch = []
+    batch_start = start_row
+
+    def submit(first_row, cell_rows):
+        templates = [template_rows.get(first_row + j) for j in range(len(cell_rows))]
+        pending.append(_get_process_pool().submit(render_row_range, first_row, templates, cell_rows))
+
+    yield (head + ''.join(xml for r, xml in rows if r < start_row)).encode('utf-8')
+    end_row = start_row
+    for cell_rows in cell_row_chunks:
+        if not cell_rows:
+            continue
+        parallel = workers > 1 and (large_fill or (large_fill is None and
+                                                   end_row - start_row >= LARGE_FILL_MIN_ROWS))
+        if parallel:
+            if not batch:
+                batch_start = end_row
+            batch.extend(cell_rows)
+            if len(batch) >= STREAM_BATCH_ROWS:
+                submit(batch_start, batch)
+                batch = []
+            # Emit finished batches in order, keeping a bounded number in flight
+            while pending and (pending[0].done() or len(pending) > 2 * workers):
+                yield pending.pop(0).result().encode('utf-8')
+        else:
+            templates = [template_rows.get(end_row + j) for j in range(len(cell_rows))]
+            yield render_row_range(end_row, templates, cell_rows).encode('utf-8')
+        end_row += len(cell_rows)
+    if batch:
+        submit(batch_start, batch)
+    for future in pending:
+        yield future.result().encode('utf-8')
+    yield (''.join(xml for r, xml in rows if r >= end_row) + tail).encode('utf-8')
@@ -0,0 +1,117 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import arrow_utils
+import cache_utils
+
+# Extraction results by document hash; survives restarts
+DB_PATH = os.environ.get('EXTRACTION_DB_PATH', os.path.join(cache_utils.CACHE_DIR, 'extractions.sqlite3'))
+
+# Bump when app's extraction logic or the row format changes, so stored rows are re-extracted
+EXTRACTOR_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    digest TEXT PRIMARY KEY,
+    file_name TEXT,
+    file_type TEXT,
+    settings TEXT,
+    headers TEXT,
+    rows BLOB,
+    row_count INTEGER,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    seen_count INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+_lock = threading.Lock()
+_initialised = False
+
+def _connect():
+    global _initialised
+    if not _initialised:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if not _initialised:
+        with conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+        _initialised = True
+    return conn
+
+def settings(used_ocr=False):
+    """Extraction settings a stored result must match to be reused"""
+    return {'extractor': EXTRACTOR_VERSION, 'ocr': bool(used_ocr)}
+
+def lookup(digest):
+    """
+    Stored extraction of a document: dict with headers, rows (pyarrow Table), settings,
+    file_name, row_count... or None if it was never extracted with the
+    current extractor
+    """
+    with _lock:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT * FROM documents WHERE digest = ?", (digest,)).fetchone()
+        finally:
+            conn.close()
+    if row is None or row['rows'] is None:
+        return None
+    record = dict(row)
+    record['settings'] = json.loads(record['settings'])
+    if record['settings'].get('extractor') != EXTRACTOR_VERSION:
+        return None
+    record['headers'] = json.loads(record['headers'])
+    record['rows'] = arrow_utils.from_ipc(record['rows'])
+    return record
+
+def save(digest, file_name, file_type, headers, rows, used_ocr=False):
+    """Store the header row and the extracted rows (pyarrow Table) of a document"""
+    now = time.time()
+    payload = arrow_utils.to_ipc(rows)
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO documents (digest, file_name, file_type, settings, headers, rows, row_count, "
+                    "first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(digest) DO UPDATE SET settings = excluded.settings, headers = excluded.headers, "
+                    "rows = excluded.rows, row_count = excluded.row_count",
+                    (digest, file_name, file_type, json.dumps(settings(used_ocr)), json.dumps(headers),
+                     payload, rows.num_rows, now, now)
+                )
+        finally:
+            conn.close()
+
+def mark_seen(digest, file_name, file_type):
+    """
+    Record an upload of a document. Returns the earlier sightings as a dict
+    (file_name, first_seen, last_seen, seen_count) if it is a duplicate,
+    otherwise None.
+    """
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                previous = conn.execute(
+                    "SELECT file_name, first_seen, last_seen, seen_count FROM documents WHERE digest = ?",
+                    (digest,)
+                ).fetchone()
+                conn.execute(
+                    "INSERT INTO documents (digest, file_name, file_type, first_seen, last_seen, seen_count) "
+                    "VALUES (?, ?, ?, ?, ?, 1) "
+                    "ON CONFLICT(digest) DO UPDATE SET last_seen = excluded.last_seen, seen_count = seen_count + 1",
+                    (digest, file_name, file_type, now, now)
+                )
+        finally:
+            conn.close()
+    if previous is None or not previous['seen_count']:
+        return None
+    return dict(previous)
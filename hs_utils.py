@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+HS code lookup for goods descriptions, through an inverted token index over
+a local nomenclature file: a CSV with the code in the first column and its
+description in the second (e.g. the tariff, or the lines of past
+declarations). No nomenclature ships with the app; without the file,
+lookups are disabled and load_error says why, for the app and the API to
+show.
+
+    python hs_utils.py "BRAKE PAD DY100 STEEL" [more descriptions ...]
+"""
+import csv
+import math
+import os
+import re
+import sys
+import threading
+import unicodedata
+
+import numpy as np
+
+import cache_utils
+
+NOMENCLATURE_PATH = os.environ.get('HS_NOMENCLATURE_PATH', 'hs_nomenclature.csv')
+
+# Lowest score accepted as a match: the share of a description's words
+# (idf-weighted) found in the code's nomenclature text. Words unknown to
+# the nomenclature weigh as the rarest ones; model numbers (words with
+# digits) are left out.
+MIN_SCORE = 0.5
+
+# Descriptions whose result is memoised per index
+LOOKUP_CACHE_ENTRIES = 50000
+
+TOKEN_RE = re.compile(r'[A-Z0-9]+')
+STOPWORDS = {
+    'A', 'AU', 'AUX', 'AVEC', 'DE', 'DES', 'DU', 'EN', 'ET', 'LA', 'LE', 'LES', 'OU', 'PAR', 'POUR', 'SANS', 'SUR',
+    'AND', 'FOR', 'IN', 'OF', 'ON', 'OR', 'THE', 'WITH', 'WITHOUT', 'OTHER', 'AUTRES', 'AUTRE',
+}
+
+def tokens(text):
+    """Normalised words of a description: uppercased, accents and plural S removed"""
+    text = unicodedata.normalize('NFKD', str(text).upper())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    words = set()
+    for word in TOKEN_RE.findall(text):
+        if len(word) < 2 or word.isdigit() or word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('S') and not word.endswith('SS'):
+            word = word[:-1]
+        words.add(word)
+    return words
+
+def read_nomenclature(path):
+    """[(code, description)] of a nomenclature CSV; codes keep their digits only"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        # Descriptions hold commas: the separator is told by the first line
+        first_line = f.readline()
+        f.seek(0)
+        delimiter = next((d for d in '\t;' if d in first_line), ',')
+        entries = []
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) < 2:
+                continue
+            code = re.sub(r'\D', '', row[0])
+            # Header lines and chapter titles have no code
+            if len(code) >= 2:
+                entries.append((code, row[1].strip()))
+    return entries
+
+class HSIndex:
+    """
+    Inverted index of a nomenclature: token -> ids of the codes whose
+    description (with those of their parent headings) holds it. Only the
+    most detailed codes are returned, as declarations need them.
+    """
+
+    def __init__(self, entries, digest=None):
+        self.digest = digest
+        descriptions = {}
+        for code, description in entries:
+            descriptions.setdefault(code, description)
+
+        # Leaf descriptions are often just "- - Autres": add the parents' words
+        codes = sorted(descriptions)
+        leaves = [c for i, c in enumerate(codes) if i + 1 == len(codes) or not codes[i + 1].startswith(c)]
+        postings = {}
+        for entry_id, code in enumerate(leaves):
+            words = set()
+            for length in range(2, len(code) + 1):
+                if code[:length] in descriptions:
+                    words |= tokens(descriptions[code[:length]])
+            for word in words:
+                postings.setdefault(word, []).append(entry_id)
+
+        self.codes = leaves
+        count = max(len(leaves), 1)
+        self.idf = {word: math.log(1 + count / len(ids)) for word, ids in postings.items()}
+        self.unknown_idf = math.log(1 + count)
+        self.postings = {word: np.array(ids, dtype=np.int32) for word, ids in postings.items()}
+        # Token weight of each entry's text
+        self.weights = np.zeros(len(leaves))
+        for word, ids in self.postings.items():
+            self.weights[ids] += self.idf[word]
+        self._cache = {}
+
+    def lookup(self, description):
+        """(code, score) of the best match for a description, or (None, score)"""
+        if description in self._cache:
+            return self._cache[description]
+        words = []
+        unknown = 0.0
+        for word in tokens(description):
+            if word in self.postings:
+                words.append(word)
+            elif word.isalpha():
+                unknown += self.unknown_idf
+        result = (None, 0.0)
+        if words:
+            ids = np.concatenate([self.postings[w] for w in words])
+            weights = np.repeat([self.idf[w] for w in words], [len(self.postings[w]) for w in words])
+            candidates, inverse = np.unique(ids, return_inverse=True)
+            shared = np.bincount(inverse, weights=weights)
+            scores = np.round(shared / (sum(self.idf[w] for w in words) + unknown), 9)
+            # Ties go to the code with the shortest text, the most specific
+            best = np.lexsort((self.weights[candidates], -scores))[0]
+            score = float(scores[best])
+            result = (self.codes[candidates[best]] if score >= MIN_SCORE else None, score)
+        if len(self._cache) >= LOOKUP_CACHE_ENTRIES:
+            self._cache.clear()
+        self._cache[description] = result
+        return result
+
+    def lookup_many(self, descriptions):
+        """Best code (or None) per description; repeated descriptions are scored once"""
+        return [self.lookup(d)[0] if d else None for d in descriptions]
+
+_index = None
+_version = None
+_error = None
+_lock = threading.Lock()
+
+# Why get_index last returned None (missing, unreadable or empty file), or
+# None when the nomenclature loaded; shown by the app and the API
+load_error = None
+
+def get_index(path=None):
+    """
+    The index of the nomenclature at path (default: NOMENCLATURE_PATH),
+    rebuilt when the file changes; None if it is missing, unreadable or
+    holds no codes (see load_error)
+    """
+    global _index, _version, _error, load_error
+    path = NOMENCLATURE_PATH if path is None else path
+    try:
+        stat = os.stat(path)
+    except OSError:
+        load_error = f"No HS nomenclature at '{path}' (set HS_NOMENCLATURE_PATH)"
+        return None
+    version = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        if _version != version:
+            _index = None
+            try:
+                entries = read_nomenclature(path)
+                if entries:
+                    _index = HSIndex(entries, cache_utils.file_digest(path))
+                    _error = None
+                else:
+                    _error = f"HS nomenclature '{path}' holds no codes"
+            except (OSError, UnicodeDecodeError, csv.Error) as e:
+                _error = f"Could not load HS nomenclature '{path}': {e}"
+            _version = version
+        load_error = _error
+        return _index
+
+if __name__ == '__main__':
+    index = get_index()
+    if index is None:
+        print(load_error)
+        sys.exit(1)
+    print(f"{len(index.codes)} codes, {len(index.postings)} tokens")
+    for description in sys.argv[1:]:
+        code, score = index.lookup(description)
+        print(f"{description}: {code or '-'} ({score:.2f})")
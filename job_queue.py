@@ -0,0 +1,199 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cache_utils
+
+# Job records live in SQLite, results as files next to it; no broker needed
+DB_PATH = os.environ.get('JOB_DB_PATH', os.path.join(cache_utils.CACHE_DIR, 'jobs.sqlite3'))
+RESULTS_DIR = os.path.join(os.path.dirname(DB_PATH), 'job_results')
+
+# Jobs running at once across all sessions; the rest wait in the queue
+MAX_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+
+# Finished jobs and their results are purged after this many seconds
+RETENTION_S = int(os.environ.get('JOB_RETENTION_S', str(24 * 3600)))
+
+# Long-running servers purge on submit, at most once per this many seconds
+PURGE_INTERVAL_S = int(os.environ.get('JOB_PURGE_INTERVAL_S', '600'))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    error TEXT,
+    meta TEXT,
+    result_path TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+_lock = threading.Lock()
+_executor = None
+_last_purge = 0.0
+
+class JobCancelled(Exception):
+    """Raised inside a job when its cancellation has been requested"""
+
+class JobContext:
+    """Handle passed to a running job to report progress and check for cancellation"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def progress(self, done, total=None, message=None):
+        """Record progress (e.g. pages done of total); raises JobCancelled if cancelled"""
+        fields = {'done': done}
+        if total is not None:
+            fields['total'] = total
+        if message is not None:
+            fields['message'] = message
+        _update(self.job_id, **fields)
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if _query("SELECT cancel_requested FROM jobs WHERE id = ?", (self.job_id,))[0]['cancel_requested']:
+            raise JobCancelled()
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _query(sql, params=()):
+    with _lock:
+        conn = _connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+def _execute(sql, params=()):
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(sql, params)
+        finally:
+            conn.close()
+
+def _update(job_id, **fields):
+    fields['updated'] = time.time()
+    assignments = ', '.join(f"{name} = ?" for name in fields)
+    _execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+def _init():
+    """Create the database and the worker pool once per process"""
+    global _executor
+    with _lock:
+        if _executor is not None:
+            return _executor
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(_SCHEMA)
+                # Job callables do not survive a restart
+                conn.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE status IN (?, ?)",
+                             (FAILED, "Interrupted by a server restart", time.time(), QUEUED, RUNNING))
+        finally:
+            conn.close()
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='job')
+    purge()
+    return _executor
+
+def submit(kind, fn, *args, **kwargs):
+    """
+    Queue fn(context, *args, **kwargs) and return the job id.
+    fn returns (result_bytes, meta): result_bytes is stored as the job's
+    result file (may be None), meta is a JSON-serialisable dict.
+    """
+    executor = _init()
+    if time.time() - _last_purge >= PURGE_INTERVAL_S:
+        purge()
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    _execute("INSERT INTO jobs (id, kind, status, created, updated) VALUES (?, ?, ?, ?, ?)",
+             (job_id, kind, QUEUED, now, now))
+    executor.submit(_run, job_id, fn, args, kwargs)
+    return job_id
+
+def _run(job_id, fn, args, kwargs):
+    context = JobContext(job_id)
+    try:
+        context.check_cancelled()
+        _update(job_id, status=RUNNING)
+        result, meta = fn(context, *args, **kwargs)
+        result_path = None
+        if result is not None:
+            result_path = os.path.join(RESULTS_DIR, job_id)
+            cache_utils.write_atomic(result_path, result)
+        _update(job_id, status=DONE, result_path=result_path, meta=json.dumps(meta or {}, default=str))
+    except JobCancelled:
+        _update(job_id, status=CANCELLED, message="Cancelled")
+    except Exception as e:
+        traceback.print_exc()
+        _update(job_id, status=FAILED, error=str(e))
+
+def get(job_id):
+    """Job record as a dict (meta decoded), or None"""
+    _init()
+    rows = _query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    if not rows:
+        return None
+    job = dict(rows[0])
+    job['meta'] = json.loads(job['meta']) if job['meta'] else {}
+    return job
+
+def result(job_id):
+    """Result bytes of a finished job, or None"""
+    job = get(job_id)
+    if job is None or job['status'] != DONE or not job['result_path']:
+        return None
+    try:
+        with open(job['result_path'], 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def cancel(job_id):
+    """Request cancellation; queued jobs never start, running ones stop at their next progress report"""
+    _init()
+    _execute("UPDATE jobs SET cancel_requested = 1, updated = ? WHERE id = ? AND status IN (?, ?)",
+             (time.time(), job_id, QUEUED, RUNNING))
+
+def queue_position(job_id):
+    """Number of queued jobs submitted before job_id"""
+    rows = _query("SELECT COUNT(*) AS n FROM jobs WHERE status = ? AND created < "
+                  "(SELECT created FROM jobs WHERE id = ?)", (QUEUED, job_id))
+    return rows[0]['n']
+
+def purge(max_age=None):
+    """Delete finished jobs (and their result files) older than max_age seconds"""
+    global _last_purge
+    _last_purge = time.time()
+    cutoff = time.time() - (RETENTION_S if max_age is None else max_age)
+    old = _query("SELECT id, result_path FROM jobs WHERE updated < ? AND status IN (?, ?, ?)",
+                 (cutoff, *FINISHED))
+    for row in old:
+        if row['result_path']:
+            try:
+                os.remove(row['result_path'])
+            except OSError:
+                pass
+        _execute("DELETE FROM jobs WHERE id = ?", (row['id'],))
@@ -1,15 +1,11 @@
-import openpyxl
+import excel_utils
 
-def list_headers(file_path):
-    wb = openpyxl.load_workbook(file_path)
-    ws = wb[wb.sheetnames[1]]
-    
-    print(f"Sheet: {ws.title}")
-    header_row = 5
+def list_headers(file_path, sheet_path='xl/worksheets/sheet2.xml', header_row=5):
+    # Only the sheet's first rows and the strings they use are read
+    print(f"Sheet: {sheet_path}")
     
     headers = []
-    for col in range(1, ws.max_column + 1):
-        val = ws.cell(header_row, col).value
+    for col, val in excel_utils.read_row(file_path, sheet_path, header_row).items():
         if val:
             headers.append((col, str(val).strip()))
             print(f"Col {col}: {val}")
@@ -0,0 +1,230 @@
+"""
+Automatic column mapping: input headers are matched to template columns by
+trigram similarity with known synonyms of each column and with the headers
+users mapped to it before. All (template column x input header) pairs are
+scored in one pass over a trigram index.
+"""
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+import cache_utils
+
+# Lowest similarity (Dice coefficient of the trigram sets) suggested
+MIN_SCORE = 0.7
+
+# Header names known for each template column, keyed by a phrase of the
+# column's name. Columns without an entry (e.g. the line number, which
+# holds formulas) are only suggested once users have mapped them.
+SYNONYMS = {
+    'code sh': ['hs code', 'hs', 'hts code', 'tariff code', 'customs code', 'code sh', 'nomenclature'],
+    'description': ['description', 'product', 'products', 'product name', 'product models', 'model', 'models',
+                    'material', 'materials', 'goods', 'goods description', 'item description',
+                    'designation', 'article', 'commodity', 'libelle'],
+    'valeur': ['amount', 'total amount', 'total', 'line total', 'total value', 'value', 'valeur', 'montant',
+               'montant total'],
+    'quantité': ['qty', "q'ty", 'quantity', 'quantite', 'qte', 'pcs', 'pieces'],
+    'unité': ['unit', 'uom', 'unit of measure', 'units', 'unite', 'unite de mesure'],
+    'pays': ['origin', 'country', 'country of origin', 'made in', "pays d'origine", 'origine'],
+    'fournisseur': ['supplier', 'vendor', 'seller', 'shipper', 'exporter', 'manufacturer', 'fournisseur'],
+    'usagé': ['used', 'new used', 'condition', 'usage'],
+    'poids net': ['net weight', 'n w', 'nw', 'net wt', 'poids net', 'net kg'],
+    'poids brut': ['gross weight', 'g w', 'gw', 'gross wt', 'poids brut', 'gross kg'],
+    'nombre de colis': ['ctn', 'ctns', 'carton', 'cartons', 'packages', 'pkgs', 'colis', 'nombre de colis',
+                        'no of cartons', 'number of packages'],
+    'type de colis': ['package type', 'packing', 'packaging', 'type de colis'],
+}
+
+# Header names of the line number column, as told apart by the extractor:
+# never suggested for a template column
+LINE_NUMBER_HEADERS = ('no', 'no.', 'item', '#', 'n°', 'pos')
+
+# Input headers that are not template data (line numbers, unit prices,
+# pictures): a header closest to one of these is left unmapped
+IGNORED = list(LINE_NUMBER_HEADERS) + ['n', 'item no', 'line', 'line no', 'ref', 'unit price', 'price', 'photo',
+                                       'photos', 'picture', 'image', 'remark', 'remarks']
+
+# Columns whose mapped inputs are joined (descriptions); the others keep
+# their best input only
+MULTI_INPUT = ('description',)
+
+# A learned mapping of a header is suggested once its weight reaches
+# LEARNED_MIN_WEIGHT and is more than half of the header's total weight.
+# Each new mapping of a header adds 1 to its column and multiplies the
+# weights of its other columns by LEARNED_DECAY, so newer mappings replace
+# older ones; weights below LEARNED_DROP_WEIGHT are forgotten.
+LEARNED_MIN_WEIGHT = 2.0
+LEARNED_DECAY = 0.5
+LEARNED_DROP_WEIGHT = 0.1
+
+# Input headers remembered
+LEARNED_HEADERS = 2000
+
+def normalize(text):
+    """Lowercase words without accents or punctuation"""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+def trigrams(text):
+    """Trigrams of each word padded as '  word ' (as pg_trgm)"""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def _column_key(col_name):
+    """Key of a template column in SYNONYMS and in the learned mappings"""
+    name = col_name.lower()
+    return next((k for k in SYNONYMS if k in name), normalize(col_name))
+
+class TrigramIndex:
+    """
+    Trigram -> ids of the known names (synonyms and learned headers) of
+    the template columns, with the trigram count of each name
+    """
+
+    def __init__(self, names):
+        # names: [(template column or None for IGNORED, name)]
+        self.columns = [col for col, _ in names]
+        self.sizes = np.zeros(len(names))
+        postings = {}
+        for name_id, (_, name) in enumerate(names):
+            grams = trigrams(name)
+            self.sizes[name_id] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(name_id)
+        self.postings = {gram: np.array(ids, dtype=np.int64) for gram, ids in postings.items()}
+
+    def scores(self, headers):
+        """(headers x names) matrix of Dice similarities"""
+        header_ids = []
+        name_ids = []
+        sizes = np.zeros(len(headers))
+        for header_id, header in enumerate(headers):
+            grams = trigrams(header)
+            sizes[header_id] = len(grams)
+            for gram in grams:
+                ids = self.postings.get(gram)
+                if ids is not None:
+                    name_ids.append(ids)
+                    header_ids.append(np.full(len(ids), header_id))
+        count = len(self.columns)
+        shared = np.zeros(len(headers) * count)
+        if name_ids:
+            # Shared trigrams of every pair, counted at once
+            cells = np.concatenate(header_ids) * count + np.concatenate(name_ids)
+            shared = np.bincount(cells, minlength=len(headers) * count).astype(float)
+        shared = shared.reshape(len(headers), count)
+        total = sizes[:, None] + self.sizes[None, :]
+        return np.divide(2 * shared, total, out=np.zeros_like(shared), where=total > 0)
+
+_learned_lock = threading.Lock()
+
+def _learned_path():
+    return cache_utils.cache_path('mappings', 'learned.json')
+
+def learned_mappings():
+    """
+    {'version': n, 'headers': {input header: {column key: weight}}} of past
+    mappings; the column key is '' for headers left unmapped
+    """
+    learned = cache_utils.read_json(_learned_path()) or {}
+    if 'headers' not in learned:
+        return {'version': 0, 'headers': {}}
+    return learned
+
+def learned_columns(learned=None):
+    """{input header: column key (or '' for unmapped)} of the confirmed learned mappings"""
+    learned = learned_mappings() if learned is None else learned
+    confirmed = {}
+    for header, weights in learned['headers'].items():
+        key, weight = max(weights.items(), key=lambda item: item[1])
+        if weight >= LEARNED_MIN_WEIGHT and weight > sum(weights.values()) / 2:
+            confirmed[header] = key
+    return confirmed
+
+def learned_version():
+    """Number of mappings recorded, which changes the suggestions"""
+    return learned_mappings()['version']
+
+def remember(mapping, excel_headers, input_headers=()):
+    """
+    Record the template column each input header was mapped to; the
+    input_headers not mapped to any column are recorded as unmapped
+    """
+    col_names = dict(excel_headers)
+    chosen = {}
+    for col_idx, input_cols in mapping.items():
+        if col_idx in col_names:
+            for header in input_cols or ():
+                chosen.setdefault(header, _column_key(col_names[col_idx]))
+    for header in input_headers:
+        if header.lower() not in LINE_NUMBER_HEADERS:
+            chosen.setdefault(header, '')
+    if not chosen:
+        return
+    with _learned_lock:
+        learned = learned_mappings()
+        headers = learned['headers']
+        for header, key in chosen.items():
+            weights = headers.setdefault(header, {})
+            for other in list(weights):
+                if other != key:
+                    weights[other] *= LEARNED_DECAY
+                    if weights[other] < LEARNED_DROP_WEIGHT:
+                        del weights[other]
+            weights[key] = weights.get(key, 0) + 1
+        if len(headers) > LEARNED_HEADERS:
+            # Keep the most mapped headers
+            kept = sorted(headers.items(), key=lambda item: -sum(item[1].values()))[:LEARNED_HEADERS]
+            learned['headers'] = dict(kept)
+        learned['version'] += 1
+        cache_utils.write_json(_learned_path(), learned)
+
+def suggest(input_headers, excel_headers):
+    """
+    Suggested mapping {excel_col_idx: [input headers]} for every template
+    column. Each input header goes to the column it matches best (at least
+    MIN_SCORE); columns other than MULTI_INPUT keep their best input only.
+    """
+    mapping = {col_idx: [] for col_idx, _ in excel_headers}
+    # Headers confirmed unmapped first, then the confirmed learned names,
+    # so they win ties with the synonyms; the IGNORED names last
+    confirmed = learned_columns()
+    names = [(None, header) for header, key in confirmed.items() if not key]
+    for col_idx, col_name in excel_headers:
+        key = _column_key(col_name)
+        names.extend((col_idx, header) for header, learned_key in confirmed.items() if learned_key == key)
+    for col_idx, col_name in excel_headers:
+        names.extend((col_idx, name) for name in SYNONYMS.get(_column_key(col_name), []))
+    if not any(col_idx is not None for col_idx, _ in names) or not input_headers:
+        return mapping
+    names.extend((None, name) for name in IGNORED)
+
+    index = TrigramIndex(names)
+    scores = index.scores(input_headers)
+
+    # Each header goes to the column of its closest name
+    best = {}
+    for header_id, header in enumerate(input_headers):
+        if header.lower() in LINE_NUMBER_HEADERS:
+            continue
+        row = scores[header_id]
+        name_id = int(np.argmax(row))
+        col_idx = index.columns[name_id]
+        if row[name_id] < MIN_SCORE or col_idx is None:
+            continue
+        best.setdefault(col_idx, []).append((row[name_id], header_id, header))
+
+    col_names = dict(excel_headers)
+    for col_idx, candidates in best.items():
+        if any(k in col_names[col_idx].lower() for k in MULTI_INPUT):
+            # Joined in the input order
+            mapping[col_idx] = [header for _, _, header in sorted(candidates, key=lambda c: c[1])]
+        else:
+            mapping[col_idx] = [max(candidates, key=lambda c: (c[0], -c[1]))[2]]
+    return mapping
@@ -0,0 +1,180 @@
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+
+import perf_utils
+
+MB = 1024 * 1024
+
+# Default allowance per processing job; 0 disables the budget
+JOB_MEMORY_BUDGET_MB = float(os.environ.get('JOB_MEMORY_BUDGET_MB', '1024'))
+
+# Share of the budget after which stages switch to their low-memory modes
+DOWNGRADE_RATIO = 0.6
+
+# Approximate size of one prepared cell (a tuple with its value), in bytes
+CELL_BYTES = 200
+
+_current_budget = contextvars.ContextVar('memory_budget', default=None)
+
+# Sum of the charges of every active budget in the process, so a job's
+# measured RSS growth can leave out what jobs running alongside it charged
+_charged_lock = threading.Lock()
+_charged_mb = 0
+
+class MemoryBudgetExceeded(MemoryError):
+    """Raised at a stage boundary when a job has used up its memory budget"""
+
+class MemoryBudget:
+    """
+    Memory allowance of one processing job, checked at stage boundaries so
+    a job is stopped cleanly before the host starts swapping or the OOM
+    killer takes down every session.
+
+    Usage is the larger of two figures:
+    - measured: the process's RSS growth since the job started, less the
+      charges other jobs added meanwhile. This catches allocations nothing
+      charges, such as pdfplumber's layout objects.
+    - charged: the data the job holds (upload, extracted rows, prepared
+      cells, page images, output; see charge). This is the fallback where
+      RSS cannot be read, and it covers memory that was allocated before
+      the job started, such as the upload.
+    """
+
+    def __init__(self, limit_mb=None):
+        self.limit_mb = JOB_MEMORY_BUDGET_MB if limit_mb is None else float(limit_mb)
+        self.charges = {}
+        self.peak_used_mb = 0
+        self.downgraded = []
+        self._token = None
+        with _charged_lock:
+            self.baseline_rss_mb = perf_utils.current_rss_mb()
+            self._others_baseline_mb = _charged_mb
+
+    @property
+    def enabled(self):
+        return self.limit_mb > 0
+
+    def charge(self, name, size_mb):
+        """Set the memory held by one of the job's data ('input', 'rows'...)"""
+        global _charged_mb
+        with _charged_lock:
+            previous = self.charges.pop(name, 0)
+            if size_mb > 0:
+                self.charges[name] = size_mb
+            _charged_mb += self.charges.get(name, 0) - previous
+        self.used_mb()
+
+    def release(self, name):
+        """Drop the charge of data the job no longer holds"""
+        self.charge(name, 0)
+
+    def release_all(self):
+        for name in list(self.charges):
+            self.release(name)
+
+    def charged_mb(self):
+        """Memory held by the job's data, as charged"""
+        return sum(self.charges.values())
+
+    def measured_mb(self):
+        """RSS growth since the job started less other jobs' new charges, or None if RSS is unavailable"""
+        rss = perf_utils.current_rss_mb()
+        if rss is None or self.baseline_rss_mb is None:
+            return None
+        with _charged_lock:
+            others = _charged_mb - self.charged_mb() - self._others_baseline_mb
+        return max(0, rss - self.baseline_rss_mb - max(0, others))
+
+    def used_mb(self):
+        """Memory used by the job: the larger of the measured and charged figures"""
+        measured = self.measured_mb()
+        used = self.charged_mb() if measured is None else max(measured, self.charged_mb())
+        self.peak_used_mb = max(self.peak_used_mb, used)
+        return used
+
+    def remaining_mb(self):
+        if not self.enabled:
+            return float('inf')
+        return self.limit_mb - self.used_mb()
+
+    def should_downgrade(self, needed_mb=0):
+        """True if the job is close to its budget or needed_mb would not fit"""
+        if not self.enabled:
+            return False
+        used = self.used_mb()
+        return used >= self.limit_mb * DOWNGRADE_RATIO or used + needed_mb > self.limit_mb
+
+    def note_downgrade(self, stage, mode):
+        """Record that a stage switched to a low-memory mode"""
+        self.downgraded.append((stage, mode))
+        perf_utils.annotate(low_memory_mode=mode)
+        print(f"Memory budget: {stage} switched to {mode} ({self.used_mb():.0f} of {self.limit_mb:.0f} MB used)")
+
+    def check(self, stage):
+        """Abort the job if it has exceeded its budget"""
+        if not self.enabled:
+            return
+        used = self.used_mb()
+        if used > self.limit_mb:
+            raise MemoryBudgetExceeded(
+                f"Processing stopped during {stage}: the job used {used:.0f} MB, "
+                f"over its {self.limit_mb:.0f} MB memory budget. "
+                f"Try splitting the document into smaller files."
+            )
+
+def start(limit_mb=None, input_size=0):
+    """Start a budget for the current thread/context and return it; input_size: bytes of the upload"""
+    budget = MemoryBudget(limit_mb)
+    budget.charge('input', input_size / MB)
+    budget._token = _current_budget.set(budget)
+    return budget
+
+def finish(budget):
+    budget.release_all()
+    if budget._token is not None:
+        _current_budget.reset(budget._token)
+        budget._token = None
+
+@contextmanager
+def budget(limit_mb=None, input_size=0):
+    """Context manager form of start/finish"""
+    current = start(limit_mb, input_size)
+    try:
+        yield current
+    finally:
+        finish(current)
+
+def current():
+    """The active MemoryBudget, or None"""
+    return _current_budget.get()
+
+def charge(name, size_mb):
+    """Record memory held by the active budget's job (no-op without one)"""
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.charge(name, size_mb)
+
+def release(name):
+    """Drop a charge of the active budget's job (no-op without one)"""
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.release(name)
+
+def checkpoint(stage):
+    """Stage-boundary check against the active budget (no-op without one)"""
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.check(stage)
+
+def should_downgrade(needed_mb=0):
+    """Whether the active budget asks for low-memory modes"""
+    budget = _current_budget.get()
+    return budget is not None and budget.should_downgrade(needed_mb)
+
+def checked(chunks, stage):
+    """Pass an iterator through, checking the budget before each item"""
+    for chunk in chunks:
+        checkpoint(stage)
+        yield chunk
@@ -1,48 +1,77 @@
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, convert_from_bytes, pdfinfo_from_path, pdfinfo_from_bytes
 import os
+import re
 import tempfile
 from PIL import Image
+import perf_utils
+import memory_budget
+
+# Rasterisation resolution for OCR (pdf2image's default)
+OCR_DPI = 200
+# Resolution used when the job's memory budget runs low
+OCR_LOW_MEMORY_DPI = 100
 
 def needs_ocr(pdf_path):
     """
     Check if a PDF needs OCR by attempting to extract text from the first page.
     This is a heuristic: if we get very little text, we assume it's scanned.
+    pdf_path may be a path or a binary file-like object.
     """
-    try:
-        import pdfplumber
-        with pdfplumber.open(pdf_path) as pdf:
-            if not pdf.pages:
-                return False
+    with perf_utils.span('needs_ocr', pages=1):
+        try:
+            import pdfplumber
+            with pdfplumber.open(pdf_path) as pdf:
+                if not pdf.pages:
+                    return False
             
-            # Check first page
-            text = pdf.pages[0].extract_text()
-            if not text or len(text.strip()) < 10:
-                return True
+                # Check first page
+                text = pdf.pages[0].extract_text()
+                if not text or len(text.strip()) < 10:
+                    return True
             
-            # Also check if there are any tables detected
-            tables = pdf.pages[0].extract_tables()
-            if not tables:
-                # If no text AND no tables, definitely needs OCR
-                return True
+                # Also check if there are any tables detected
+                tables = pdf.pages[0].extract_tables()
+                if not tables:
+                    # If no text AND no tables, definitely needs OCR
+                    return True
                 
-    except Exception as e:
-        print(f"Error checking if OCR is needed: {e}")
-        # If we can't read it, maybe it's corrupted or needs OCR? 
-        # Let's assume safely that if we can't read it normally, we might try OCR or just fail later.
-        pass
+        except Exception as e:
+            print(f"Error checking if OCR is needed: {e}")
+            # If we can't read it, maybe it's corrupted or needs OCR? 
+            # Let's assume safely that if we can't read it normally, we might try OCR or just fail later.
+            pass
         
-    return False
+        return False
 
-def convert_to_searchable_pdf(pdf_path, output_path=None):
+def convert_to_searchable_pdf(pdf_path, output_path=None, progress=None):
     """
     Convert a scanned PDF to a searchable PDF using Tesseract.
-    Returns the path to the new PDF.
+    pdf_path may be a path or a binary file-like object (e.g. an upload).
+    progress: optional callback(pages_done, total_pages, message)
+    Returns output_path if given, otherwise an in-memory BytesIO of the new PDF.
     """
     try:
+        if hasattr(pdf_path, 'read'):
+            pdf_path.seek(0)
+            pdf_bytes = pdf_path.read()
+        else:
+            pdf_bytes = None
+        
+        # Rasterising every page up front is the memory-hungry part of OCR.
+        # If the images would not fit the job's memory budget, pages are
+        # rasterised and recognised one at a time instead.
+        pages, page_mb = _page_count_and_size(pdf_path, pdf_bytes, OCR_DPI)
+        if memory_budget.should_downgrade(pages * page_mb):
+            return _convert_page_by_page(pdf_path, pdf_bytes, pages, page_mb, output_path, progress)
+        
         print(f"Converting {pdf_path} to images...")
         # Convert PDF to images
-        images = convert_from_path(pdf_path)
+        with perf_utils.span('ocr.rasterize') as span:
+            images = _rasterize(pdf_path, pdf_bytes, OCR_DPI)
+            span['pages'] = len(images)
+        memory_budget.charge('page images', len(images) * page_mb)
+        memory_budget.checkpoint('OCR rasterisation')
         
         if not images:
             raise ValueError("No images extracted from PDF")
@@ -99,21 +128,92 @@ def convert_to_searchable_pdf(pdf_path, output_path=None):
         
         merger = PdfWriter()
         
-        for i, image in enumerate(images):
-            print(f"Processing page {i+1}...")
-            pdf_bytes = pytesseract.image_to_pdf_or_hocr(image, extension='pdf')
-            merger.append(PdfReader(io.BytesIO(pdf_bytes)))
+        with perf_utils.span('ocr.recognize', pages=len(images)):
+            for i, image in enumerate(images):
+                print(f"Processing page {i+1}...")
+                page_pdf = pytesseract.image_to_pdf_or_hocr(image, extension='pdf')
+                merger.append(PdfReader(io.BytesIO(page_pdf)))
+                memory_budget.checkpoint('OCR')
+                if progress:
+                    progress(i + 1, len(images), "Recognising text")
+        memory_budget.release('page images')
             
-        if output_path is None:
-            fd, output_path = tempfile.mkstemp(suffix='.pdf')
-            os.close(fd)
-            
-        merger.write(output_path)
-        merger.close()
-        
-        print(f"Searchable PDF saved to {output_path}")
-        return output_path
+        return _write_merged(merger, output_path)
 
     except Exception as e:
         print(f"OCR failed: {e}")
         raise e
+
+def _rasterize(pdf_path, pdf_bytes, dpi, first_page=None, last_page=None):
+    """Render pages of a path or of in-memory PDF bytes to PIL images"""
+    if pdf_bytes is not None:
+        return convert_from_bytes(pdf_bytes, dpi=dpi, first_page=first_page, last_page=last_page)
+    return convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page)
+
+def _page_count_and_size(pdf_path, pdf_bytes, dpi):
+    """Page count and the approximate size in MB of one RGB page image at dpi"""
+    info = pdfinfo_from_bytes(pdf_bytes) if pdf_bytes is not None else pdfinfo_from_path(pdf_path)
+    width, height = 612, 792  # points; US Letter if pdfinfo gives no size
+    match = re.match(r'([\d.]+) x ([\d.]+)', str(info.get('Page size', '')))
+    if match:
+        width, height = float(match.group(1)), float(match.group(2))
+    pixels = (width / 72 * dpi) * (height / 72 * dpi)
+    return int(info.get('Pages', 0)), pixels * 3 / (1024 * 1024)
+
+def _convert_page_by_page(pdf_path, pdf_bytes, pages, page_mb, output_path, progress=None):
+    """
+    Low-memory OCR: rasterise and recognise one page at a time, so at most
+    one page image is alive. Drops to OCR_LOW_MEMORY_DPI if the budget is
+    still running low.
+    """
+    from pypdf import PdfWriter, PdfReader
+    import io
+    
+    budget = memory_budget.current()
+    budget.note_downgrade('ocr', 'page-by-page')
+    dpi = OCR_DPI
+    merger = PdfWriter()
+    
+    print(f"Running OCR page by page on {pages} pages...")
+    with perf_utils.span('ocr.page_by_page', pages=pages, dpi=dpi) as span:
+        for page in range(1, pages + 1):
+            memory_budget.checkpoint('OCR')
+            if dpi > OCR_LOW_MEMORY_DPI and budget.should_downgrade(page_mb):
+                dpi = OCR_LOW_MEMORY_DPI
+                span['dpi'] = dpi
+                budget.note_downgrade('ocr', f'{dpi} dpi')
+            budget.charge('page images', page_mb * (dpi / OCR_DPI) ** 2)
+            
+            images = _rasterize(pdf_path, pdf_bytes, dpi, first_page=page, last_page=page)
+            if not images:
+                continue
+            print(f"Processing page {page}...")
+            page_pdf = pytesseract.image_to_pdf_or_hocr(images[0], extension='pdf')
+            del images
+            merger.append(PdfReader(io.BytesIO(page_pdf)))
+            if progress:
+                progress(page, pages, "Recognising text")
+    budget.release('page images')
+    
+    if not merger.pages:
+        raise ValueError("No images extracted from PDF")
+    return _write_merged(merger, output_path)
+
+def _write_merged(merger, output_path):
+    """Write the merged searchable PDF to output_path, or to a BytesIO if None"""
+    import io
+    
+    if output_path is None:
+        # Keep the result in memory; pdfplumber reads it as a file object
+        output = io.BytesIO()
+        merger.write(output)
+        merger.close()
+        output.seek(0)
+        print("Searchable PDF created in memory")
+        return output
+        
+    merger.write(output_path)
+    merger.close()
+    
+    print(f"Searchable PDF saved to {output_path}")
+    return output_path
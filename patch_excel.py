@@ -4,6 +4,8 @@ import os
 import xml.etree.ElementTree as ET
 import re
 from io import BytesIO
+import excel_utils
+import template_registry
 
 # Namespaces
 NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
@@ -17,19 +19,23 @@ def get_col_letter(col_idx):
         string = chr(65 + remainder) + string
     return string
 
-def patch_excel_sheet(template_path, output_path, data):
+def patch_excel_sheet(template_path, output_path, data, compression='balanced'):
     """
     Patch the Excel sheet XML directly to preserve all features.
     data: list of dicts with 'model', 'qty', 'amount', 'material'
+    compression: output compression policy ('fastest', 'balanced', 'smallest')
     """
     print(f"Patching {template_path} -> {output_path}")
     
+    # Data sheet and start row of the template
+    template = template_registry.get(template_path)
+    
     # 1. Copy template to output
     shutil.copy(template_path, output_path)
     
-    # 2. Read sheet2.xml
+    # 2. Read the data sheet (sheet2.xml)
     with zipfile.ZipFile(output_path, 'r') as zin:
-        sheet_xml = zin.read('xl/worksheets/sheet2.xml')
+        sheet_xml = zin.read(template.sheet_path)
     
     # 3. Parse XML
     root = ET.fromstring(sheet_xml)
@@ -45,7 +51,7 @@ def patch_excel_sheet(template_path, output_path, data):
     # Valeur (Col 4/D)
     # Quantité (Col 5/E)
     
-    start_row = 6
+    start_row = template.start_row
     
     # Create a map of existing rows for quick access
     rows = {int(r.get('r')): r for r in sheetData.findall('x:row', NS)}
@@ -92,13 +98,9 @@ def patch_excel_sheet(template_path, output_path, data):
     # We have to create a new zip.
     
     temp_zip = output_path + ".tmp"
-    with zipfile.ZipFile(template_path, 'r') as zin:
-        with zipfile.ZipFile(temp_zip, 'w') as zout:
-            for item in zin.infolist():
-                if item.filename == 'xl/worksheets/sheet2.xml':
-                    zout.writestr(item, ET.tostring(root, encoding='UTF-8', xml_declaration=True))
-                else:
-                    zout.writestr(item, zin.read(item.filename))
+    replacements = {template.sheet_path: ET.tostring(root, encoding='UTF-8', xml_declaration=True)}
+    with open(temp_zip, 'wb') as f:
+        excel_utils.write_workbook(template_path, f, replacements, compression)
     
     shutil.move(temp_zip, output_path)
     print("Patching complete.")
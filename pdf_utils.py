@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import re
+from collections import deque
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+
+import perf_utils
+
+# Worker processes reading pages of long PDFs (pdfplumber is CPU-bound and
+# holds the GIL); 1 reads every document in-process
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', str(os.cpu_count() or 1)))
+
+# Shorter documents are read in-process: the pool costs a process start
+# and a reopen of the document per task
+PARALLEL_MIN_PAGES = 16
+
+# Consecutive pages read by one worker task
+PAGES_PER_TASK = 4
+
+# Invoice boundary markers in a page's text
+PAGE_MARKER_RE = re.compile(r'\bpage\s*(\d+)\s*(?:/|of)\s*\d+', re.I)
+INVOICE_NUMBER_RE = re.compile(r'\binvoice[ \t]*(?:no\.?|number|nr\.?|#|n°)[ \t]*[:.]?[ \t]*([\w/.-]*\d[\w/.-]*)', re.I)
+# An invoice's closing totals line; page totals, subtotals and totals
+# carried or brought forward appear on every page of long invoices
+TOTALS_RE = re.compile(r'^\s*(?:grand\s+|invoice\s+)?totals?\b'
+                       r'(?![\s:.-]*(?:carried|brought|forward|c/f|b/f|(?:this\s+|per\s+|of\s+)?page)\b)',
+                       re.I | re.M)
+
+def read_pages(pdf_source, first_page=1, last_page=None):
+    """
+    (tables, text) of pages first_page..last_page (1-based) of a path or of
+    the document's bytes; runs inside worker processes
+    """
+    if isinstance(pdf_source, bytes):
+        pdf_source = BytesIO(pdf_source)
+    pages = []
+    with pdfplumber.open(pdf_source) as pdf:
+        for page in pdf.pages[first_page - 1:last_page]:
+            # The text reuses the characters parsed for the tables
+            pages.append((page.extract_tables(), page.extract_text() or ''))
+            page.close()
+    return pages
+
+_process_pool = None
+
+def _get_process_pool():
+    """Lazily started pool, reused across documents (spawn is safe in threaded servers)"""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _process_pool
+
+def iter_pages(pdf_file, workers=None):
+    """
+    Yield (page_count, tables, text) for each page, in order. Documents of
+    PARALLEL_MIN_PAGES pages or more are read by worker processes, a few
+    pages per task, while the earlier pages are being consumed.
+    """
+    workers = PDF_WORKERS if workers is None else workers
+    with pdfplumber.open(pdf_file) as pdf:
+        page_count = len(pdf.pages)
+        perf_utils.annotate(pages=page_count)
+        if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+            for page in pdf.pages:
+                tables = page.extract_tables()
+                text = page.extract_text() or ''
+                # Pages are not revisited; drop pdfplumber's cached layout objects
+                page.close()
+                yield page_count, tables, text
+            return
+
+    # Tasks carry the document's path, or its bytes: nothing is staged on disk
+    if isinstance(pdf_file, (str, os.PathLike)):
+        source = pdf_file
+    else:
+        pdf_file.seek(0)
+        source = pdf_file.read()
+
+    perf_utils.annotate(workers=workers)
+    pool = _get_process_pool()
+    pending = deque()
+    try:
+        for first_page in range(1, page_count + 1, PAGES_PER_TASK):
+            pending.append(pool.submit(read_pages, source, first_page, first_page + PAGES_PER_TASK - 1))
+            # Bounded read-ahead: results wait in memory until consumed
+            while len(pending) > 2 * workers:
+                for tables, text in pending.popleft().result():
+                    yield page_count, tables, text
+        while pending:
+            for tables, text in pending.popleft().result():
+                yield page_count, tables, text
+    finally:
+        for future in pending:
+            future.cancel()
+
+def page_number(text):
+    """The N of a 'Page N of M' / 'Page N/M' marker in a page's text, or None"""
+    match = PAGE_MARKER_RE.search(text)
+    return int(match.group(1)) if match else None
+
+def invoice_number(text):
+    """The invoice number of an 'Invoice No: ...' line in a page's text, or None"""
+    match = INVOICE_NUMBER_RE.search(text)
+    return match.group(1).upper() if match else None
+
+def has_totals(text):
+    """
+    Whether a line of the page's text starts with 'Total', 'Grand total' or
+    'Invoice total', other than a page total or a total carried forward
+    """
+    return TOTALS_RE.search(text) is not None
+
+class InvoiceSplitter:
+    """
+    Tells, page by page, whether a page of a PDF bundle starts a new
+    invoice. A page starts one if it is the first, carries a 'Page 1 of N'
+    marker, or carries an invoice number other than the current invoice's.
+    Without markers or numbers, a page whose table brings a header row
+    starts one after the previous invoice's closing totals line, or if the
+    header row differs; a header row repeated by a long invoice is a
+    continuation.
+    """
+
+    def __init__(self):
+        self.pages = 0
+        self.headers = None
+        self.number = None
+        self.totals_seen = False
+
+    def starts_invoice(self, page_headers, text):
+        """page_headers: the header row found in the page's tables, or None"""
+        marker = page_number(text)
+        number = invoice_number(text)
+        if self.pages == 0 or marker == 1:
+            new_invoice = True
+        elif number is not None and self.number is not None:
+            new_invoice = number != self.number
+        else:
+            new_invoice = (page_headers is not None and marker is None
+                           and (self.totals_seen or page_headers != self.headers))
+        if new_invoice:
+            self.headers, self.number, self.totals_seen = page_headers, number, False
+        else:
+            self.headers = self.headers if self.headers is not None else page_headers
+            self.number = self.number if self.number is not None else number
+        self.totals_seen = self.totals_seen or has_totals(text)
+        self.pages += 1
+        return new_invoice
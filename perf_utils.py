@@ -0,0 +1,184 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Structured span log, one JSON object per line
+LOG_PATH = os.environ.get(
+    'PERF_LOG_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'perf.jsonl')
+)
+
+# Peak memory comes from tracemalloc, which makes pdfplumber stages ~3x slower,
+# so it is opt-in per job (or PERF_TRACE_MEMORY=1). Resident memory at the end
+# of each span is always recorded, it costs one /proc read.
+TRACE_MEMORY = os.environ.get('PERF_TRACE_MEMORY', '0') == '1'
+
+_current_job = contextvars.ContextVar('perf_job', default=None)
+_log_lock = threading.Lock()
+
+# tracemalloc is process-wide: keep it running while any job needs it
+_tracing_lock = threading.Lock()
+_tracing_jobs = 0
+
+class PerfJob:
+    """Spans recorded for one processing job (one app run, one API request...)"""
+
+    def __init__(self, name, **context):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.context = context
+        self.spans = []
+        self._stack = []
+        self._tracing = False
+        self._token = None
+
+    def rows(self):
+        """Finished spans as flat dicts, in start order"""
+        return sorted(self.spans, key=lambda s: s['start'])
+
+def current_rss_mb():
+    """Resident set size of this process in MB, or None if unavailable"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS; KB on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+    except (ImportError, OSError):
+        return None
+
+def start_job(name, trace_memory=None, **context):
+    """
+    Begin recording spans for the current thread/context.
+    trace_memory: record peak traced memory per span (default TRACE_MEMORY)
+    """
+    global _tracing_jobs
+    job = PerfJob(name, **context)
+    if TRACE_MEMORY if trace_memory is None else trace_memory:
+        with _tracing_lock:
+            if _tracing_jobs == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            _tracing_jobs += 1
+        job._tracing = True
+    job._token = _current_job.set(job)
+    return job
+
+def finish_job(job):
+    """Stop recording and append the job's spans to LOG_PATH"""
+    global _tracing_jobs
+    if job._token is not None:
+        _current_job.reset(job._token)
+        job._token = None
+    if job._tracing:
+        with _tracing_lock:
+            _tracing_jobs -= 1
+            if _tracing_jobs == 0:
+                tracemalloc.stop()
+        job._tracing = False
+    if job.spans:
+        write_log(job)
+
+@contextmanager
+def job(name, trace_memory=None, **context):
+    """Context manager form of start_job/finish_job"""
+    current = start_job(name, trace_memory, **context)
+    try:
+        yield current
+    finally:
+        finish_job(current)
+
+def current_job():
+    """The PerfJob recording in this context, or None"""
+    return _current_job.get()
+
+@contextmanager
+def span(stage, **counters):
+    """
+    Time a pipeline stage: wall time, CPU time, resident memory and (when
+    the job traces memory) peak traced memory.
+    Yields a dict so the stage can report what it processed:
+
+        with perf_utils.span('extract_pdf_data') as s:
+            data = ...
+            s['rows'] = len(data)
+
+    Outside of a job this is a no-op.
+    """
+    job = _current_job.get()
+    if job is None:
+        yield counters
+        return
+
+    parent = job._stack[-1] if job._stack else None
+    tracing = job._tracing and tracemalloc.is_tracing()
+    mem_start = 0
+    if tracing:
+        mem_start, peak_so_far = tracemalloc.get_traced_memory()
+        # reset_peak() is global: hand the peak seen so far to the parent first
+        if parent is not None:
+            parent['_peak'] = max(parent['_peak'], peak_so_far)
+        tracemalloc.reset_peak()
+
+    record = {'stage': stage, 'parent': parent['stage'] if parent else None,
+              'start': time.time(), '_peak': 0, '_mem_start': mem_start, '_counters': counters}
+    job._stack.append(record)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield counters
+    finally:
+        record['wall_s'] = round(time.perf_counter() - wall_start, 6)
+        # Process CPU time: includes helper threads (e.g. parallel deflate)
+        record['cpu_s'] = round(time.process_time() - cpu_start, 6)
+        job._stack.pop()
+
+        peak = record.pop('_peak')
+        mem_start = record.pop('_mem_start')
+        if tracing and tracemalloc.is_tracing():
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            record['peak_mb'] = round(max(0, peak - mem_start) / (1024 * 1024), 3)
+            if parent is not None:
+                parent['_peak'] = max(parent['_peak'], peak)
+        else:
+            record['peak_mb'] = None
+        rss = current_rss_mb()
+        record['rss_mb'] = round(rss, 1) if rss is not None else None
+
+        record.pop('_counters')
+        for key in ('pages', 'rows'):
+            record[key] = counters.get(key)
+        record.update({k: v for k, v in counters.items() if k not in ('pages', 'rows')})
+        job.spans.append(record)
+
+def annotate(**counters):
+    """Add counters (pages, rows...) to the innermost open span, if any"""
+    job = _current_job.get()
+    if job is not None and job._stack:
+        job._stack[-1]['_counters'].update(counters)
+
+def write_log(job):
+    """Append one JSON line per span, tagged with the job id and context"""
+    timestamp = datetime.now(timezone.utc).isoformat()
+    lines = []
+    for record in job.rows():
+        entry = {'ts': timestamp, 'job_id': job.job_id, 'job': job.name}
+        entry.update(job.context)
+        entry.update(record)
+        lines.append(json.dumps(entry, default=str))
+    try:
+        os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+        with _log_lock, open(LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+    except OSError as e:
+        print(f"Could not write performance log: {e}")
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Generators for synthetic invoice PDFs and Excel inputs used by benchmark.py.
+The layout mimics the supplier invoices we receive (see fa.pdf): a title,
+a header row 'no | product models | QTY | Price | AMOUNT | CTN | PHOTOS |
+Materials' on the first page and continuation rows on the following pages.
+"""
+import random
+from io import BytesIO
+
+import pandas as pd
+
+HEADERS = ['no', 'product models', 'QTY', 'Price', 'AMOUNT', 'CTN', 'PHOTOS', 'Materials']
+COL_WIDTHS = [30, 150, 45, 50, 60, 35, 60, 100]
+
+MODELS = ['SEAT', 'SPRING', 'COMP KEY', 'BACK FOOT REST', 'CALIBRETOR HOST', 'MIRROR', 'BRAKE PAD', 'CHAIN']
+VARIANTS = ['DY100', 'CD110', 'TZ125', 'HJ5', 'OLD DREAM', 'BAJAJ', 'AX100']
+MATERIALS = ['PLASTIC', 'IRON', 'ALUMINUM', 'RUBBER', 'STEEL']
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 30
+ROW_HEIGHT = 22
+
+def invoice_rows(count, seed=0):
+    """Deterministic invoice lines as lists of cell strings"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        qty = rng.randint(1, 200)
+        price = round(rng.uniform(0.5, 40), 2)
+        rows.append([
+            str(i + 1),
+            f"{rng.choice(MODELS)} {rng.choice(VARIANTS)}",
+            str(qty),
+            f"{price:.2f}",
+            f"{qty * price:.2f}",
+            str(rng.randint(1, 10)),
+            '',
+            rng.choice(MATERIALS),
+        ])
+    return rows
+
+def _paginate(rows, rows_per_page):
+    return [rows[i:i + rows_per_page] for i in range(0, len(rows), rows_per_page)] or [[]]
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def _page_content(page_rows, with_header, bordered, footer=None):
+    """PDF content stream drawing one page of the invoice table, and an optional line of text below it"""
+    ops = []
+    y = PAGE_HEIGHT - MARGIN - 20
+    ops.append(f"BT /F1 14 Tf {MARGIN} {y} Td (PROFORMA INVOICE) Tj ET")
+    y -= 30
+
+    table_rows = ([HEADERS] if with_header else []) + page_rows
+    top = y
+    for cells in table_rows:
+        x = MARGIN
+        for text, width in zip(cells, COL_WIDTHS):
+            if text:
+                ops.append(f"BT /F1 8 Tf {x + 3} {y - 14} Td ({_pdf_escape(text)}) Tj ET")
+            x += width
+        y -= ROW_HEIGHT
+
+    if bordered and table_rows:
+        # Ruling lines let pdfplumber's default (lines) strategy find the table
+        right = MARGIN + sum(COL_WIDTHS)
+        ops.append("0.5 w")
+        for i in range(len(table_rows) + 1):
+            line_y = top - i * ROW_HEIGHT
+            ops.append(f"{MARGIN} {line_y} m {right} {line_y} l S")
+        x = MARGIN
+        for width in COL_WIDTHS + [0]:
+            ops.append(f"{x} {top} m {x} {y} l S")
+            x += width
+    if footer:
+        ops.append(f"BT /F1 10 Tf {MARGIN} {y - 20} Td ({_pdf_escape(footer)}) Tj ET")
+    return "\n".join(ops).encode('latin-1')
+
+def make_text_pdf(pages, rows_per_page=30, bordered=True, seed=0, page_totals=False):
+    """
+    Build a text-layer invoice PDF with the header row on the first page.
+    page_totals: repeat the header row on every page, under which a
+    'Total carried forward' line closes every page but the last, as long
+    single invoices often do; the last page ends with the invoice total.
+    Returns (pdf_bytes, row_count).
+    """
+    rows = invoice_rows(pages * rows_per_page, seed)
+    page_rows = _paginate(rows, rows_per_page)
+    contents = []
+    carried = 0
+    for i, chunk in enumerate(page_rows):
+        footer = None
+        if page_totals:
+            carried += sum(float(row[4]) for row in chunk)
+            footer = f"TOTAL: {carried:.2f}" if i == len(page_rows) - 1 else f"Total carried forward: {carried:.2f}"
+        contents.append(_page_content(chunk, i == 0 or page_totals, bordered, footer))
+    return _assemble_pdf(contents), len(rows)
+
+def make_bundle_pdf(invoices, pages, rows_per_page=30, bordered=True, seed=0):
+    """
+    Build a forwarder-style bundle: several invoices in one PDF, each with
+    its header row on its first page and a totals line after its last row.
+    Returns (pdf_bytes, row counts per invoice).
+    """
+    contents = []
+    counts = []
+    for invoice in range(invoices):
+        rows = invoice_rows(pages * rows_per_page, seed + invoice)
+        page_rows = _paginate(rows, rows_per_page)
+        total = sum(float(row[4]) for row in rows)
+        for i, chunk in enumerate(page_rows):
+            footer = f"TOTAL: {total:.2f}" if i == len(page_rows) - 1 else None
+            contents.append(_page_content(chunk, i == 0, bordered, footer))
+        counts.append(len(rows))
+    return _assemble_pdf(contents), counts
+
+def _assemble_pdf(contents):
+    """PDF file with one page per content stream"""
+    # Objects: 1 catalog, 2 page tree, 3 font, then (page, content) pairs
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for content in contents:
+        page_num = len(objects) + 1
+        kids.append(f"{page_num} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_num + 1} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f"{num} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+def make_raster_pdf(pages, rows_per_page=30, bordered=True, seed=0, dpi=100):
+    """
+    Build a scanned-looking invoice: every page is an image without a text
+    layer, so needs_ocr() is true. Returns (pdf_bytes, row_count).
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    scale = dpi / 72
+    font = ImageFont.load_default(size=int(8 * scale))
+    title_font = ImageFont.load_default(size=int(14 * scale))
+    rows = invoice_rows(pages * rows_per_page, seed)
+
+    images = []
+    for page_idx, page_rows in enumerate(_paginate(rows, rows_per_page)):
+        image = Image.new('L', (int(PAGE_WIDTH * scale), int(PAGE_HEIGHT * scale)), 255)
+        draw = ImageDraw.Draw(image)
+        y = MARGIN + 10
+        draw.text((MARGIN * scale, y * scale), "PROFORMA INVOICE", fill=0, font=title_font)
+        y += 30
+
+        table_rows = ([HEADERS] if page_idx == 0 else []) + page_rows
+        top = y
+        for cells in table_rows:
+            x = MARGIN
+            for text, width in zip(cells, COL_WIDTHS):
+                draw.text(((x + 3) * scale, (y + 6) * scale), text, fill=0, font=font)
+                x += width
+            y += ROW_HEIGHT
+        if bordered and table_rows:
+            right = MARGIN + sum(COL_WIDTHS)
+            for i in range(len(table_rows) + 1):
+                line_y = (top + i * ROW_HEIGHT) * scale
+                draw.line([(MARGIN * scale, line_y), (right * scale, line_y)], fill=0)
+            x = MARGIN
+            for width in COL_WIDTHS + [0]:
+                draw.line([(x * scale, top * scale), (x * scale, y * scale)], fill=0)
+                x += width
+        images.append(image)
+
+    out = BytesIO()
+    images[0].save(out, 'PDF', save_all=True, append_images=images[1:], resolution=dpi)
+    return out.getvalue(), len(rows)
+
+def make_excel_input(row_count, seed=0):
+    """Invoice lines as an .xlsx upload. Returns (xlsx_bytes, row_count)."""
+    rows = invoice_rows(row_count, seed)
+    df = pd.DataFrame(rows, columns=HEADERS)
+    for col in ('QTY', 'CTN'):
+        df[col] = df[col].astype(int)
+    for col in ('Price', 'AMOUNT'):
+        df[col] = df[col].astype(float)
+    out = BytesIO()
+    df.drop(columns=['PHOTOS']).to_excel(out, index=False)
+    return out.getvalue(), len(rows)
+
+if __name__ == "__main__":
+    pdf, count = make_text_pdf(3)
+    with open("synthetic_invoice.pdf", "wb") as f:
+        f.write(pdf)
+    print(f"Wrote synthetic_invoice.pdf with {count} lines")
@@ -0,0 +1,202 @@
+import os
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+
+import cache_utils
+import excel_utils
+
+# Namespaces
+NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+ET.register_namespace('', NS['x'])
+ET.register_namespace('r', "http://schemas.openxmlformats.org/officeDocument/2006/relationships")
+ET.register_namespace('xdr', "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing")
+ET.register_namespace('mc', "http://schemas.openxmlformats.org/markup-compatibility/2006")
+ET.register_namespace('x14ac', "http://schemas.microsoft.com/office/spreadsheetml/2009/9/ac")
+
+# Where the IDI form keeps its data: header row 5 of the second sheet, rows
+# from 6 on, cells styled after cellXfs entry 221. Its only formulas are the
+# line numbers of column A, which read the declarant's D3 input and none of
+# the filled cells: they are copied with the template's cached values.
+IDI_SETTINGS = {
+    'sheet_path': 'xl/worksheets/sheet2.xml',
+    'header_row': 5,
+    'start_row': 6,
+    'base_style': 221,
+}
+
+DEFAULT_TEMPLATE = os.environ.get('TEMPLATE_PATH', 'IDI VIDE.xlsx')
+
+# Known templates (path -> settings), preloaded at startup; other paths are
+# loaded on first use with IDI_SETTINGS
+TEMPLATES = {
+    DEFAULT_TEMPLATE: IDI_SETTINGS,
+}
+
+class Template:
+    """
+    A template file parsed once per version: its settings plus the header
+    row, the thin-bordered styles and the split data sheet populate_excel needs
+    """
+
+    def __init__(self, path, sheet_path, header_row, start_row, base_style):
+        self.path = path
+        self.sheet_path = sheet_path
+        self.header_row = header_row
+        self.start_row = start_row
+        self.base_style = base_style
+        stat = os.stat(path)
+        self.version = (stat.st_mtime_ns, stat.st_size)
+        self.digest = cache_utils.file_digest(path)
+        # [(col_idx, name)] of the header row
+        self.headers = read_headers(path, sheet_path, header_row)
+        # (styles_xml, left_idx, center_idx, success), see add_thin_border_styles
+        self.styles = load_styles(path, self.digest, base_style)
+        # (head, rows, tail) of the data sheet, or None if it has no sheetData
+        self.layout = load_layout(path, sheet_path)
+        with zipfile.ZipFile(path, 'r') as zin:
+            names = zin.namelist()
+            self.shared_strings = (zin.read(excel_utils.SHARED_STRINGS_PATH)
+                                   if excel_utils.SHARED_STRINGS_PATH in names else None)
+
+_templates = {}
+_lock = threading.Lock()
+
+# Why templates failed to load, by path, until they load again; reported
+# by the API's /health
+load_errors = {}
+
+def get(path=None):
+    """
+    The loaded template at path (default: DEFAULT_TEMPLATE), reloaded when
+    the file's mtime or size changed. Raises FileNotFoundError if it is
+    missing, and whatever parsing raised if it is broken (also recorded in
+    load_errors).
+    """
+    path = DEFAULT_TEMPLATE if path is None else path
+    key = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+        with _lock:
+            template = _templates.get(key)
+            if template is None or template.version != (stat.st_mtime_ns, stat.st_size):
+                settings = next((s for p, s in TEMPLATES.items() if os.path.abspath(p) == key), IDI_SETTINGS)
+                template = _templates[key] = Template(path, **settings)
+    except Exception as e:
+        load_errors[path] = f"{type(e).__name__}: {e}"
+        raise
+    load_errors.pop(path, None)
+    return template
+
+def preload():
+    """
+    Load every known template, so the first upload does not wait for it.
+    Returns load_errors; a template that failed raises again when it is used.
+    """
+    for path in TEMPLATES:
+        try:
+            get(path)
+        except Exception:
+            pass
+    return dict(load_errors)
+
+def read_headers(template_path, sheet_path='xl/worksheets/sheet2.xml', header_row=5):
+    """The template's header row as [(col_idx, name)], streamed (see excel_utils.read_row)"""
+    headers = []
+    for col, val in excel_utils.read_row(template_path, sheet_path, header_row).items():
+        if val:
+            # Clean header: remove newlines, extra spaces
+            clean_val = str(val).replace('\n', ' ').strip()
+            headers.append((col, clean_val))
+    return headers
+
+def add_thin_border_styles(zip_ref, base_style_idx=221):
+    """
+    Reads styles.xml, creates two new styles based on base_style_idx:
+    1. Left-aligned, thin border (ID 5)
+    2. Center-aligned, thin border (ID 5)
+    Returns (styles_xml, left_idx, center_idx, success); styles_xml is the
+    patched xl/styles.xml content, or None if the template was left unchanged
+    """
+    left_idx = base_style_idx
+    center_idx = base_style_idx
+
+    with zipfile.ZipFile(zip_ref, 'r') as zin:
+        xml_content = zin.read('xl/styles.xml')
+
+    root = ET.fromstring(xml_content)
+    cellXfs = root.find(f"{{{NS['x']}}}cellXfs")
+
+    if cellXfs is not None:
+        xfs = list(cellXfs.findall(f"{{{NS['x']}}}xf"))
+        if 0 <= base_style_idx < len(xfs):
+            base_xf = xfs[base_style_idx]
+
+            # 1. Create Left-aligned style
+            left_xf = ET.fromstring(ET.tostring(base_xf, encoding='unicode'))
+            align_l = left_xf.find(f"{{{NS['x']}}}alignment")
+            if align_l is None:
+                align_l = ET.SubElement(left_xf, f"{{{NS['x']}}}alignment")
+            align_l.set('horizontal', 'left')
+            left_xf.set('borderId', '5')
+            left_xf.set('applyBorder', '1')
+
+            # 2. Create Center-aligned style
+            center_xf = ET.fromstring(ET.tostring(base_xf, encoding='unicode'))
+            align_c = center_xf.find(f"{{{NS['x']}}}alignment")
+            if align_c is None:
+                align_c = ET.SubElement(center_xf, f"{{{NS['x']}}}alignment")
+            align_c.set('horizontal', 'center')
+            center_xf.set('borderId', '5')
+            center_xf.set('applyBorder', '1')
+
+            # Append both
+            cellXfs.append(left_xf)
+            cellXfs.append(center_xf)
+
+            # Update count
+            count = int(cellXfs.get('count', 0))
+            cellXfs.set('count', str(count + 2))
+
+            left_idx = count
+            center_idx = count + 1
+
+            return ET.tostring(root, encoding='UTF-8', xml_declaration=True), left_idx, center_idx, True
+
+    return None, left_idx, center_idx, False
+
+def load_styles(template_path, digest, base_style_idx=221):
+    """
+    add_thin_border_styles, cached under CACHE_DIR/styles per template
+    version (content hash) so restarts skip the styles.xml rewrite.
+    Returns (styles_xml, left_idx, center_idx, success)
+    """
+    key = f"{digest}-{base_style_idx}"
+    meta_path = cache_utils.cache_path('styles', f"{key}.json")
+    xml_path = cache_utils.cache_path('styles', f"{key}.xml")
+    meta = cache_utils.read_json(meta_path)
+    styles_xml = None
+    if meta is not None and meta['success']:
+        try:
+            with open(xml_path, 'rb') as f:
+                styles_xml = f.read()
+        except OSError:
+            meta = None
+
+    if meta is None:
+        styles_xml, left_idx, center_idx, success = add_thin_border_styles(template_path, base_style_idx)
+        if success:
+            cache_utils.write_atomic(xml_path, styles_xml)
+        meta = {'left': left_idx, 'center': center_idx, 'success': success}
+        cache_utils.write_json(meta_path, meta)
+
+    return styles_xml, meta['left'], meta['center'], meta['success']
+
+def load_layout(template_path, sheet_path):
+    """Template sheet split into (head, rows, tail) by excel_utils.split_sheet, or None without sheetData"""
+    with zipfile.ZipFile(template_path, 'r') as zin:
+        sheet_xml = zin.read(sheet_path).decode('utf-8')
+    try:
+        return excel_utils.split_sheet(sheet_xml)
+    except ValueError:
+        return None
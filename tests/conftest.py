@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Caches, job records and learned mappings go to a throwaway directory;
+# set before the modules read it at import
+os.environ['DATA_ENTRY_CACHE_DIR'] = tempfile.mkdtemp(prefix='data-entry-tests-')
+sys.path.insert(0, ROOT)
+
+TEMPLATE_PATH = os.path.join(ROOT, 'IDI VIDE.xlsx')
+
+@pytest.fixture
+def template_path(monkeypatch):
+    # Relative paths in the app (e.g. the template registry's default) resolve from the repo
+    monkeypatch.chdir(ROOT)
+    return TEMPLATE_PATH
+
+@pytest.fixture
+def excel_headers(template_path):
+    import app
+    return app.get_excel_headers(template_path)
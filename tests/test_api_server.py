@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import api_loadgen
+import api_server
+import excel_utils
+import pdf_utils
+import synthetic_invoices
+
+def test_parse_upload_multipart():
+    fields = {'mapping': json.dumps({'3': ['Description']}), 'string_mode': 'shared'}
+    content_type, body = api_loadgen.multipart_body(b'%PDF-1.4', 'facture.pdf', fields)
+    file_bytes, file_name, parsed = api_server.parse_upload(content_type, body, {'bundle': ['separate']})
+    assert (file_bytes, file_name) == (b'%PDF-1.4', 'facture.pdf')
+    assert parsed == dict(fields, bundle='separate')
+
+def test_parse_upload_raw_body():
+    file_bytes, file_name, fields = api_server.parse_upload('application/pdf', b'%PDF', {'filename': ['a.pdf']})
+    assert (file_bytes, file_name, fields) == (b'%PDF', 'a.pdf', {'filename': 'a.pdf'})
+
+@pytest.mark.parametrize('content_type, body, query', [
+    ('application/pdf', b'%PDF', {}),
+    ('application/pdf', b'', {'filename': ['a.pdf']}),
+    ('multipart/form-data; boundary=x', b'--x--\r\n', {}),
+])
+def test_parse_upload_rejects_incomplete_uploads(content_type, body, query):
+    with pytest.raises(api_server.ApiError) as error:
+        api_server.parse_upload(content_type, body, query)
+    assert error.value.status == 400
+
+def test_parse_options_defaults():
+    assert api_server.parse_options({}) == (None, 'inline', 'balanced', 'xlsx', 'combined', True)
+
+def test_parse_options_values():
+    options = api_server.parse_options({'mapping': '{"3": "Description"}', 'string_mode': 'shared',
+                                        'compression': 'smallest', 'format': 'csv', 'bundle': 'separate',
+                                        'cache': 'bypass'})
+    assert options == ({'3': 'Description'}, 'shared', 'smallest', 'csv', 'separate', False)
+
+@pytest.mark.parametrize('fields', [
+    {'mapping': '{not json'}, {'string_mode': 'rich'}, {'compression': 'zstd'}, {'format': 'xls'},
+    {'bundle': 'all'}, {'cache': 'never'},
+])
+def test_parse_options_rejects_invalid_values(fields):
+    with pytest.raises(api_server.ApiError) as error:
+        api_server.parse_options(fields)
+    assert error.value.status == 400
+
+def test_content_disposition_is_ascii_with_the_exact_name_encoded():
+    header = api_server.content_disposition('供应商 "A"\r\nX: 1_IDI_FILLED.xlsx')
+    header.encode('latin-1')
+    assert '\r' not in header and '\n' not in header
+    assert header.startswith('attachment; filename="')
+    assert "filename*=UTF-8''%E4%BE%9B%E5%BA%94%E5%95%86%20%22A%22%0D%0AX%3A%201_IDI_FILLED.xlsx" in header
+
+@pytest.fixture
+def no_nested_pools(monkeypatch):
+    """Fail if page reading or row rendering starts a process pool, as it must not inside an API worker"""
+    def refuse():
+        raise AssertionError("process pool started inside a conversion worker")
+
+    monkeypatch.setattr(pdf_utils, '_get_process_pool', refuse)
+    monkeypatch.setattr(excel_utils, '_get_process_pool', refuse)
+    # Long enough, and on enough cores, that the pools would otherwise start
+    monkeypatch.setattr(pdf_utils, 'PDF_WORKERS', 4)
+    monkeypatch.setattr(excel_utils.os, 'cpu_count', lambda: 4)
+    monkeypatch.setattr(excel_utils, 'LARGE_FILL_MIN_ROWS', 10)
+
+@pytest.mark.parametrize('bundle', ['combined', 'separate'])
+def test_convert_reads_and_renders_in_process(template_path, no_nested_pools, bundle):
+    pdf, rows = synthetic_invoices.make_text_pdf(pdf_utils.PARALLEL_MIN_PAGES, rows_per_page=5)
+    workbook, info = api_server.convert(pdf, 'long.pdf', None, template_path, bundle=bundle, use_cache=False)
+    assert workbook.startswith(b'PK')
+    assert info['items'] == rows
+
+def test_export_reads_in_process(template_path, no_nested_pools):
+    pdf, rows = synthetic_invoices.make_text_pdf(pdf_utils.PARALLEL_MIN_PAGES, rows_per_page=5, seed=1)
+    payload, info = api_server.export(pdf, 'long.pdf', None, template_path, 'csv', use_cache=False)
+    assert info['items'] == rows
@@ -0,0 +1,23 @@
+import arrow_utils
+
+def test_table_from_rows_keeps_missing_and_empty_cells_apart():
+    table = arrow_utils.table_from_rows([{'Qty': 4, 'Description': 'Pad'}, {'Qty': 0}, {'Unit': 'pcs'}])
+    assert table.to_pydict() == {'Qty': ['4', '', None], 'Description': ['Pad', None, None],
+                                 'Unit': [None, None, 'pcs']}
+
+def test_concat_promotes_columns_and_skips_empty_chunks():
+    first = arrow_utils.table_from_columns({'Qty': ['1']})
+    second = arrow_utils.table_from_columns({'Qty': ['2'], 'Unit': ['pcs']})
+    table = arrow_utils.concat([first, arrow_utils.concat([]), second])
+    assert table.to_pydict() == {'Qty': ['1', '2'], 'Unit': [None, 'pcs']}
+    assert arrow_utils.concat([]).num_rows == 0
+
+def test_select_drops_rows_left_empty():
+    table = arrow_utils.table_from_columns({'Qty': ['1', None, None], 'Unit': [None, 'pcs', None],
+                                            'Note': ['a', 'b', 'c']})
+    assert arrow_utils.select(table, ['Qty', 'Unit']).to_pydict() == {'Qty': ['1', None], 'Unit': [None, 'pcs']}
+    assert arrow_utils.select(table, ['Missing']).num_rows == 0
+
+def test_joined_values():
+    table = arrow_utils.table_from_columns({'Model': [' dy1 ', None], 'Material': ['steel', '']})
+    assert arrow_utils.joined_values(table, ['Model', 'Material', 'Missing']) == ['dy1 steel', '']
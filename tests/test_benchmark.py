@@ -0,0 +1,18 @@
+import benchmark
+
+def result(stage, seconds):
+    return {'case': 'xlsx-30r', 'stage': stage, 'seconds': seconds}
+
+def test_compare_flags_significant_slowdowns_only():
+    baseline = {'meta': {}, 'results': [result('populate_excel', 0.100), result('needs_ocr', 0.001),
+                                        result('populate_excel_warm', 0.050)]}
+    results = [result('populate_excel', 0.150), result('needs_ocr', 0.003), result('populate_excel_warm', 0.052)]
+    # needs_ocr tripled, but by less than MIN_SIGNIFICANT_DELTA
+    assert benchmark.compare(results, baseline, 0.10) == [results[0]]
+
+def test_recorder_runs_setup_before_every_timed_run():
+    calls = []
+    rec = benchmark.Recorder(3)
+    rec.run('case', 'stage', lambda: calls.append('run'), setup=lambda: calls.append('setup'))
+    assert calls == ['setup', 'run'] * 3
+    assert rec.results[0]['runs'] == 3
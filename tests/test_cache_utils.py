@@ -0,0 +1,38 @@
+import os
+import threading
+
+import cache_utils
+
+def test_lru_evicts_least_recently_used():
+    cache_utils.lru_put('test_lru', 'a', 1, 2)
+    cache_utils.lru_put('test_lru', 'b', 2, 2)
+    assert cache_utils.lru_get('test_lru', 'a') == 1
+    cache_utils.lru_put('test_lru', 'c', 3, 2)
+    assert cache_utils.lru_get('test_lru', 'b') is None
+    assert cache_utils.lru_get('test_lru', 'a') == 1
+
+def test_concurrent_atomic_writes_leave_one_complete_file(tmp_path):
+    path = str(tmp_path / 'entry')
+
+    def write(i):
+        for _ in range(50):
+            cache_utils.write_atomic(path, bytes([i]) * 10000)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with open(path, 'rb') as f:
+        content = f.read()
+    assert len(content) == 10000 and len(set(content)) == 1
+    assert [p.name for p in tmp_path.iterdir()] == ['entry']
+
+def test_disk_lru_evicts_the_oldest_entries(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache_utils, 'CACHE_DIR', str(tmp_path))
+    for i, name in enumerate(['a', 'b', 'c']):
+        cache_utils.disk_lru_put('test', name, b'x' * 100, max_bytes=250)
+        # Distinct recencies on filesystems with coarse mtimes
+        os.utime(tmp_path / 'test' / name, (i, i))
+    assert cache_utils.disk_lru_get('test', 'a') is None
+    assert cache_utils.disk_lru_get('test', 'c') == b'x' * 100
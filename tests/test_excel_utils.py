@@ -0,0 +1,58 @@
+import io
+import zipfile
+
+import pytest
+
+import excel_utils
+
+@pytest.mark.parametrize('policy', ['fastest', 'balanced', 'smallest'])
+def test_write_workbook_round_trip(template_path, policy):
+    def chunks():
+        yield b'<a>'
+        yield b'<b/>' * 1000
+        yield b'</a>'
+
+    output = io.BytesIO()
+    excel_utils.write_workbook(template_path, output, {'xl/worksheets/sheet1.xml': chunks()}, policy)
+    with zipfile.ZipFile(template_path) as zin, zipfile.ZipFile(output) as zout:
+        assert zout.testzip() is None
+        assert zout.namelist() == zin.namelist()
+        assert zout.read('xl/worksheets/sheet1.xml') == b'<a>' + b'<b/>' * 1000 + b'</a>'
+        for name in zin.namelist():
+            if name != 'xl/worksheets/sheet1.xml':
+                assert zout.read(name) == zin.read(name)
+
+def test_write_zip_refuses_more_entries_than_zip_holds(template_path, monkeypatch):
+    monkeypatch.setattr(excel_utils, 'ZIP_MAX_ENTRIES', 3)
+    with pytest.raises(ValueError):
+        excel_utils.write_workbook(template_path, io.BytesIO(), {})
+
+def test_write_zip_refuses_members_past_4_gib(template_path, monkeypatch):
+    monkeypatch.setattr(excel_utils, 'ZIP_MAX_SIZE', 1000)
+    with pytest.raises(ValueError):
+        excel_utils.write_workbook(template_path, io.BytesIO(), {'xl/worksheets/sheet1.xml': [b'<a/>' * 1000]})
+
+def test_split_sheet_reproduces_the_sheet(template_path):
+    with zipfile.ZipFile(template_path) as zin:
+        sheet = zin.read('xl/worksheets/sheet2.xml').decode('utf-8')
+    head, rows, tail = excel_utils.split_sheet(sheet)
+    assert head + ''.join(xml for _, xml in rows) + tail == sheet
+    assert [r for r, _ in rows] == sorted(r for r, _ in rows)
+
+def test_split_sheet_opens_empty_sheet_data():
+    head, rows, tail = excel_utils.split_sheet('<worksheet><sheetData/></worksheet>')
+    assert (head, rows, tail) == ('<worksheet><sheetData>', [], '</sheetData></worksheet>')
+
+def test_split_sheet_refuses_rows_without_r():
+    with pytest.raises(ValueError):
+        excel_utils.split_sheet('<sheetData><row r="1"/><row spans="1:2"><c r="A2"/></row></sheetData>')
+
+def test_render_row_merges_cells_in_column_order():
+    template_row = '<row r="6" ht="15"><c r="A6" s="3"/><c r="C6" s="4"><v>7</v></c></row>'
+    xml = excel_utils.render_row(6, template_row, [(2, 'str', 'a & b', None), (3, 'num', 1.5, 9)])
+    assert xml == ('<row r="6" ht="15"><c r="A6" s="3"/><c r="B6" t="inlineStr"><is><t>a &amp; b</t></is></c>'
+                   '<c r="C6" s="9"><v>1.5</v></c></row>')
+
+def test_render_row_refuses_cells_without_r():
+    with pytest.raises(ValueError):
+        excel_utils.render_row(3, '<row r="3"><c r="A3"/><c s="2"><v>1</v></c></row>', [(1, 'num', 5, None)])
@@ -0,0 +1,41 @@
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import app
+import arrow_utils
+
+def rows():
+    return arrow_utils.table_from_columns({
+        'model': ['brake pad', 'disc'],
+        'material': ['steel', None],
+        'qty': ['12,5', ''],
+        'unit': ['pcs', 'set'],
+    })
+
+def test_export_table_holds_the_rows_as_written(excel_headers):
+    names = dict(excel_headers)
+    mapping = {3: ['model', 'material'], 5: ['qty'], 7: ['unit'], 8: []}
+    table = app.build_export_table(rows(), mapping, excel_headers)
+    assert table.column_names == [names[3], names[5], names[7]]
+    assert table.column(names[3]).to_pylist() == ['BRAKE PAD STEEL', 'DISC']
+    # Numbers and blanks only: a numeric column
+    assert table.schema.field(names[5]).type == pa.float64()
+    assert table.column(names[5]).to_pylist() == [12.5, None]
+    assert table.column(names[7]).to_pylist() == ['pcs', 'set']
+
+@pytest.mark.parametrize('fmt', ['parquet', 'csv'])
+def test_export_bytes_read_back(excel_headers, fmt):
+    table = app.build_export_table(rows(), {3: ['model'], 5: ['qty']}, excel_headers)
+    payload = arrow_utils.export_bytes(table, fmt)
+    if fmt == 'parquet':
+        assert pq.read_table(io.BytesIO(payload)).equals(table)
+    else:
+        header = payload.decode('utf-8').splitlines()[0]
+        assert header == ','.join(f'"{name}"' for name in table.column_names)
+
+def test_export_bytes_refuses_unknown_formats():
+    with pytest.raises(ValueError):
+        arrow_utils.export_bytes(pa.table({}), 'xls')
@@ -0,0 +1,53 @@
+import types
+
+import pytest
+
+import app
+import arrow_utils
+import extraction_store
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction_store, 'DB_PATH', str(tmp_path / 'extractions.sqlite3'))
+    monkeypatch.setattr(extraction_store, '_initialised', False)
+
+def rows():
+    return arrow_utils.table_from_columns({'Description': ['Brake pad', None, 'Disc'], 'Qty': ['4', '2', None]})
+
+def test_save_and_lookup_round_trip():
+    extraction_store.save('d1', 'a.pdf', 'pdf', ['Description', 'Qty'], rows(), used_ocr=True)
+    stored = extraction_store.lookup('d1')
+    assert stored['headers'] == ['Description', 'Qty']
+    assert stored['rows'].equals(rows())
+    assert (stored['file_name'], stored['row_count'], stored['settings']) == \
+        ('a.pdf', 3, extraction_store.settings(used_ocr=True))
+
+def test_lookup_misses_unknown_and_only_seen_documents():
+    assert extraction_store.lookup('unknown') is None
+    extraction_store.mark_seen('d2', 'b.pdf', 'pdf')
+    assert extraction_store.lookup('d2') is None
+
+def test_lookup_ignores_rows_of_an_older_extractor(monkeypatch):
+    extraction_store.save('d3', 'c.xlsx', 'xlsx', ['Qty'], rows())
+    monkeypatch.setattr(extraction_store, 'EXTRACTOR_VERSION', extraction_store.EXTRACTOR_VERSION + 1)
+    assert extraction_store.lookup('d3') is None
+
+def test_mark_seen_reports_earlier_uploads():
+    assert extraction_store.mark_seen('d4', 'first.pdf', 'pdf') is None
+    previous = extraction_store.mark_seen('d4', 'again.pdf', 'pdf')
+    assert (previous['file_name'], previous['seen_count']) == ('first.pdf', 1)
+    # Saving the rows keeps the sightings
+    extraction_store.save('d4', 'again.pdf', 'pdf', ['Qty'], rows())
+    assert extraction_store.mark_seen('d4', 'third.pdf', 'pdf')['seen_count'] == 2
+
+def test_session_memoises_stored_extractions_but_not_misses(monkeypatch):
+    monkeypatch.setattr(app, 'st', types.SimpleNamespace(session_state={}))
+    lookups = []
+    lookup = extraction_store.lookup
+    monkeypatch.setattr(extraction_store, 'lookup', lambda digest: lookups.append(digest) or lookup(digest))
+
+    assert app.get_stored_extraction('d5') is None
+    extraction_store.save('d5', 'd.pdf', 'pdf', ['Qty'], rows())
+    for _ in range(3):
+        assert app.get_stored_extraction('d5')['row_count'] == 3
+    assert lookups == ['d5', 'd5']
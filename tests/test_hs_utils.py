@@ -0,0 +1,113 @@
+import os
+import shutil
+
+import pytest
+
+import api_server
+import app
+import arrow_utils
+import hs_utils
+import synthetic_invoices
+
+NOMENCLATURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hs_nomenclature.csv')
+DESCRIPTION_COL = 3
+
+@pytest.fixture
+def nomenclature(monkeypatch):
+    monkeypatch.setattr(hs_utils, 'NOMENCLATURE_PATH', NOMENCLATURE)
+    return NOMENCLATURE
+
+@pytest.fixture
+def no_nomenclature(monkeypatch, tmp_path):
+    path = str(tmp_path / 'missing.csv')
+    monkeypatch.setattr(hs_utils, 'NOMENCLATURE_PATH', path)
+    return path
+
+@pytest.fixture(scope='module')
+def index():
+    return hs_utils.HSIndex(hs_utils.read_nomenclature(NOMENCLATURE))
+
+def test_tokens_normalise_descriptions():
+    assert hs_utils.tokens("Pièces détachées pour les FREINS, 2 x DY100") == {'PIECE', 'DETACHEE', 'FREIN', 'DY100'}
+
+def test_read_nomenclature_keeps_coded_lines():
+    entries = hs_utils.read_nomenclature(NOMENCLATURE)
+    assert len(entries) == 13
+    assert entries[0] == ('87', 'Voitures automobiles, tracteurs, cycles')
+    assert ('870830', '- Freins et servo-freins; leurs parties') in entries
+
+def test_index_returns_the_most_detailed_codes(index):
+    assert index.codes == ['0101210000', '7009100000', '7320200000', '8708300000', '8714101000', '8714109000']
+
+@pytest.mark.parametrize('description, code', [
+    ('REAR-VIEW MIRROR FOR VEHICLES', '7009100000'),
+    ('HELICAL SPRINGS STEEL', '7320200000'),
+    # "- - - Autres" is found through the words of its parent headings
+    ('PARTIES DE MOTOCYCLES', '8714109000'),
+    ('UNKNOWN WIDGET', None),
+])
+def test_lookup(index, description, code):
+    assert index.lookup(description)[0] == code
+
+def test_lookup_many_skips_empty_descriptions(index):
+    assert index.lookup_many(['', 'rear view mirror', 'rear view mirror']) == [None, '7009100000', '7009100000']
+
+def test_get_index_reloads_an_edited_nomenclature(tmp_path):
+    path = str(tmp_path / 'nomenclature.csv')
+    shutil.copy(NOMENCLATURE, path)
+    first = hs_utils.get_index(path)
+    assert len(first.codes) == 6 and hs_utils.load_error is None
+    assert hs_utils.get_index(path) is first
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('8501.10.00.00;Electric motors\n')
+    reloaded = hs_utils.get_index(path)
+    assert reloaded is not first and len(reloaded.codes) == 7
+
+def test_get_index_reports_a_missing_nomenclature(no_nomenclature):
+    assert hs_utils.get_index() is None
+    assert hs_utils.load_error == f"No HS nomenclature at '{no_nomenclature}' (set HS_NOMENCLATURE_PATH)"
+
+@pytest.mark.parametrize('content, error', [
+    (b'\xff\xfe broken', "Could not load HS nomenclature"),
+    ('Code;Désignation\n'.encode('utf-8'), "holds no codes"),
+])
+def test_get_index_reports_an_unusable_nomenclature(tmp_path, content, error):
+    path = tmp_path / 'nomenclature.csv'
+    path.write_bytes(content)
+    assert hs_utils.get_index(str(path)) is None
+    assert error in hs_utils.load_error
+
+def test_enrich_rows_adds_the_looked_up_codes(nomenclature, excel_headers):
+    rows = arrow_utils.table_from_columns({'model': ['Rear view mirror', 'unknown widget', None]})
+    mapping = {2: [app.HS_CODE_HEADER], DESCRIPTION_COL: ['model']}
+    enriched, key = app.enrich_rows(rows, mapping, excel_headers)
+    assert enriched.column(app.HS_CODE_HEADER).to_pylist() == ['7009100000', None, None]
+    assert key == (('model',), hs_utils.get_index().digest)
+    streamed, _ = app.enrich_rows(iter([rows.slice(0, 1), rows.slice(1)]), mapping, excel_headers)
+    assert [c for t in streamed for c in t.column(app.HS_CODE_HEADER).to_pylist()] == ['7009100000', None, None]
+
+def test_hs_lookup_warning_only_when_mapped_and_unavailable(monkeypatch, no_nomenclature):
+    assert app.hs_lookup_warning({DESCRIPTION_COL: ['model']}) is None
+    warning = app.hs_lookup_warning({2: [app.HS_CODE_HEADER]})
+    assert no_nomenclature in warning
+    monkeypatch.setattr(hs_utils, 'NOMENCLATURE_PATH', NOMENCLATURE)
+    assert app.hs_lookup_warning({2: [app.HS_CODE_HEADER]}) is None
+
+def hs_mapping(pdf, template_path):
+    default = api_server.inspect_upload(pdf, 'invoice.pdf', template_path)['default_mapping']
+    return dict(default, **{'2': [app.HS_CODE_HEADER]})
+
+def test_api_warns_when_hs_codes_cannot_be_looked_up(template_path, no_nomenclature):
+    pdf, rows = synthetic_invoices.make_text_pdf(1, rows_per_page=5)
+    mapping = hs_mapping(pdf, template_path)
+    _, info = api_server.convert(pdf, 'invoice.pdf', mapping, template_path, use_cache=False)
+    assert info['items'] == rows
+    assert len(info['warnings']) == 1 and no_nomenclature in info['warnings'][0]
+    _, info = api_server.export(pdf, 'invoice.pdf', mapping, template_path, 'csv', use_cache=False)
+    assert len(info['warnings']) == 1
+
+def test_api_maps_looked_up_hs_codes(template_path, nomenclature):
+    pdf, _ = synthetic_invoices.make_text_pdf(1, rows_per_page=5)
+    _, info = api_server.convert(pdf, 'invoice.pdf', hs_mapping(pdf, template_path), template_path,
+                                 use_cache=False)
+    assert info['warnings'] == []
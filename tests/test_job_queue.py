@@ -0,0 +1,22 @@
+import time
+
+import job_queue
+
+def test_job_queue_runs_jobs_and_purges_them(monkeypatch):
+    def job(context, value):
+        context.progress(1, 1, "Done")
+        return value, {'size': len(value)}
+
+    job_id = job_queue.submit('test', job, b'result')
+    deadline = time.time() + 10
+    while job_queue.get(job_id)['status'] not in job_queue.FINISHED and time.time() < deadline:
+        time.sleep(0.05)
+    record = job_queue.get(job_id)
+    assert (record['status'], record['meta']) == (job_queue.DONE, {'size': 6})
+    assert job_queue.result(job_id) == b'result'
+
+    # Expired jobs are purged by later submits
+    monkeypatch.setattr(job_queue, 'RETENTION_S', -1)
+    monkeypatch.setattr(job_queue, 'PURGE_INTERVAL_S', 0)
+    job_queue.submit('test', job, b'other')
+    assert job_queue.get(job_id) is None
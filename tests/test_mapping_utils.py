@@ -0,0 +1,58 @@
+import pytest
+
+import mapping_utils
+
+@pytest.fixture(autouse=True)
+def learned_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'learned.json')
+    monkeypatch.setattr(mapping_utils, '_learned_path', lambda: path)
+    return path
+
+def mapped(mapping):
+    return {col: cols for col, cols in mapping.items() if cols}
+
+def test_trigram_scores_are_dice_coefficients():
+    index = mapping_utils.TrigramIndex([(1, 'qty'), (2, 'quantity')])
+    scores = index.scores(['QTY', "Q'ty", 'unrelated'])
+    assert scores[0, 0] == 1.0
+    assert 0 < scores[1, 0] < 1
+    assert scores[2].max() == 0
+
+def test_suggest_supplier_invoice_headers(excel_headers):
+    headers = ['No.', 'product models', 'Materials', 'Photos', 'QTY', 'Unit Price', 'AMOUNT', 'CTN']
+    assert mapped(mapping_utils.suggest(headers, excel_headers)) == {
+        3: ['product models', 'Materials'], 4: ['AMOUNT'], 5: ['QTY'], 12: ['CTN'],
+    }
+
+@pytest.mark.parametrize('line_number', ['Item', 'No', 'no.', '#', 'N°', 'Pos'])
+def test_line_number_columns_are_never_suggested(excel_headers, line_number):
+    headers = [line_number, 'Description', 'Qty', 'Unit Price', 'Amount']
+    assert mapped(mapping_utils.suggest(headers, excel_headers)) == {3: ['Description'], 4: ['Amount'], 5: ['Qty']}
+
+def test_learned_mapping_needs_confirmation(excel_headers):
+    headers = ['ZZQ col', 'Description']
+    mapping_utils.remember({7: ['ZZQ col']}, excel_headers, headers)
+    assert mapping_utils.suggest(headers, excel_headers)[7] == []
+    mapping_utils.remember({7: ['ZZQ col']}, excel_headers, headers)
+    assert mapping_utils.suggest(headers, excel_headers)[7] == ['ZZQ col']
+
+def test_newer_mappings_replace_older_ones(excel_headers):
+    headers = ['ZZQ col']
+    for col in (7, 7, 7, 7, 8):
+        mapping_utils.remember({col: ['ZZQ col']}, excel_headers, headers)
+    suggestion = mapping_utils.suggest(headers, excel_headers)
+    assert (suggestion[7], suggestion[8]) == (['ZZQ col'], [])
+    mapping_utils.remember({8: ['ZZQ col']}, excel_headers, headers)
+    suggestion = mapping_utils.suggest(headers, excel_headers)
+    assert (suggestion[7], suggestion[8]) == ([], ['ZZQ col'])
+
+def test_headers_left_unmapped_stop_being_suggested(excel_headers):
+    headers = ['Materials', 'QTY']
+    for _ in range(2):
+        mapping_utils.remember({5: ['QTY']}, excel_headers, headers)
+    assert mapped(mapping_utils.suggest(headers, excel_headers)) == {5: ['QTY']}
+
+def test_learned_version_counts_recorded_mappings(excel_headers):
+    assert mapping_utils.learned_version() == 0
+    mapping_utils.remember({5: ['QTY']}, excel_headers, ['QTY'])
+    assert mapping_utils.learned_version() == 1
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+import memory_budget
+import perf_utils
+
+@pytest.fixture
+def rss(monkeypatch):
+    """Controllable process RSS in MB"""
+    value = {'mb': 500.0}
+    monkeypatch.setattr(perf_utils, 'current_rss_mb', lambda: value['mb'])
+    return value
+
+def test_budget_counts_the_jobs_own_charges(rss):
+    with memory_budget.budget(100, input_size=10 * memory_budget.MB) as budget:
+        memory_budget.charge('rows', 30)
+        assert budget.used_mb() == 40
+        assert not memory_budget.should_downgrade()
+        assert memory_budget.should_downgrade(needed_mb=70)
+        memory_budget.release('rows')
+        assert budget.used_mb() == 10
+    assert memory_budget.current() is None
+
+def test_budget_counts_uncharged_memory_from_rss(rss):
+    with memory_budget.budget(100) as budget:
+        memory_budget.charge('rows', 5)
+        # e.g. pdfplumber layout objects, which nothing charges
+        rss['mb'] += 80
+        assert budget.used_mb() == 80
+        assert memory_budget.should_downgrade()
+        rss['mb'] += 40
+        with pytest.raises(memory_budget.MemoryBudgetExceeded):
+            memory_budget.checkpoint('PDF extraction')
+    assert budget.peak_used_mb == 120
+
+def test_budget_falls_back_to_charges_without_rss(monkeypatch):
+    monkeypatch.setattr(perf_utils, 'current_rss_mb', lambda: None)
+    with memory_budget.budget(100):
+        memory_budget.charge('cells', 150)
+        with pytest.raises(memory_budget.MemoryBudgetExceeded):
+            memory_budget.checkpoint('cell preparation')
+
+def test_rss_growth_leaves_out_other_jobs_charges(rss):
+    with memory_budget.budget(100) as small:
+        other = memory_budget.MemoryBudget(100)
+        other.charge('rows', 90)
+        rss['mb'] += 95
+        assert small.used_mb() == 5
+        other.release_all()
+
+def test_jobs_do_not_share_charges(monkeypatch):
+    monkeypatch.setattr(perf_utils, 'current_rss_mb', lambda: None)
+    used = {}
+
+    def job(name, size_mb):
+        with memory_budget.budget(100) as budget:
+            memory_budget.charge('rows', size_mb)
+            barrier.wait()
+            used[name] = budget.used_mb()
+
+    barrier = threading.Barrier(2)
+    threads = [threading.Thread(target=job, args=('small', 1)), threading.Thread(target=job, args=('large', 90))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert used == {'small': 1, 'large': 90}
+    assert memory_budget._charged_mb == 0
@@ -0,0 +1,45 @@
+import shutil
+import zipfile
+
+import app
+import excel_utils
+
+MAPPING = {3: ['Description'], 5: ['Qty']}
+
+def key(template_path, **changes):
+    args = dict(input_digest='a' * 64, mapping=MAPPING, template_path=template_path, string_mode='inline',
+                compression='balanced', bundle='combined')
+    args.update(changes)
+    return app.output_cache_key(**args)
+
+def test_key_changes_with_every_input_of_the_workbook(template_path):
+    base = key(template_path)
+    assert key(template_path) == base
+    # Columns left unmapped do not matter
+    assert key(template_path, mapping={**MAPPING, 7: []}) == base
+    changed = [
+        key(template_path, input_digest='b' * 64),
+        key(template_path, mapping={3: ['Description'], 5: ['Quantity']}),
+        key(template_path, string_mode='shared'),
+        key(template_path, compression='smallest'),
+        key(template_path, bundle='separate'),
+    ]
+    assert len({base, *changed}) == len(changed) + 1
+
+def test_key_changes_with_the_writer_version(template_path, monkeypatch):
+    base = key(template_path)
+    monkeypatch.setattr(excel_utils, 'WRITER_VERSION', excel_utils.WRITER_VERSION + 1)
+    assert key(template_path) != base
+
+def test_key_changes_when_the_template_is_edited(template_path, tmp_path):
+    copy = tmp_path / 'template.xlsx'
+    shutil.copy(template_path, copy)
+    base = key(str(copy))
+    with zipfile.ZipFile(copy, 'a') as z:
+        z.writestr('customXml/test.xml', '<test/>')
+    assert key(str(copy)) != base
+
+def test_cached_output_round_trip():
+    app.put_cached_output('c' * 64, b'PK\x03\x04 workbook\n bytes', {'items': 3})
+    assert app.get_cached_output('c' * 64) == (b'PK\x03\x04 workbook\n bytes', {'items': 3})
+    assert app.get_cached_output('d' * 64) is None
@@ -0,0 +1,76 @@
+from io import BytesIO
+
+import pytest
+
+import app
+import pdf_utils
+import synthetic_invoices
+
+HEADERS = synthetic_invoices.HEADERS
+
+def invoice_starts(pdf_bytes, workers=1):
+    return app.split_invoices(app.extract_pdf_data(BytesIO(pdf_bytes), HEADERS, workers=workers))
+
+@pytest.mark.parametrize('text, expected', [
+    ('TOTAL: 1520.00', True),
+    ('Grand Total 1,520.00', True),
+    ('Invoice total: 1520', True),
+    ('  Totals   1520', True),
+    ('Total carried forward: 820.00', False),
+    ('Total c/f 820.00', False),
+    ('Total brought forward 820.00', False),
+    ('Total page 2: 820.00', False),
+    ('Total this page 820.00', False),
+    ('Sub-total 820.00', False),
+    ('Subtotal 820.00', False),
+    ('Page total 820.00', False),
+    ('Totally unrelated', False),
+])
+def test_has_totals_only_matches_closing_totals(text, expected):
+    assert pdf_utils.has_totals(f"PROFORMA INVOICE\n{text}\nThank you") == expected
+
+@pytest.mark.parametrize('text, expected', [
+    ('Invoice No: PI-2024/001', 'PI-2024/001'),
+    ('INVOICE NO. 88213', '88213'),
+    ('Invoice number: inv-7', 'INV-7'),
+    ('Invoice # 12', '12'),
+    # The title then the table's 'no' header column
+    ('PROFORMA INVOICE\nno product models QTY', None),
+])
+def test_invoice_number(text, expected):
+    assert pdf_utils.invoice_number(text) == expected
+
+def test_splitter_follows_invoice_numbers():
+    splitter = pdf_utils.InvoiceSplitter()
+    header = ['no', 'QTY']
+    pages = [
+        (header, 'Invoice No: A-1'),
+        # Same number: per-page totals and a repeated header row do not split
+        (header, 'Invoice No: A-1\nTOTAL: 10'),
+        (header, 'Invoice No: A-1'),
+        # New number, even without a header row
+        (None, 'Invoice No: A-2'),
+    ]
+    assert [splitter.starts_invoice(*page) for page in pages] == [True, False, False, True]
+
+def test_splitter_needs_a_header_row_after_the_totals():
+    splitter = pdf_utils.InvoiceSplitter()
+    header = ['no', 'QTY']
+    pages = [(header, ''), (None, 'TOTAL: 10'), (None, 'Terms and conditions'), (header, ''), (None, '')]
+    assert [splitter.starts_invoice(*page) for page in pages] == [True, False, False, True, False]
+
+def test_long_invoice_with_page_totals_is_one_invoice():
+    pdf, rows = synthetic_invoices.make_text_pdf(4, rows_per_page=5, page_totals=True)
+    invoices = invoice_starts(pdf)
+    assert [part.num_rows for part in invoices] == [rows]
+
+def test_bundle_is_split_into_its_invoices():
+    pdf, counts = synthetic_invoices.make_bundle_pdf(3, 2, rows_per_page=5)
+    assert [part.num_rows for part in invoice_starts(pdf)] == counts
+
+def test_worker_processes_read_the_same_pages(monkeypatch):
+    monkeypatch.setattr(pdf_utils, 'PARALLEL_MIN_PAGES', 2)
+    pdf, counts = synthetic_invoices.make_bundle_pdf(2, 3, rows_per_page=5)
+    parallel = app.extract_pdf_data(BytesIO(pdf), HEADERS, workers=2)
+    assert parallel.equals(app.extract_pdf_data(BytesIO(pdf), HEADERS, workers=1))
+    assert [part.num_rows for part in app.split_invoices(parallel)] == counts
@@ -0,0 +1,95 @@
+import zipfile
+from io import BytesIO
+
+import openpyxl
+import pytest
+
+import app
+import arrow_utils
+import excel_utils
+import template_registry
+import verify_utils
+from conftest import TEMPLATE_PATH
+
+ROWS = 250
+MAPPING = {3: ['model', 'material'], 4: ['amount'], 5: ['qty'], 2: ['hs']}
+
+def make_rows(count=ROWS):
+    return arrow_utils.table_from_columns({
+        'model': [f'brake pad dy{i}' for i in range(count)],
+        'material': ['steel' if i % 2 else None for i in range(count)],
+        'qty': [str(i + 1) for i in range(count)],
+        'amount': [f'{i * 1.25:.2f}' for i in range(count)],
+        'hs': ['0101210000'] * count,
+    })
+
+def fill(data, template_path, excel_headers, string_mode='inline'):
+    output = app.populate_excel(data, template_path, MAPPING, excel_headers, string_mode)
+    content = output.read()
+    output.close()
+    return content
+
+@pytest.fixture(scope='module')
+def template_sheet():
+    workbook = openpyxl.load_workbook(TEMPLATE_PATH)
+    return {cell.coordinate: cell.value for row in workbook.worksheets[1].iter_rows() for cell in row}
+
+@pytest.mark.parametrize('string_mode', ['inline', 'shared'])
+def test_filled_workbook_reads_back_as_template_plus_rows(template_path, excel_headers, template_sheet, string_mode):
+    rows = make_rows()
+    workbook = openpyxl.load_workbook(BytesIO(fill(rows, template_path, excel_headers, string_mode)))
+    sheet = workbook.worksheets[1]
+
+    expected = dict(template_sheet)
+    start = template_registry.get(template_path).start_row
+    for i, row in enumerate(rows.to_pylist()):
+        r = start + i
+        description = row['model'] + (' ' + row['material'] if row['material'] else '')
+        expected[f'C{r}'] = description.upper()
+        expected[f'D{r}'] = float(row['amount'])
+        expected[f'E{r}'] = int(row['qty'])
+        # Codes stay text, leading zeros included
+        expected[f'B{r}'] = row['hs']
+    actual = {cell.coordinate: cell.value for row in sheet.iter_rows() for cell in row}
+    assert {k: v for k, v in actual.items() if v is not None} == {k: v for k, v in expected.items() if v is not None}
+
+def test_large_fill_writes_the_same_sheet(template_path, excel_headers, monkeypatch):
+    # Two workers even on a single-core host, so the rows are split across processes
+    monkeypatch.setattr(excel_utils.os, 'cpu_count', lambda: 2)
+    rows = make_rows()
+    sheet_path = template_registry.get(template_path).sheet_path
+    sheets = []
+    for large_fill in (False, True):
+        output = app.populate_excel(rows, template_path, MAPPING, excel_headers, large_fill=large_fill)
+        with zipfile.ZipFile(output) as zout:
+            sheets.append(zout.read(sheet_path))
+    assert sheets[0] == sheets[1]
+
+def test_table_and_streamed_fills_write_the_same_sheet(template_path, excel_headers):
+    rows = make_rows()
+    table = fill(rows, template_path, excel_headers)
+    streamed = fill(iter([rows.slice(0, 100), rows.slice(100)]), template_path, excel_headers)
+    sheet_path = template_registry.get(template_path).sheet_path
+    with zipfile.ZipFile(BytesIO(table)) as a, zipfile.ZipFile(BytesIO(streamed)) as b:
+        assert a.read(sheet_path) == b.read(sheet_path)
+
+def test_re_export_with_another_mapping_matches_a_fresh_fill(template_path, excel_headers):
+    rows = make_rows()
+    other = {3: ['model'], 5: ['qty'], 7: ['amount']}
+    app.populate_excel(rows, template_path, MAPPING, excel_headers, rows_key=('test-rows',)).close()
+    # Columns mapped as before come from the memoised values
+    reused = app.populate_excel(rows, template_path, other, excel_headers, rows_key=('test-rows',)).read()
+    fresh = app.populate_excel(rows, template_path, other, excel_headers).read()
+    sheet_path = template_registry.get(template_path).sheet_path
+    with zipfile.ZipFile(BytesIO(reused)) as a, zipfile.ZipFile(BytesIO(fresh)) as b:
+        assert a.read(sheet_path) == b.read(sheet_path)
+
+def test_filled_workbook_passes_verification(template_path, excel_headers):
+    template = template_registry.get(template_path)
+    problems = verify_utils.verify_workbook(BytesIO(fill(make_rows(), template_path, excel_headers)), template,
+                                            replaced={'xl/styles.xml'})
+    assert problems == []
+
+def test_extract_input_excel_data_returns_an_empty_table_on_error():
+    data = app.extract_input_excel_data(BytesIO(b'not a workbook'), ['qty'])
+    assert data.num_rows == 0
@@ -0,0 +1,71 @@
+import types
+
+import pandas as pd
+import pytest
+
+import app
+import arrow_utils
+
+def rows(count):
+    return arrow_utils.table_from_columns({
+        'model': [f'pad {i}' for i in range(count)],
+        'qty': [str(i) for i in range(count)],
+        'amount': ['1,25', 'n/a', '', '3'] * (count // 4),
+    })
+
+MAPPING = {3: ['model'], 4: ['amount'], 5: ['qty']}
+
+def test_summary_totals_match_the_written_numbers(excel_headers):
+    data = rows(8)
+    summary = app.build_summary(data, MAPPING, excel_headers)
+    names = dict(excel_headers)
+    assert summary['rows'] == 8
+    assert summary['totals'] == {
+        names[4]: pytest.approx(sum(app.clean_number(v) for v in data.column('amount').to_pylist() if v != 'n/a')),
+        names[5]: sum(range(8)),
+    }
+    # 'n/a' twice; blanks are not counted
+    assert summary['unparsed'] == 2
+
+class FakeStreamlit:
+    """Records what render_preview shows; the page number input returns page"""
+
+    def __init__(self, page):
+        self.page = page
+        self.inputs = []
+        self.frames = []
+
+    def number_input(self, label, min_value, max_value, value, key):
+        self.inputs.append((label, max_value))
+        return self.page
+
+    def dataframe(self, df):
+        self.frames.append(df)
+
+    def columns(self, count):
+        return [types.SimpleNamespace(metric=lambda *args: None) for _ in range(count)]
+
+    def info(self, message):
+        pass
+
+def test_preview_shows_one_page_numbered_as_in_the_extraction(excel_headers, monkeypatch):
+    fake = FakeStreamlit(page=3)
+    monkeypatch.setattr(app, 'st', fake)
+    data = rows(2 * app.PREVIEW_PAGE_ROWS + 40)
+    meta = {'preview': app.build_preview(data.slice(0, app.PREVIEW_PAGE_ROWS), MAPPING, excel_headers)}
+    app.render_preview(meta, data, MAPPING, excel_headers, 'page')
+
+    assert fake.inputs == [("Preview page (of 3)", 3)]
+    df = fake.frames[0]
+    first = 2 * app.PREVIEW_PAGE_ROWS
+    assert list(df.index) == list(range(first + 1, first + 41))
+    assert df[dict(excel_headers)[5]].tolist() == [str(i) for i in range(first, first + 40)]
+
+def test_preview_of_a_short_extraction_has_no_pages(excel_headers, monkeypatch):
+    fake = FakeStreamlit(page=1)
+    monkeypatch.setattr(app, 'st', fake)
+    data = rows(20)
+    meta = {'preview': app.build_preview(data, MAPPING, excel_headers)}
+    app.render_preview(meta, None, MAPPING, excel_headers, 'page')
+    assert fake.inputs == []
+    pd.testing.assert_frame_equal(fake.frames[0], pd.DataFrame(meta['preview'], index=range(1, 21)))
@@ -0,0 +1,32 @@
+import io
+
+import openpyxl
+import pytest
+
+import excel_utils
+from conftest import TEMPLATE_PATH
+
+def openpyxl_rows(source, sheet_index):
+    sheet = openpyxl.load_workbook(source).worksheets[sheet_index]
+    return {row[0].row: {cell.column: cell.value for cell in row if cell.value is not None}
+            for row in sheet.iter_rows()}
+
+@pytest.mark.parametrize('sheet_index', [0, 1])
+def test_template_rows_read_as_openpyxl_reads_them(sheet_index):
+    sheet_path = f'xl/worksheets/sheet{sheet_index + 1}.xml'
+    expected = openpyxl_rows(TEMPLATE_PATH, sheet_index)
+    # Header rows, shared formula masters and cells far down their ranges
+    for row_idx in [*range(1, 13), 500, max(expected)]:
+        assert excel_utils.read_row(TEMPLATE_PATH, sheet_path, row_idx) == expected.get(row_idx, {})
+
+def test_typed_values_read_as_openpyxl_reads_them():
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Qty', 'Price', 'Used?', 'Note'])
+    sheet.append([3, 2.5, True, '=A2*B2'])
+    sheet.append(['Description', None, False, 'x'])
+    source = io.BytesIO()
+    workbook.save(source)
+    expected = openpyxl_rows(source, 0)
+    for row_idx in (1, 2, 3, 4):
+        assert excel_utils.read_row(source, 'xl/worksheets/sheet1.xml', row_idx) == expected.get(row_idx, {})
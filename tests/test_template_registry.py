@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import threading
+import urllib.error
+import urllib.request
+import zipfile
+
+import pytest
+
+import api_server
+import template_registry
+
+@pytest.fixture(autouse=True)
+def load_errors(monkeypatch):
+    monkeypatch.setattr(template_registry, 'load_errors', {})
+
+@pytest.fixture
+def template_copy(template_path, tmp_path):
+    path = str(tmp_path / 'template.xlsx')
+    shutil.copy(template_path, path)
+    return path
+
+def touch_later(path, seconds):
+    """Move the file's mtime, as filesystems with coarse mtimes may not"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10**9))
+
+def test_get_reloads_an_edited_template(template_copy):
+    first = template_registry.get(template_copy)
+    assert template_registry.get(template_copy) is first
+    with zipfile.ZipFile(template_copy, 'a') as z:
+        z.writestr('customXml/test.xml', '<test/>')
+    touch_later(template_copy, 1)
+    reloaded = template_registry.get(template_copy)
+    assert reloaded is not first
+    assert reloaded.digest != first.digest
+    assert reloaded.headers == first.headers
+
+def test_broken_templates_are_recorded_until_fixed(template_copy, monkeypatch):
+    original = open(template_copy, 'rb').read()
+    with open(template_copy, 'wb') as f:
+        f.write(b'not a workbook')
+    monkeypatch.setattr(template_registry, 'TEMPLATES', {template_copy: template_registry.IDI_SETTINGS})
+
+    errors = template_registry.preload()
+    assert errors[template_copy].startswith('BadZipFile')
+    with pytest.raises(zipfile.BadZipFile):
+        template_registry.get(template_copy)
+
+    with open(template_copy, 'wb') as f:
+        f.write(original)
+    touch_later(template_copy, 1)
+    assert template_registry.preload() == {}
+
+@pytest.fixture
+def server(template_copy):
+    server = api_server.ApiServer(('127.0.0.1', 0), api_server.ConversionPool(1, template_copy), 1, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def health(server):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/health") as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+def test_health_reports_a_broken_template(server, template_copy):
+    assert health(server)[0] == 200
+    with open(template_copy, 'wb') as f:
+        f.write(b'not a workbook')
+    status, body = health(server)
+    assert (status, body['status']) == (503, 'error')
+    assert template_copy in body['template_errors']
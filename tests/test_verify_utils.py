@@ -0,0 +1,46 @@
+import zipfile
+from io import BytesIO
+
+import pytest
+
+import app
+import arrow_utils
+import template_registry
+import verify_utils
+from test_populate import MAPPING, fill, make_rows
+
+TALLY_COLUMNS = [(3, ['model', 'material'], False), (4, ['amount'], False), (5, ['qty'], False), (2, ['hs'], True)]
+
+def scan_output(content, template):
+    with zipfile.ZipFile(BytesIO(content)) as archive:
+        with archive.open(template.sheet_path) as sheet:
+            return verify_utils.scan_sheet(sheet, template.start_row, columns=MAPPING)[0]
+
+@pytest.mark.parametrize('string_mode', ['inline', 'shared'])
+def test_expected_tally_matches_the_written_cells(template_path, excel_headers, string_mode):
+    rows = make_rows()
+    expected = verify_utils.CellTally()
+    expected.add_table(rows, TALLY_COLUMNS)
+    template = template_registry.get(template_path)
+    found = scan_output(fill(rows, template_path, excel_headers, string_mode), template)
+    assert expected.compare(found) == []
+    assert expected.rows == found.rows == rows.num_rows
+
+def test_expected_tally_reads_numbers_as_the_writer_does():
+    rows = arrow_utils.table_from_columns({'qty': ['12,5', ' 3 ', '-2', 'n/a', None, '']})
+    tally = verify_utils.CellTally()
+    tally.add_table(rows, [(5, ['qty'], False)])
+    # clean_number keeps digits and points only, so '-2' is written as 2
+    assert tally.columns[5] == [3, 3, 17.5]
+
+def test_wrong_column_values_fail_verification(template_path, excel_headers, monkeypatch):
+    column_values = app.column_values
+
+    def shifted(items, input_cols, is_description, is_code):
+        values = column_values(items, input_cols, is_description, is_code)
+        # One amount off, as a stale or mixed-up memoised column would be
+        return [('num', '999')] + values[1:] if input_cols == ['amount'] else values
+
+    monkeypatch.setattr(app, 'column_values', shifted)
+    with pytest.raises(verify_utils.VerificationError):
+        fill(make_rows(), template_path, excel_headers)
@@ -1,5 +1,4 @@
 import ocr_utils
-import os
 
 pdf_path = "fa.pdf"
 
@@ -11,12 +10,6 @@ print(f"Needs OCR: {needs_ocr}")
 print("Forcing conversion to searchable PDF...")
 try:
     output = ocr_utils.convert_to_searchable_pdf(pdf_path)
-    print(f"Conversion successful. Output: {output}")
-    print(f"Output exists: {os.path.exists(output)}")
-    
-    # Clean up
-    if os.path.exists(output):
-        os.unlink(output)
-        print("Cleaned up output file.")
+    print(f"Conversion successful. Output: {len(output.getvalue())} bytes in memory")
 except Exception as e:
     print(f"Conversion failed: {e}")
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Streaming checks of filled workbooks, fast enough to run after every export:
+the output sheet is read in chunks and scanned with the writer's own row and
+cell patterns, and the other parts are compared with the template through
+the zip directory (CRC and size) without decompressing them. The cells found
+are compared with a tally computed from the extracted rows and the mapping,
+independently of the writer's cell preparation.
+
+    python verify_utils.py IDI_FILLED.xlsx [more.xlsx ...]
+"""
+import codecs
+import os
+import re
+import sys
+import zipfile
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import excel_utils
+import template_registry
+
+# Run verify_workbook after every export (see app.populate_excel)
+VERIFY_OUTPUT = os.environ.get('VERIFY_OUTPUT', '1') != '0'
+
+# Decompressed sheet XML read per step
+READ_CHUNK = 1024 * 1024
+
+# Numeric totals may differ by float rounding of the rendered values
+TOTAL_TOLERANCE = 1e-6
+
+# Template parts whose loss breaks the form (checkboxes, images, links, formulas)
+KEY_PARTS_RE = re.compile(r'^xl/(drawings/|ctrlProps/|media/|calcChain\.xml$|worksheets/_rels/)')
+
+class VerificationError(ValueError):
+    """Raised when a filled workbook fails verification"""
+
+    def __init__(self, problems):
+        super().__init__("Output verification failed: " + "; ".join(problems))
+        self.problems = problems
+
+class CellTally:
+    """
+    Cells per template column: text cells, numeric cells and their total,
+    over the filled rows. Expected from the extracted rows by add_table, or
+    found in a sheet by scan_sheet.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.columns = {}
+
+    def add_table(self, table, columns):
+        """
+        Tally the cells a table of extracted rows should give. Computed
+        column-wise with pyarrow.compute from the rows and the mapping, not
+        from the writer's cells, so a bug in cell preparation, memoised
+        columns or rendering shows up as a difference.
+        columns: (col_idx, input_cols, is_code) per mapped template column
+        """
+        for col_idx, input_cols, is_code in columns:
+            tally = self.columns.setdefault(col_idx, [0, 0, 0.0])
+            if is_code:
+                # Codes are always written as text
+                tally[0] += table.num_rows
+                continue
+            # Numbers as the writer reads them: decimal comma, '-?digits[.digits]'
+            text = pc.replace_substring(_joined(table, input_cols), ',', '.')
+            numbers = pc.filter(text, pc.match_substring_regex(text, r'^-?\d+(\.\d+)?$'))
+            # ...and cleans them (app.clean_number keeps digits and points only)
+            numbers = pc.cast(pc.replace_substring_regex(numbers, r'[^\d.]', ''), pa.float64())
+            tally[0] += table.num_rows - len(numbers)
+            tally[1] += len(numbers)
+            tally[2] += pc.sum(numbers).as_py() or 0
+        self.rows += table.num_rows
+
+    def compare(self, other):
+        """Differences between this (expected) tally and the output's"""
+        problems = []
+        if other.rows != self.rows:
+            problems.append(f"{other.rows} filled rows instead of {self.rows}")
+        for col_idx in sorted(self.columns):
+            texts, numbers, total = self.columns[col_idx]
+            out_texts, out_numbers, out_total = other.columns.get(col_idx, (0, 0, 0.0))
+            col = excel_utils.get_col_letter(col_idx)
+            if (out_texts, out_numbers) != (texts, numbers):
+                problems.append(f"column {col}: {out_numbers} numbers / {out_texts} texts "
+                                f"instead of {numbers} / {texts}")
+            elif abs(out_total - total) > TOTAL_TOLERANCE * max(1.0, abs(total)):
+                problems.append(f"column {col}: total {out_total:g} instead of {total:g}")
+        return problems
+
+def _joined(table, input_cols):
+    """Per row, the stripped non-empty cells of input_cols joined with spaces ('' if none)"""
+    parts = []
+    for col in input_cols:
+        if col in table.column_names:
+            values = table.column(col)
+            present = pc.and_(pc.is_valid(values), pc.not_equal(values, ''))
+            parts.append(pc.if_else(present, pc.utf8_trim_whitespace(values), pa.scalar(None, pa.string())))
+    if not parts:
+        return pa.array([''] * table.num_rows, pa.string())
+    return pc.fill_null(pc.binary_join_element_wise(*parts, ' ', null_handling='skip'), '')
+
+def scan_sheet(sheet_file, first_row, last_row=None, columns=None):
+    """
+    (tally, head, tail, next_row) of a sheet stream: the cells of rows
+    first_row to last_row (to the end if None) in the given columns (all if
+    None), the XML before and after the rows, and (row_idx, row_xml) of the
+    first row past last_row, or None. A row counts as filled if it holds a
+    value in one of the columns. Later rows are skipped unparsed.
+    """
+    # Filled cells are rendered by excel_utils.render_cell, reference first;
+    # cells of other columns are not even matched
+    letters = '|'.join(excel_utils.get_col_letter(c) for c in sorted(columns)) if columns is not None else '[A-Z]+'
+    cell_re = re.compile(r'<c r="(' + (letters or '(?!)') + r')(\d+)"([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+    next_row_tag = f'<row r="{last_row + 1}"' if last_row is not None else None
+    max_row = last_row if last_row is not None else float('inf')
+    texts = {}
+    numbers = {}
+    filled_rows = set()
+    
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    head = None
+    tail = None
+    next_row = None
+    while True:
+        chunk = sheet_file.read(READ_CHUNK)
+        # Characters split between chunks are completed by the next one
+        buffer += decoder.decode(chunk, final=not chunk)
+        if head is None:
+            data_start = buffer.find('<sheetData')
+            if data_start < 0:
+                if chunk:
+                    continue
+                return CellTally(), buffer, '', None
+            head_end = buffer.index('>', data_start) + 1
+            head, buffer = buffer[:head_end], buffer[head_end:]
+        
+        if tail is not None:
+            tail += buffer
+            buffer = ''
+        elif next_row is not None:
+            close = buffer.find('</sheetData>')
+            if close >= 0:
+                tail, buffer = buffer[close:], ''
+            else:
+                # Keep enough to find the closing tag split between chunks
+                buffer = buffer[-len('</sheetData>'):]
+        else:
+            # Cells of the complete rows in the buffer, up to the first row past last_row
+            close = buffer.find('</sheetData>')
+            if close >= 0:
+                end = close
+            else:
+                end = buffer.rfind('</row>')
+                end = end + len('</row>') if end >= 0 else 0
+            past = buffer.find(next_row_tag, 0, end) if next_row_tag else -1
+            if past >= 0:
+                match = excel_utils.ROW_RE.match(buffer, past)
+                if match is not None:
+                    next_row = (last_row + 1, match.group(0))
+                    end = past
+            for col, row, attrs, body in cell_re.findall(buffer, 0, end):
+                # Empty (styled) cells and formulas are not data
+                if not body or '<f' in body or not first_row <= int(row) <= max_row:
+                    continue
+                if ' t="' in attrs and ' t="n"' not in attrs:
+                    texts[col] = texts.get(col, 0) + 1
+                elif body.startswith('<v>'):
+                    numbers.setdefault(col, []).append(body[3:-4])
+                else:
+                    continue
+                filled_rows.add(row)
+            buffer = buffer[end:]
+            if close >= 0 and next_row is None:
+                tail, buffer = buffer, ''
+        
+        if not chunk:
+            break
+    
+    if tail is None:
+        close = buffer.find('</sheetData>')
+        tail = buffer[close:] if close >= 0 else ''
+    
+    tally = CellTally()
+    tally.rows = len(filled_rows)
+    for col in set(texts) | set(numbers):
+        values = [float(v) for v in numbers.get(col, ())]
+        tally.columns[excel_utils.get_col_index(col)] = [texts.get(col, 0), len(values), sum(values)]
+    return tally, head, tail, next_row
+
+def verify_workbook(output, template, expected=None, replaced=()):
+    """
+    Problems found in a filled workbook (empty list if it is sound):
+    - the template parts (drawings, ctrlProps, calcChain, rels...) are all
+      present and unchanged, apart from the replaced ones
+    - the data sheet keeps the template's XML around its rows (hyperlinks,
+      legacy drawing, controls...)
+    - the filled rows hold the expected cells (a CellTally, see add_table)
+    output: path or binary file object; template: template_registry.Template
+    """
+    problems = []
+    replaced = set(replaced) | {template.sheet_path}
+    with zipfile.ZipFile(template.path) as zin:
+        template_parts = {info.filename: info for info in zin.infolist()}
+    with zipfile.ZipFile(output) as zout:
+        output_parts = {info.filename: info for info in zout.infolist()}
+        for name, info in template_parts.items():
+            out = output_parts.get(name)
+            if out is None:
+                problems.append(f"missing part {name}")
+            elif name not in replaced and (out.CRC, out.file_size) != (info.CRC, info.file_size):
+                problems.append(f"{'key part' if KEY_PARTS_RE.match(name) else 'part'} {name} changed")
+        if template.sheet_path not in output_parts:
+            return problems
+
+        # Only the filled rows are checked cell by cell
+        columns = last_row = None
+        if expected is not None:
+            columns = set(expected.columns)
+            last_row = template.start_row + expected.rows - 1
+        with zout.open(template.sheet_path) as sheet_file:
+            tally, head, tail, next_row = scan_sheet(sheet_file, template.start_row, last_row, columns)
+
+    if template.layout is not None:
+        template_head, _, template_tail = template.layout
+        if head != template_head:
+            problems.append("sheet header XML differs from the template")
+        if tail != template_tail:
+            problems.append("sheet XML after the rows (hyperlinks, drawings, controls) differs from the template")
+    if expected is not None:
+        problems.extend(expected.compare(tally))
+        # Rows written past the data would change the template row that follows it
+        if next_row is not None and template.layout is not None:
+            template_row = dict(template.layout[1]).get(next_row[0])
+            if template_row is not None and next_row[1] != template_row:
+                problems.append(f"row {next_row[0]} after the data differs from the template")
+    return problems
+
+if __name__ == '__main__':
+    template = template_registry.get()
+    failed = False
+    for path in sys.argv[1:]:
+        problems = verify_workbook(path, template, replaced={'xl/styles.xml', excel_utils.SHARED_STRINGS_PATH})
+        with zipfile.ZipFile(path) as zout, zout.open(template.sheet_path) as sheet_file:
+            tally = scan_sheet(sheet_file, template.start_row)[0]
+        print(f"{path}: {'OK' if not problems else 'FAILED'}, {tally.rows} rows from row {template.start_row}")
+        for col_idx, (texts, numbers, total) in sorted(tally.columns.items()):
+            print(f"  {excel_utils.get_col_letter(col_idx)}: {texts} texts, {numbers} numbers, total {total:g}")
+        for problem in problems:
+            print(f"  {problem}")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)